@@ -0,0 +1,135 @@
+"""
+准入控制 - 限制每个接口同时调用大模型的请求数，超出部分排队，排不上或等太久则拒绝
+
+大模型延迟突增时，请求会在 Flask 进程中无限堆积直至实例崩溃。每个接口一个 AdmissionController：
+    max_concurrent   同时进行的调用数
+    max_queue        排队上限，队列已满时立即拒绝
+    max_wait_s       最长排队时间；按近期平均服务时间预估的等待超过该值时入队前就拒绝，
+                     已在队列中等待超时的请求同样拒绝
+    优先级            数值越小越先获得名额（交互请求优先于后台预取 / 重新生成）
+被拒绝的请求由调用方降级处理（/api/ask 退回本地抽取式答案），而不是等到超时。
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# 平均服务时间的指数滑动平均系数
+_EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """请求未获准入（队列已满或排队超时）"""
+
+    def __init__(self, endpoint, reason):
+        super().__init__(f'{endpoint} 过载（{reason}）')
+        self.endpoint = endpoint
+        self.reason = reason  # 'queue_full' | 'queue_timeout'
+
+
+class AdmissionController:
+    """有界队列 + 并发上限 + 按排队时间拒绝"""
+
+    def __init__(self, endpoint, max_concurrent, max_queue, max_wait_s):
+        self.endpoint = endpoint
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self._cond = threading.Condition()
+        self._waiters = []  # 堆：(优先级, 入队序号)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._service_s = None  # 平均服务时间（秒）
+        self._stats = {'admitted': 0, 'shed_queue_full': 0, 'shed_queue_timeout': 0,
+                       'degraded': 0, 'queue_wait_ms_total': 0.0, 'max_queue_depth': 0}
+
+    def _estimated_wait_s(self, ahead):
+        """前面还有 ahead 个请求排队时的预计等待时间"""
+        if self._service_s is None or self._in_flight < self.max_concurrent:
+            return 0.0
+        return (ahead + 1) * self._service_s / self.max_concurrent
+
+    def _shed(self, reason):
+        self._stats['shed_' + reason] += 1
+        raise Overloaded(self.endpoint, reason)
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, max_wait_s=None):
+        """获取一个调用名额，失败时抛出 Overloaded；成功后必须调用 release()"""
+        max_wait_s = self.max_wait_s if max_wait_s is None else max_wait_s
+        with self._cond:
+            if not self._waiters and self._in_flight < self.max_concurrent:
+                self._admit(0.0)
+                return
+            if len(self._waiters) >= self.max_queue:
+                self._shed('queue_full')
+            if self._estimated_wait_s(len(self._waiters)) > max_wait_s:
+                self._shed('queue_timeout')
+
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], len(self._waiters))
+            enqueued = time.monotonic()
+            deadline = enqueued + max_wait_s
+            while not (self._waiters[0] == ticket and self._in_flight < self.max_concurrent):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                    self._shed('queue_timeout')
+                self._cond.wait(remaining)
+            heapq.heappop(self._waiters)
+            self._admit(time.monotonic() - enqueued)
+            # 可能还有空闲名额，唤醒下一个排队者
+            self._cond.notify_all()
+
+    def _admit(self, waited_s):
+        self._in_flight += 1
+        self._stats['admitted'] += 1
+        self._stats['queue_wait_ms_total'] += waited_s * 1000
+
+    def release(self, service_s=None):
+        with self._cond:
+            self._in_flight -= 1
+            if service_s is not None:
+                if self._service_s is None:
+                    self._service_s = service_s
+                else:
+                    self._service_s += _EWMA_ALPHA * (service_s - self._service_s)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE, max_wait_s=None):
+        """with controller.slot(): ...  获取名额并在结束时释放，同时记录服务时间"""
+        self.acquire(priority, max_wait_s)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def record_degraded(self):
+        with self._cond:
+            self._stats['degraded'] += 1
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self._stats)
+            admitted = stats.pop('admitted')
+            wait_total = stats.pop('queue_wait_ms_total')
+            return dict(
+                stats,
+                admitted=admitted,
+                shed=stats['shed_queue_full'] + stats['shed_queue_timeout'],
+                in_flight=self._in_flight,
+                queue_depth=len(self._waiters),
+                max_concurrent=self.max_concurrent,
+                max_queue=self.max_queue,
+                avg_queue_wait_ms=round(wait_total / admitted, 1) if admitted else 0.0,
+                avg_service_ms=round(self._service_s * 1000, 1) if self._service_s is not None else None,
+            )
@@ -0,0 +1,187 @@
+"""
+答案失效与后台重新生成 - 知识库更新后只让用到变更段落的缓存答案失效，并在用户再次提问前重新生成热门答案
+
+清空全部答案缓存会丢掉其余国家仍然有效的答案，并让大模型调用集中涌入。依赖记录保存在共享缓存中（所有实例可见）：
+    answer       答案条目：answer / usage / chunk_ids / fingerprints（段落内容指纹）/ kb_version /
+                 question / retrieval_mode（写入后不再改写）
+    answer_hits  答案键 -> 被缓存命中的次数（热度；独立的计数器，由后端原子递增，读取答案时不改写条目）
+    answer_deps  段落 ID -> [[答案键, 问题, 检索模式], ...]（反向索引）
+    kb           上一次同步时的知识库版本标签与各段落的内容指纹
+服务启动时（知识库已重建）逐段落比较内容指纹（与版本标签无关，KB_VERSION 固定时同样比较）：
+内容变化或被删除的段落，其反向索引中的答案被删除，
+热度达到 REGENERATE_MIN_HITS 的答案交给 Regenerator 在后台按热度从高到低重新生成（限速、后台优先级）。
+读取答案时同样核对段落指纹，反向索引因并发写入丢失记录时也不会返回过期的答案。
+"""
+
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+
+from shared_cache import make_key
+
+# 每个段落的反向索引最多记录的答案数（超出时丢弃最早的记录，读取时的指纹核对仍然有效）
+MAX_DEPENDENTS = 500
+
+
+def fingerprint(text):
+    """段落内容指纹"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def chunk_fingerprints(collection):
+    """知识库中全部段落的 段落 ID -> 内容指纹"""
+    docs = collection.get(include=['documents'])
+    return {chunk_id: fingerprint(text or '') for chunk_id, text in zip(docs['ids'], docs['documents'])}
+
+
+def version_of(fingerprints):
+    """由段落 ID 与内容指纹计算知识库版本（内容变化而 ID 不变时版本同样变化）"""
+    digest = hashlib.sha256()
+    for chunk_id in sorted(fingerprints):
+        digest.update(f'{chunk_id}\t{fingerprints[chunk_id]}\n'.encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+def changed_chunks(previous, current):
+    """内容变化或已被删除的段落 ID（新增的段落不影响已有答案）"""
+    return {chunk_id for chunk_id, digest in previous.items() if current.get(chunk_id) != digest}
+
+
+class AnswerDependencies:
+    """答案缓存及其依赖记录（caches 为 shared_cache.SharedCache）"""
+
+    def __init__(self, caches):
+        self.answers = caches.namespace('answer')
+        self.hits = caches.namespace('answer_hits')
+        self.dependents = caches.namespace('answer_deps')
+        self.snapshots = caches.namespace('kb')
+        self._stats = {'invalidated': 0, 'stale_reads': 0}
+
+    @staticmethod
+    def key(question, provider, retrieval_mode, chunk_ids):
+        return make_key(question, provider, retrieval_mode, list(chunk_ids))
+
+    def lookup(self, key, contexts):
+        """返回缓存的答案；段落内容已变化时删除该条目并返回 None。命中时热度计数器加一（不改写答案条目）"""
+        entry = self.answers.get_key(key)
+        if entry is None:
+            return None
+        if entry.get('fingerprints') != [fingerprint(ctx['text']) for ctx in contexts]:
+            self._stats['stale_reads'] += 1
+            self.answers.delete_keys([key])
+            return None
+        self.hits.incr_key(key)
+        return entry
+
+    def record(self, key, question, retrieval_mode, contexts, kb_version, answer, usage):
+        """写入答案条目，并登记到所用段落的反向索引"""
+        chunk_ids = [ctx.get('id', '') for ctx in contexts]
+        self.answers.set_key(key, {
+            'answer': answer,
+            'usage': usage,
+            'chunk_ids': chunk_ids,
+            'fingerprints': [fingerprint(ctx['text']) for ctx in contexts],
+            'kb_version': kb_version,
+            'question': question,
+            'retrieval_mode': retrieval_mode,
+        })
+        for chunk_id in set(chunk_ids):
+            dependents = [d for d in self.dependents.get(chunk_id) or [] if d[0] != key]
+            dependents.append([key, question, retrieval_mode])
+            self.dependents.set(dependents[-MAX_DEPENDENTS:], chunk_id)
+
+    def invalidate(self, chunk_ids):
+        """删除用到这些段落的答案，返回 [(热度, 问题, 检索模式)]"""
+        invalidated = {}
+        for chunk_id in chunk_ids:
+            for key, question, retrieval_mode in self.dependents.get(chunk_id) or []:
+                if key in invalidated:
+                    continue
+                invalidated[key] = (self.hits.get_key(key) or 0, question, retrieval_mode)
+            self.dependents.delete_keys([make_key(chunk_id)])
+        if invalidated:
+            self.answers.delete_keys(invalidated)
+        self._stats['invalidated'] += len(invalidated)
+        return list(invalidated.values())
+
+    def sync(self, kb_version, fingerprints):
+        """与上一次的知识库快照逐段落比较指纹，使受影响的答案失效；返回 (变更的段落数, 失效的答案)
+
+        kb_version 只是写入快照的标签：是否有变更只由内容指纹决定
+        """
+        previous = self.snapshots.get('fingerprints')
+        changed = changed_chunks(previous['chunks'], fingerprints) if previous else set()
+        invalidated = self.invalidate(changed)
+        if previous is None or previous['chunks'] != fingerprints or previous.get('version') != kb_version:
+            self.snapshots.set({'version': kb_version, 'chunks': fingerprints}, 'fingerprints')
+        return len(changed), invalidated
+
+    def snapshot(self):
+        return dict(self._stats)
+
+
+class Regenerator:
+    """后台按热度重新生成答案：fn(question, retrieval_mode) 返回是否生成了新答案
+
+    每分钟最多开始 rate_per_min 个，最多保留 max_pending 个待生成（热度最低的先被丢弃）；
+    同一（问题, 检索模式）只排队一次
+    """
+
+    def __init__(self, fn, rate_per_min, max_pending, min_hits=1, name='regenerate'):
+        self._fn = fn
+        self.interval_s = 60.0 / rate_per_min if rate_per_min > 0 else None
+        self.max_pending = max_pending
+        self.min_hits = min_hits
+        self.name = name
+        self._heap = []  # (-热度, 序号, 问题, 检索模式)
+        self._queued = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {'queued': 0, 'dropped': 0, 'regenerated': 0, 'skipped': 0, 'failed': 0}
+
+    def submit(self, invalidated):
+        """invalidated 为 [(热度, 问题, 检索模式)]；热度低于 min_hits 的不重新生成"""
+        if self.interval_s is None:
+            return
+        with self._cond:
+            for hits, question, retrieval_mode in invalidated:
+                if hits < self.min_hits or (question, retrieval_mode) in self._queued:
+                    continue
+                self._queued.add((question, retrieval_mode))
+                heapq.heappush(self._heap, (-hits, next(self._seq), question, retrieval_mode))
+                self._stats['queued'] += 1
+            if len(self._heap) > self.max_pending:
+                kept = heapq.nsmallest(self.max_pending, self._heap)
+                for _, _, question, retrieval_mode in set(self._heap) - set(kept):
+                    self._queued.discard((question, retrieval_mode))
+                    self._stats['dropped'] += 1
+                self._heap = kept
+                heapq.heapify(self._heap)
+            if self._heap and self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, question, retrieval_mode = heapq.heappop(self._heap)
+                self._queued.discard((question, retrieval_mode))
+            started = time.monotonic()
+            try:
+                outcome = 'regenerated' if self._fn(question, retrieval_mode) else 'skipped'
+            except Exception as e:
+                print(f"  重新生成答案失败（{question}）: {str(e)}")
+                outcome = 'failed'
+            with self._cond:
+                self._stats[outcome] += 1
+            time.sleep(max(0.0, self.interval_s - (time.monotonic() - started)))
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self._stats, pending=len(self._heap))
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+检索基准测试 - 统计各状态（found / irrelevant / fictional ...）的检索耗时
+
+用法：
+    python benchmark.py              # 每个问题跑 5 轮
+    python benchmark.py --rounds 20
+    python benchmark.py --mode both  # A/B 对比 lexical 与 hybrid 检索模式
+    python benchmark.py --answers    # 对比上下文压缩前后的输入/输出 token 与生成耗时
+    python benchmark.py --payload    # 对比 /api/ask 响应体大小（full / compact × 不压缩 / gzip / br）
+    python benchmark.py --embedding  # 本地 ONNX 向量推理：批大小 × 线程数的吞吐与延迟，以及并发查询合批
+    python benchmark.py --embedding --quantized  # 同时测试 int8 量化模型（不存在时先生成）
+    python benchmark.py --retrieval-cache  # 保留检索结果缓存：首轮之后签名相同的问题直接命中
+"""
+
+import argparse
+import os
+import statistics
+import threading
+import time
+
+import qa_service_redesign as qa
+
+# 基准问题集：覆盖每一种检索状态
+BENCHMARK_QUESTIONS = [
+    # found
+    '巴西的年假是多少天？',
+    '德国的试用期有多长？',
+    '美国的法定假日有多少天？',
+    '新加坡的病假规定是什么？',
+    '法国的年假是多少天？',
+    '澳大利亚的合同期限规定？',
+    '印度的最低工资标准？',
+    '日本的加班政策',
+    '英国的产假有多久？',
+    '墨西哥的年终奖怎么发？',
+    # found（多国对比）
+    '英国和德国的年假有什么区别？',
+    '日本、韩国和新加坡的试用期对比',
+    # irrelevant
+    '英国的天气怎么样？',
+    '日本有哪些好吃的？',
+    # fictional
+    '火星的年假是多少天？',
+    '测试一下',
+    # no_country
+    '冰岛的最低工资是多少？',
+    '智利的试用期有多长？',
+    # no country mentioned
+    '哪些国家有十三薪？',
+    '远程工作需要注意什么？',
+]
+
+
+def percentile(values, pct):
+    """计算百分位数（最近秩）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_retrieval_benchmark(questions, rounds, mode='lexical'):
+    """逐题执行检索，返回 {status: [耗时ms, ...]} 与 {stage: [耗时ms, ...]}"""
+    by_status = {}
+    by_stage = {}
+    for _ in range(rounds):
+        for question in questions:
+            result = qa.query_knowledge_base_with_status(question, top_k=3, retrieval_mode=mode)
+            timings = result['timings']
+            by_status.setdefault(result['status'], []).append(timings['total'])
+            for stage, ms in timings.items():
+                if stage != 'total':
+                    by_stage.setdefault(stage, []).append(ms)
+    return by_status, by_stage
+
+
+def run_answer_benchmark(questions, mode='lexical'):
+    """对检索到内容的问题分别以"不压缩 / 压缩"生成答案，返回 {变体: {指标: [值, ...]}}
+
+    未配置任何大模型密钥时只统计估算的上下文 token 数（不产生调用费用）
+    """
+    has_llm = any(os.environ.get(k) for k in ('DEEPSEEK_API_KEY', 'OPENAI_API_KEY', 'ANTHROPIC_API_KEY'))
+    samples = {'raw': {}, 'packed': {}}
+    for question in questions:
+        result = qa.query_knowledge_base_with_status(question, top_k=3, retrieval_mode=mode)
+        contexts = result['contexts']
+        if not contexts:
+            continue
+        countries = result.get('countries')
+        for variant, pack in (('raw', False), ('packed', True)):
+            metrics = samples[variant]
+            if pack:
+                packed, stats = qa.pack_answer_contexts(question, contexts, countries)
+                context_tokens = stats['context_tokens_after']
+            else:
+                context_tokens = sum(qa.context_packing.estimate_tokens(c['text']) for c in contexts)
+            metrics.setdefault('context_tokens(估算)', []).append(context_tokens)
+            if not has_llm:
+                continue
+            started = time.perf_counter()
+            usage = qa.generate_answer_with_usage(question, contexts, countries, pack=pack)['usage'] or {}
+            metrics.setdefault('latency_ms', []).append((time.perf_counter() - started) * 1000)
+            metrics.setdefault('prompt_tokens', []).append(usage.get('prompt_tokens', 0))
+            metrics.setdefault('completion_tokens', []).append(usage.get('completion_tokens', 0))
+    return samples
+
+
+# 估算传输耗时所用的带宽（bit/s）：移动网络弱信号约 1.6 Mbps
+PAYLOAD_BANDWIDTH_BPS = 1.6e6
+
+
+def run_payload_benchmark(questions, mode='lexical'):
+    """通过 Flask 测试客户端请求 GET /api/ask，返回 {变体: [响应字节数, ...]}
+
+    未配置大模型密钥时答案为抽取式，与线上答案长度不同，但 sources 的差异不受影响
+    """
+    variants = [(sources, encoding) for sources in qa.SOURCE_MODES
+                for encoding in ('identity',) + qa.http_utils.dynamic_encodings()]
+    samples = {}
+    with qa.app.test_client() as client:
+        for question in questions:
+            for sources, encoding in variants:
+                response = client.get('/api/ask', query_string={
+                    'q': question, 'retrieval_mode': mode, 'sources': sources
+                }, headers={'Accept-Encoding': encoding})
+                samples.setdefault(f'{sources}/{encoding}', []).append(len(response.get_data()))
+    return samples
+
+
+def print_payload_table(samples):
+    print("\n/api/ask 响应体大小（均值）")
+    baseline = statistics.mean(samples['full/identity'])
+    print(f"  {'变体':<18}{'字节':>10}{'相对full':>12}{'传输(ms)':>12}")
+    for name, sizes in samples.items():
+        size = statistics.mean(sizes)
+        transfer_ms = size * 8 / PAYLOAD_BANDWIDTH_BPS * 1000
+        print(f"  {name:<18}{size:>10.0f}{size / baseline * 100:>11.1f}%{transfer_ms:>12.1f}")
+
+
+# 向量推理基准：批大小与 (intra-op, inter-op) 线程设置
+EMBEDDING_BATCH_SIZES = (1, 8, 32)
+EMBEDDING_THREAD_SETTINGS = ((1, 1), (2, 1), (4, 1))
+EMBEDDING_CLIENTS = 8
+
+
+def run_embedding_benchmark(texts, rounds, quantized_options=(False,)):
+    """按模型变体 × 线程设置 × 批大小测量吞吐（条/秒）与单批延迟，返回表格行"""
+    import embeddings
+    import onnx_embedder
+
+    model_dir = embeddings.onnx_model_dir()
+    rows = []
+    for quantized in quantized_options:
+        for intra, inter in EMBEDDING_THREAD_SETTINGS:
+            embedder = onnx_embedder.OnnxEmbedder(model_dir, intra, inter, quantized=quantized,
+                                                  max_batch=max(EMBEDDING_BATCH_SIZES), batch_window_ms=None)
+            embedder.embed(texts[:1])  # 预热：创建会话
+            for batch_size in EMBEDDING_BATCH_SIZES:
+                latencies = []
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    for i in range(0, len(texts), batch_size):
+                        batch_started = time.perf_counter()
+                        embedder.embed(texts[i:i + batch_size])
+                        latencies.append((time.perf_counter() - batch_started) * 1000)
+                elapsed = time.perf_counter() - started
+                rows.append({
+                    'model': 'int8' if quantized else 'fp32',
+                    'threads': f'{intra}/{inter}',
+                    'batch': batch_size,
+                    'texts_per_s': len(texts) * rounds / elapsed,
+                    'p50_ms': statistics.median(latencies),
+                    'p95_ms': percentile(latencies, 95),
+                })
+    return rows
+
+
+def run_concurrent_embedding_benchmark(texts, rounds, clients=EMBEDDING_CLIENTS, windows_ms=(None, 0.0, 2.0)):
+    """clients 个线程同时逐条提交查询，对比不合批与不同合批窗口，返回 {窗口: (条/秒, p50, p95, 平均批大小)}"""
+    import embeddings
+    import onnx_embedder
+
+    model_dir = embeddings.onnx_model_dir()
+    results = {}
+    for window_ms in windows_ms:
+        embedder = onnx_embedder.OnnxEmbedder(model_dir, batch_window_ms=window_ms)
+        embedder.embed(texts[:1])
+        latencies = []
+        lock = threading.Lock()
+
+        def client(offset):
+            for i in range(rounds * len(texts) // clients):
+                started = time.perf_counter()
+                embedder([texts[(offset + i) % len(texts)]])
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        batching = embedder.snapshot().get('batching', {})
+        name = '不合批' if window_ms is None else f'合批 {window_ms:g}ms'
+        results[name] = (len(latencies) / elapsed, statistics.median(latencies), percentile(latencies, 95),
+                         batching.get('avg_batch', 1.0))
+    return results
+
+
+def print_embedding_tables(rows, concurrent):
+    print("\nONNX 向量推理（单进程，逐批）")
+    print(f"  {'模型':<6}{'线程':>8}{'批大小':>8}{'条/秒':>10}{'p50(ms)':>12}{'p95(ms)':>12}")
+    for row in rows:
+        print(f"  {row['model']:<6}{row['threads']:>8}{row['batch']:>8}{row['texts_per_s']:>10.1f}"
+              f"{row['p50_ms']:>12.2f}{row['p95_ms']:>12.2f}")
+    print(f"\n{EMBEDDING_CLIENTS} 个并发客户端逐条查询")
+    print(f"  {'方式':<12}{'条/秒':>10}{'p50(ms)':>12}{'p95(ms)':>12}{'平均批大小':>12}")
+    for name, (throughput, p50, p95, avg_batch) in concurrent.items():
+        print(f"  {name:<12}{throughput:>10.1f}{p50:>12.2f}{p95:>12.2f}{avg_batch:>12.2f}")
+
+
+def print_answer_table(samples):
+    print("\n上下文压缩前后对比（均值）")
+    raw, packed = samples['raw'], samples['packed']
+    for metric in raw:
+        before = statistics.mean(raw[metric])
+        after = statistics.mean(packed[metric])
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"  {metric:<22}{before:>12.1f} → {after:>10.1f}  ({change:+.1f}%)")
+
+
+def print_table(title, samples):
+    print(f"\n{title}")
+    print(f"  {'名称':<14}{'次数':>6}{'p50(ms)':>12}{'p95(ms)':>12}{'max(ms)':>12}")
+    for name, values in sorted(samples.items()):
+        print(f"  {name:<14}{len(values):>6}{statistics.median(values):>12.3f}"
+              f"{percentile(values, 95):>12.3f}{max(values):>12.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检索基准测试')
+    parser.add_argument('--rounds', type=int, default=5, help='每个问题执行的轮数')
+    parser.add_argument('--mode', choices=qa.RETRIEVAL_MODES + ('both',), default='lexical',
+                        help='检索模式，both 表示依次对比两种模式')
+    parser.add_argument('--answers', action='store_true',
+                        help='对比上下文压缩前后的 token 数与生成耗时（配置密钥时会真实调用大模型）')
+    parser.add_argument('--payload', action='store_true',
+                        help='对比 /api/ask 不同 sources 形式与压缩编码下的响应体大小')
+    parser.add_argument('--embedding', action='store_true',
+                        help='本地 ONNX 向量推理的吞吐与延迟（不需要加载知识库）')
+    parser.add_argument('--quantized', action='store_true', help='--embedding 时同时测试 int8 量化模型')
+    parser.add_argument('--retrieval-cache', action='store_true',
+                        help='保留检索结果缓存（默认关闭，每轮都测量完整的检索流程）')
+    args = parser.parse_args()
+
+    if args.embedding:
+        # 问题集重复到 64 条，覆盖最大的批
+        texts = (BENCHMARK_QUESTIONS * 4)[:64]
+        quantized_options = (False, True) if args.quantized else (False,)
+        if args.quantized:
+            import embeddings
+            import onnx_embedder
+            model_dir = embeddings.onnx_model_dir()
+            if not os.path.exists(os.path.join(model_dir, onnx_embedder.QUANTIZED_MODEL)):
+                print(f"生成 int8 量化模型: {onnx_embedder.quantize_model(model_dir)}")
+        print_embedding_tables(run_embedding_benchmark(texts, args.rounds, quantized_options),
+                               run_concurrent_embedding_benchmark(texts, args.rounds))
+        return
+
+    qa.init_services()
+    if not args.retrieval_cache:
+        qa.retriever.cache = None
+    if args.payload:
+        mode = 'lexical' if args.mode == 'both' else args.mode
+        print_payload_table(run_payload_benchmark(BENCHMARK_QUESTIONS, mode))
+        return
+    if args.answers:
+        mode = 'lexical' if args.mode == 'both' else args.mode
+        print_answer_table(run_answer_benchmark(BENCHMARK_QUESTIONS, mode))
+        return
+
+    modes = qa.RETRIEVAL_MODES if args.mode == 'both' else (args.mode,)
+    for mode in modes:
+        # 预热：加载 jieba 词典、embedding 模型与全量快照，避免首轮耗时干扰统计
+        for question in BENCHMARK_QUESTIONS[:1] + BENCHMARK_QUESTIONS[-2:]:
+            qa.query_knowledge_base_with_status(question, retrieval_mode=mode)
+
+        by_status, by_stage = run_retrieval_benchmark(BENCHMARK_QUESTIONS, args.rounds, mode)
+        print_table(f'[{mode}] 按状态统计检索耗时', by_status)
+        print_table(f'[{mode}] 按阶段统计检索耗时', by_stage)
+
+
+if __name__ == '__main__':
+    main()
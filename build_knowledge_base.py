@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+构建知识库 - 把爬取的国家用工指南文章（正文 + 图片 OCR）写入 Chroma 集合
+
+流水线由生成器串联，各阶段边读边处理，不在内存中保存全量语料：
+    load     读取文章文件（--source 目录下的 {文章编号}_{标题}.json）
+    clean    清理正文与 OCR 文本并分块（分块策略见 CHUNKERS）、估算 token 数（CPU 密集，进程池并行）
+    dedupe   去掉完全重复与近重复的段落（OCR 与正文、文章之间的重复；近重复见 near_duplicates.py）
+    embed    大批量向量化，最多 --embed-concurrency 批同时进行
+    write    批量 collection.add 写入
+结束时输出各阶段的处理量、耗时与吞吐，并写入向量模型清单（见 embeddings.py）。
+
+文章文件格式（爬虫输出）：
+    {"title": "国家指南｜德国出海用工指南", "url": "https://...", "content": "正文", "ocr": ["图片1文字", ...]}
+段落 ID 为 {文章编号}_{标题}_{文章内序号}，元数据为 country / title / url / type（article | ocr）。
+只修改一篇文章时其他文章的段落 ID 不变，未受影响的缓存答案在重建后仍然有效（见 answer_invalidation.py）。
+
+用法：
+    python build_knowledge_base.py --source articles
+    python build_knowledge_base.py --source articles --workers 4 --embed-batch 256 --embed-concurrency 2
+    python build_knowledge_base.py --source articles --chunking heading --chunk-chars 800
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool
+
+import context_packing
+import embeddings
+import near_duplicates
+
+CHUNK_CHARS = 500  # 每个段落的目标长度（字符）
+CHUNK_OVERLAP_SENTENCES = 1  # 相邻段落重叠的句子数
+FIXED_OVERLAP_RATIO = 0.2  # fixed 策略相邻段落重叠的比例
+MIN_CHUNK_CHARS = 20  # 更短的段落（页眉、图注等）丢弃
+OPENAI_EMBEDDING_LIMITS = (3000, 1000000)  # text-embedding-3-small 的 (RPM, TPM)
+
+STAGES = ('load', 'clean', 'dedupe', 'embed', 'write')
+# 各阶段在同一线程中从哪个阶段取数据；load 由进程池的喂料线程读取，不计入 clean
+UPSTREAM = {'load': None, 'clean': None, 'dedupe': 'clean', 'embed': 'dedupe', 'write': 'embed'}
+
+_DEDUPE_STRIP = re.compile(r'[\W_]+')
+# 分块单位：以句末标点或换行结尾的一句（保留结尾的换行，OCR 表格的行结构不丢失）
+_SENTENCE = re.compile(r'[^\n。；！？!?;]*(?:[。；！？!?;]+\n?|\n)|[^\n。；！？!?;]+$')
+# 指南的小节标题：「一、」「1.」「1.2」「【...】」「第一章」「# ...」开头的短行
+_HEADING = re.compile(r'^\s*(?:[一二三四五六七八九十]+[、.．]|\d+(?:\.\d+)*[、.．]?\s|【[^】]+】|第[一二三四五六七八九十\d]+[章节部分]|#+\s)'
+                      r'[^\n]{0,40}$', re.MULTILINE)
+
+
+def load_articles(source_dir, countries):
+    """按文件名顺序读取文章，文章编号取自文件名前缀，国家取自标题"""
+    for path in sorted(glob.glob(os.path.join(source_dir, '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            article = json.load(f)
+        name = os.path.splitext(os.path.basename(path))[0]
+        article['article_no'] = name.split('_', 1)[0]
+        article.setdefault('title', name.split('_', 1)[-1])
+        # countries 按长度降序，较长的国家名优先匹配
+        article['country'] = article.get('country') or next(
+            (c for c in countries if c in article['title']), 'Unknown')
+        yield article
+
+
+def chunk_text(text, chunk_chars=CHUNK_CHARS):
+    """按句子累积到 chunk_chars 分块，相邻块重叠 CHUNK_OVERLAP_SENTENCES 句"""
+    chunks = []
+    current = []
+    length = 0
+    for sentence in _SENTENCE.findall(text):
+        if not sentence.strip():
+            continue
+        if current and length + len(sentence) > chunk_chars:
+            chunks.append(''.join(current).strip())
+            current = current[-CHUNK_OVERLAP_SENTENCES:] if CHUNK_OVERLAP_SENTENCES else []
+            length = sum(len(s) for s in current)
+        current.append(sentence)
+        length += len(sentence)
+    if current:
+        chunks.append(''.join(current).strip())
+    return [c for c in chunks if len(c) >= MIN_CHUNK_CHARS]
+
+
+def chunk_fixed(text, chunk_chars=CHUNK_CHARS):
+    """固定长度滑动窗口分块（不看句子边界），相邻块重叠 FIXED_OVERLAP_RATIO"""
+    step = max(1, int(chunk_chars * (1 - FIXED_OVERLAP_RATIO)))
+    chunks = []
+    for start in range(0, len(text), step):
+        chunks.append(text[start:start + chunk_chars].strip())
+        if start + chunk_chars >= len(text):
+            break
+    return [c for c in chunks if len(c) >= MIN_CHUNK_CHARS]
+
+
+def chunk_by_heading(text, chunk_chars=CHUNK_CHARS):
+    """按小节标题切分，每节内再按句子分块；小节的段落都以标题开头，检索时保留所属小节的上下文"""
+    starts = [m.start() for m in _HEADING.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    chunks = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        section = text[start:end].strip()
+        heading, _, body = section.partition('\n')
+        if not _HEADING.match(heading) or not body.strip():
+            chunks.extend(chunk_text(section, chunk_chars))
+            continue
+        heading = heading.strip()
+        for chunk in chunk_text(body, max(chunk_chars - len(heading) - 1, MIN_CHUNK_CHARS)):
+            chunks.append(f'{heading}\n{chunk}')
+    return chunks
+
+
+# 分块策略：名称 -> chunker(text, chunk_chars) -> [段落文本]
+CHUNKERS = {
+    'sentence': chunk_text,
+    'fixed': chunk_fixed,
+    'heading': chunk_by_heading,
+}
+DEFAULT_CHUNKING = 'sentence'
+
+
+def process_article(article, chunking=DEFAULT_CHUNKING, chunk_chars=CHUNK_CHARS):
+    """进程池中执行：清理、分块并估算 token 数，返回 (文章, [(类型, 文本, token数)])"""
+    chunker = CHUNKERS[chunking]
+    chunks = []
+    content = context_packing.clean_ocr_text(article.get('content') or '')
+    for text in chunker(content, chunk_chars):
+        chunks.append(('article', text, context_packing.estimate_tokens(text)))
+    for ocr in article.get('ocr') or []:
+        for text in chunker(context_packing.clean_ocr_text(ocr), chunk_chars):
+            chunks.append(('ocr', text, context_packing.estimate_tokens(text)))
+    article = {k: article[k] for k in ('article_no', 'title', 'url', 'country') if k in article}
+    return article, chunks
+
+
+def to_chunks(processed):
+    """展开为段落记录（尚未分配 ID）"""
+    for article, chunks in processed:
+        for chunk_type, text, tokens in chunks:
+            yield {
+                'text': text,
+                'tokens': tokens,
+                'article_no': article['article_no'],
+                'metadata': {
+                    'country': article['country'],
+                    'title': article['title'],
+                    'url': article.get('url', ''),
+                    'type': chunk_type,
+                },
+            }
+
+
+def dedupe(chunks, stats, near_dup_threshold=near_duplicates.DEFAULT_THRESHOLD):
+    """去掉规范化后完全相同的段落与近重复段落，并按保留顺序分配文章内序号与 ID
+
+    每篇文章的正文段落先于 OCR 段落产出，近重复时保留的是先出现的正文段落；near_dup_threshold 为 0 时只去完全重复
+    """
+    seen = set()
+    near_index = near_duplicates.NearDuplicateIndex(near_dup_threshold) if near_dup_threshold else None
+    ordinals = {}  # 文章编号 -> 下一个序号
+    for chunk in chunks:
+        digest = hashlib.sha1(_DEDUPE_STRIP.sub('', chunk['text']).encode('utf-8')).digest()
+        if digest in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(digest)
+        if near_index is not None and near_index.add(digest, chunk['text']) is not None:
+            stats['near_duplicates'] += 1
+            continue
+        ordinal = ordinals.get(chunk['article_no'], 0)
+        ordinals[chunk['article_no']] = ordinal + 1
+        chunk['id'] = f"{chunk['article_no']}_{chunk['metadata']['title']}_{ordinal}"
+        yield chunk
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_batches(batches, embed_fn, concurrency):
+    """最多 concurrency 批同时向量化，按输入顺序产出 (批, 向量)"""
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='embed') as executor:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append((batch, executor.submit(embed_fn, [c['text'] for c in batch])))
+            if len(in_flight) >= concurrency:
+                batch, future = in_flight.popleft()
+                yield batch, future.result()
+        while in_flight:
+            batch, future = in_flight.popleft()
+            yield batch, future.result()
+
+
+def make_embed_fn(model, onnx_threads):
+    """返回 embed_fn(texts) -> [向量]；本地模型直接推理，OpenAI 经 llm_scheduler 按 RPM / TPM 排队"""
+    spec = embeddings.MODELS[model]
+    if spec['provider'] == 'onnx':
+        import onnx_embedder
+        if not embeddings.onnx_model_available():
+            embeddings.fetch_onnx_model()
+        embedder = onnx_embedder.OnnxEmbedder(embeddings.onnx_model_dir(), intra_op_threads=onnx_threads,
+                                              max_batch=64, batch_window_ms=None)
+        return lambda texts: embedder.embed(texts).tolist()
+
+    import llm_scheduler
+    from openai import OpenAI
+
+    client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+    scheduler = llm_scheduler.LLMScheduler(limits={'openai-embedding': OPENAI_EMBEDDING_LIMITS})
+
+    def embed(texts):
+        est_tokens = sum(context_packing.estimate_tokens(t) for t in texts)
+
+        def call():
+            raw = client.embeddings.with_raw_response.create(model=model, input=texts)
+            response = raw.parse()
+            return [d.embedding for d in response.data], raw.headers, response.usage.prompt_tokens
+
+        return scheduler.call('openai-embedding', call, est_tokens, time.monotonic() + 300)
+
+    return embed
+
+
+def batched_pairs(embedded, size):
+    """把 (批, 向量) 重新按写入批大小拼接"""
+    batch, vectors = [], []
+    for chunks, chunk_vectors in embedded:
+        batch.extend(chunks)
+        vectors.extend(chunk_vectors)
+        while len(batch) >= size:
+            yield batch[:size], vectors[:size]
+            batch, vectors = batch[size:], vectors[size:]
+    if batch:
+        yield batch, vectors
+
+
+class StageMeter:
+    """统计每个阶段产出的数量与耗时
+
+    生成器串联时，下游阶段的 next() 包含了上游的耗时，各阶段自身耗时 = 本阶段累计 - 上游累计（见 UPSTREAM）
+    """
+
+    def __init__(self):
+        self.items = {stage: 0 for stage in STAGES}
+        self.seconds = {stage: 0.0 for stage in STAGES}
+
+    def wrap(self, stage, iterable, count=lambda item: 1):
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.seconds[stage] += time.perf_counter() - started
+                return
+            self.seconds[stage] += time.perf_counter() - started
+            self.items[stage] += count(item)
+            yield item
+
+    def report(self, total_s):
+        print(f"\n{'阶段':<10}{'数量':>10}{'耗时(s)':>12}{'吞吐(/s)':>12}")
+        for stage in STAGES:
+            upstream = UPSTREAM[stage]
+            own = max(self.seconds[stage] - (self.seconds[upstream] if upstream else 0.0), 1e-9)
+            print(f"{stage:<10}{self.items[stage]:>10}{own:>12.2f}{self.items[stage] / own:>12.1f}")
+        print(f"总耗时 {total_s:.1f}s")
+
+
+def build(source_dir, db_path, collection_name, countries, model, workers, embed_batch, embed_concurrency,
+          write_batch, onnx_threads=1, near_dup_threshold=near_duplicates.DEFAULT_THRESHOLD,
+          chunking=DEFAULT_CHUNKING, chunk_chars=CHUNK_CHARS):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=db_path)
+    try:
+        client.delete_collection(collection_name)
+    except ValueError:
+        pass  # 集合不存在
+    collection = client.create_collection(name=collection_name, embedding_function=None)
+    write_batch = min(write_batch, getattr(client, 'max_batch_size', write_batch))
+
+    meter = StageMeter()
+    stats = {'duplicates': 0, 'near_duplicates': 0, 'tokens': 0}
+    embed_fn = make_embed_fn(model, onnx_threads)
+    dimension = None
+    started = time.perf_counter()
+
+    with Pool(workers) as pool:
+        articles = meter.wrap('load', load_articles(source_dir, countries))
+        chunker = partial(process_article, chunking=chunking, chunk_chars=chunk_chars)
+        processed = meter.wrap('clean', pool.imap(chunker, articles, chunksize=2), count=lambda item: len(item[1]))
+        unique = meter.wrap('dedupe', dedupe(to_chunks(processed), stats, near_dup_threshold))
+        embedded = meter.wrap('embed', embed_batches(batched(unique, embed_batch), embed_fn, embed_concurrency),
+                              count=lambda item: len(item[0]))
+        for batch, vectors in meter.wrap('write', batched_pairs(embedded, write_batch),
+                                         count=lambda item: len(item[0])):
+            write_started = time.perf_counter()
+            collection.add(
+                ids=[c['id'] for c in batch],
+                documents=[c['text'] for c in batch],
+                metadatas=[c['metadata'] for c in batch],
+                embeddings=vectors,
+            )
+            # write 阶段的耗时在循环体中，不在 next() 内
+            meter.seconds['write'] += time.perf_counter() - write_started
+            stats['tokens'] += sum(c['tokens'] for c in batch)
+            dimension = dimension or len(vectors[0])
+
+    total_s = time.perf_counter() - started
+    meter.report(total_s)
+    print(f"重复段落 {stats['duplicates']} 个，近重复段落 {stats['near_duplicates']} 个，"
+          f"写入 {meter.items['write']} 个段落（约 {stats['tokens']} tokens）")
+    # 旧的近重复簇文件引用的是重建前的段落 ID
+    stale_clusters = os.path.join(db_path, near_duplicates.CLUSTERS_NAME)
+    if os.path.exists(stale_clusters):
+        os.remove(stale_clusters)
+    manifest = embeddings.write_manifest(db_path, model, dimension, chunks=meter.items['write'])
+    embeddings.validate(manifest, db_path)
+    return manifest
+
+
+def main():
+    import qa_service_redesign as qa
+    import retriever
+
+    parser = argparse.ArgumentParser(description='构建知识库')
+    parser.add_argument('--source', default='articles', help='文章 JSON 目录')
+    parser.add_argument('--db', default=qa.DB_PATH, help='知识库目录（其中的集合会被重建）')
+    parser.add_argument('--model', default=embeddings.DEFAULT_MODEL, choices=sorted(embeddings.MODELS))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='清理 / 分块的进程数')
+    parser.add_argument('--embed-batch', type=int, default=256, help='每批向量化的段落数')
+    parser.add_argument('--embed-concurrency', type=int, default=2, help='同时进行的向量化批数')
+    parser.add_argument('--onnx-threads', type=int, default=1, help='本地模型每批推理的 intra-op 线程数')
+    parser.add_argument('--write-batch', type=int, default=1000, help='每次 collection.add 的段落数')
+    parser.add_argument('--chunking', default=DEFAULT_CHUNKING, choices=sorted(CHUNKERS), help='分块策略')
+    parser.add_argument('--chunk-chars', type=int, default=CHUNK_CHARS, help='每个段落的目标长度（字符）')
+    parser.add_argument('--near-dup-threshold', type=float, default=near_duplicates.DEFAULT_THRESHOLD,
+                        help='近重复段落的 Jaccard 阈值（0 表示只去完全重复）')
+    args = parser.parse_args()
+
+    countries = sorted(retriever.SUPPORTED_COUNTRIES, key=len, reverse=True)
+    manifest = build(args.source, args.db, qa.COLLECTION_NAME, countries, args.model, args.workers,
+                     args.embed_batch, args.embed_concurrency, args.write_batch, args.onnx_threads,
+                     args.near_dup_threshold, args.chunking, args.chunk_chars)
+    print(f"✓ 知识库已构建: {args.db}（{manifest['model']}，{manifest['dimension']} 维，{manifest['chunks']} 段）")
+    print("  提示: 请重新生成事实表（python fact_table.py）")
+
+
+if __name__ == '__main__':
+    main()
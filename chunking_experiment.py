@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+分块策略实验 - 用不同的分块策略 / 段落长度把源文章重建到临时集合，比较检索质量与成本
+
+每种配置（策略 × 段落长度）用 build_knowledge_base.build 写入临时目录下的独立知识库，
+再用 retriever.Retriever 在该集合上执行问题集并统计：
+    recall@k      有标注的问题中，top-k 段落包含至少一句标准答案句的比例
+    上下文 tokens  检索到内容时 top-k 段落的 token 数均值（不压缩时即大模型的上下文输入）
+    段落数 / 索引  写入的段落数与知识库目录大小
+    p50 / p95     检索耗时（毫秒）
+标准答案句从源文章中自动标注：该国文章里包含 fact_table.FACT_TOPICS 证据词且能匹配到数值的句子。
+问题集为 benchmark.BENCHMARK_QUESTIONS 加上每个（国家, 主题）生成的「{国家}的{主题}是多少？」，
+问题中的国家与主题都能对应到标准答案句时计入 recall。
+
+用法：
+    python chunking_experiment.py --source articles
+    python chunking_experiment.py --source articles --strategies sentence,heading --sizes 300,500,800 --k 3
+"""
+
+import argparse
+import os
+import re
+import shutil
+import statistics
+import tempfile
+
+import build_knowledge_base
+import context_packing
+import embeddings
+import fact_table
+import retriever
+
+_NORMALIZE = re.compile(r'[\W_]+')
+
+
+def _normalize(text):
+    return _NORMALIZE.sub('', text)
+
+
+def gold_sentences(source_dir, countries):
+    """从源文章标注标准答案句：{(国家, 主题): {规范化后的句子}}"""
+    gold = {}
+    for article in build_knowledge_base.load_articles(source_dir, countries):
+        texts = [article.get('content') or ''] + list(article.get('ocr') or [])
+        for text in texts:
+            for sentence in context_packing.split_sentences(context_packing.clean_ocr_text(text)):
+                for topic, spec in fact_table.FACT_TOPICS.items():
+                    if any(term in sentence for term in spec['evidence']) and re.search(spec['pattern'], sentence):
+                        gold.setdefault((article['country'], topic), set()).add(_normalize(sentence))
+    return gold
+
+
+def experiment_questions(gold, benchmark_questions, countries):
+    """返回 [(问题, 标准答案句集合或 None)]"""
+    questions = list(benchmark_questions)
+    questions += [f"{country}的{fact_table.FACT_TOPICS[topic]['label']}是多少？" for country, topic in sorted(gold)]
+    labeled = []
+    for question in questions:
+        mentioned = [c for c in countries if c in question]
+        answers = set()
+        for topic in fact_table.detect_topics(question) or [
+                t for t, spec in fact_table.FACT_TOPICS.items() if spec['label'] in question]:
+            for country in mentioned:
+                answers |= gold.get((country, topic), set())
+        labeled.append((question, answers or None))
+    return labeled
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def evaluate(kb_retriever, questions, k, rounds):
+    """执行问题集，返回各项指标"""
+    hits = labeled = 0
+    context_tokens = []
+    latencies = []
+    # 预热：分词词典、向量模型与全量快照
+    kb_retriever.retrieve(questions[0][0], top_k=k)
+    for round_no in range(rounds):
+        for question, answers in questions:
+            result = kb_retriever.retrieve(question, top_k=k)
+            latencies.append(result['timings']['total'])
+            if round_no:
+                continue
+            texts = [_normalize(ctx['text']) for ctx in result['contexts']]
+            if texts:
+                context_tokens.append(sum(context_packing.estimate_tokens(ctx['text']) for ctx in result['contexts']))
+            if answers:
+                labeled += 1
+                hits += any(answer in text for answer in answers for text in texts)
+    return {
+        'recall': hits / labeled if labeled else 0.0,
+        'labeled': labeled,
+        'context_tokens': statistics.mean(context_tokens) if context_tokens else 0.0,
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': sorted(latencies)[max(0, int(len(latencies) * 0.95) - 1)],
+    }
+
+
+def run_config(collection_name, source_dir, scratch_dir, countries, strategy, chunk_chars, args, questions):
+    import chromadb
+
+    db_path = os.path.join(scratch_dir, f'{strategy}-{chunk_chars}')
+    print(f"\n=== {strategy} / {chunk_chars} 字符 → {db_path}")
+    manifest = build_knowledge_base.build(
+        source_dir, db_path, collection_name, countries, args.model, args.workers, args.embed_batch,
+        args.embed_concurrency, args.write_batch, near_dup_threshold=args.near_dup_threshold,
+        chunking=strategy, chunk_chars=chunk_chars)
+
+    client = chromadb.PersistentClient(path=db_path)
+    collection = client.get_collection(name=collection_name,
+                                       embedding_function=embeddings.embedding_function(args.model))
+    kb_retriever = retriever.Retriever(collection, retriever.RetrieverConfig(mode=args.mode, top_k=args.k))
+    try:
+        metrics = evaluate(kb_retriever, questions, args.k, args.rounds)
+    finally:
+        kb_retriever.close()
+    metrics.update(strategy=strategy, chunk_chars=chunk_chars, chunks=manifest['chunks'],
+                   index_mb=directory_bytes(db_path) / 1e6)
+    return metrics
+
+
+def print_table(rows, k):
+    print(f"\n{'策略':<10}{'长度':>6}{'段落数':>8}{'索引MB':>9}{f'recall@{k}':>11}{'上下文tokens':>13}"
+          f"{'p50ms':>9}{'p95ms':>9}")
+    for row in rows:
+        print(f"{row['strategy']:<10}{row['chunk_chars']:>6}{row['chunks']:>8}{row['index_mb']:>9.2f}"
+              f"{row['recall']:>11.2f}{row['context_tokens']:>13.0f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}")
+    if rows:
+        print(f"（recall 基于 {rows[0]['labeled']} 个有标注的问题；上下文 tokens 为不压缩时的大模型输入）")
+
+
+def main():
+    import benchmark
+    import qa_service_redesign as qa
+
+    parser = argparse.ArgumentParser(description='分块策略实验')
+    parser.add_argument('--source', default='articles', help='文章 JSON 目录')
+    parser.add_argument('--strategies', default=','.join(build_knowledge_base.CHUNKERS),
+                        help='逗号分隔的分块策略')
+    parser.add_argument('--sizes', default=str(build_knowledge_base.CHUNK_CHARS), help='逗号分隔的段落长度（字符）')
+    parser.add_argument('--k', type=int, default=3, help='检索段落数（top_k）')
+    parser.add_argument('--rounds', type=int, default=3, help='测量耗时的轮数')
+    parser.add_argument('--mode', choices=retriever.RETRIEVAL_MODES, default=qa.RETRIEVAL_MODE, help='检索模式')
+    parser.add_argument('--model', default=embeddings.DEFAULT_MODEL, choices=sorted(embeddings.MODELS))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--embed-batch', type=int, default=256)
+    parser.add_argument('--embed-concurrency', type=int, default=2)
+    parser.add_argument('--write-batch', type=int, default=1000)
+    parser.add_argument('--near-dup-threshold', type=float, default=0.0,
+                        help='近重复阈值（默认 0：只去完全重复，避免去重掩盖分块差异）')
+    parser.add_argument('--scratch', help='临时知识库目录（默认新建临时目录，结束后删除）')
+    args = parser.parse_args()
+
+    strategies = [s for s in args.strategies.split(',') if s]
+    unknown = set(strategies) - set(build_knowledge_base.CHUNKERS)
+    if unknown:
+        parser.error(f"未知的分块策略: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    countries = sorted(retriever.SUPPORTED_COUNTRIES, key=len, reverse=True)
+    gold = gold_sentences(args.source, countries)
+    questions = experiment_questions(gold, benchmark.BENCHMARK_QUESTIONS, countries)
+    print(f"问题 {len(questions)} 个，其中 {sum(1 for _, a in questions if a)} 个有标准答案句")
+
+    scratch_dir = args.scratch or tempfile.mkdtemp(prefix='chunking-')
+    rows = []
+    try:
+        for strategy in strategies:
+            for size in sizes:
+                rows.append(run_config(qa.COLLECTION_NAME, args.source, scratch_dir, countries, strategy, size, args, questions))
+    finally:
+        if not args.scratch:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+    print_table(rows, args.k)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+上下文压缩 - 在调用大模型前精简检索段落
+
+每个段落只保留与问题关键词 / HR术语相关的句子，清理 OCR 表格中的空白噪声，
+跨段落去掉重复句子（分块重叠、OCR 与正文重复），并把总长度控制在 token 预算内。
+答案第三部分展示的原文段落不受影响，仍使用完整的检索结果。
+"""
+
+import re
+
+# 估算 token 数：CJK 字符约 1 token/字，其他字符约 4 字符/token（偏保守）
+_CJK = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+_OCR_CELL_GAP = re.compile(r'[ \t\u3000]{3,}')
+_SPACES = re.compile(r'[ \t\u3000]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+_SENTENCE_SPLIT = re.compile(r'(?<=[。；！？!?;])|\n')
+_DEDUPE_STRIP = re.compile(r'[\W_]+')
+_DIGIT = re.compile(r'\d')
+
+
+def estimate_tokens(text):
+    """粗略估算文本的 token 数"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    other = len(text) - cjk - text.count(' ') - text.count('\n')
+    return cjk + (max(other, 0) + 3) // 4
+
+
+def clean_ocr_text(text):
+    """清理 OCR 表格噪声：连续空白视为单元格分隔（换行），其余空白压缩为一个空格"""
+    text = _OCR_CELL_GAP.sub('\n', text)
+    text = _SPACES.sub(' ', text)
+    text = _BLANK_LINES.sub('\n', text)
+    return text.strip()
+
+
+def split_sentences(text):
+    """按中英文句末标点和换行切分句子"""
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s and s.strip()]
+
+
+def _sentence_score(sentence, keywords, hr_terms):
+    folded = sentence.casefold()  # 关键词来自规范化（小写）后的问题
+    score = sum(1 for kw in keywords if kw in folded)
+    score += sum(2 for term in hr_terms if term.casefold() in folded)
+    if score and _DIGIT.search(sentence):
+        score += 1  # 含具体数字的相关句子通常是规定本身
+    return score
+
+
+def pack_contexts(contexts, keywords, hr_terms, token_budget):
+    """压缩检索段落，返回 (压缩后的段落列表, 统计信息)
+
+    1. 每个段落先保留其得分最高的一句（保证多国对比时每个国家都有内容）
+    2. 其余相关句子按 (得分, 段落排名) 全局贪心加入，直到用完 token 预算
+    3. 与已选句子重复或被其包含的句子直接跳过
+    输出时每个段落内的句子保持原文顺序；没有任何相关句子的段落不进入 prompt
+    """
+    candidates = []  # (得分, 段落排名, 句子序号, 句子, 去重键, token数)
+    for rank, ctx in enumerate(contexts):
+        for position, sentence in enumerate(split_sentences(clean_ocr_text(ctx['text']))):
+            score = _sentence_score(sentence, keywords, hr_terms)
+            if score > 0:
+                key = _DEDUPE_STRIP.sub('', sentence)
+                candidates.append((score, rank, position, sentence, key, estimate_tokens(sentence)))
+
+    selected = {}  # 段落排名 -> [(句子序号, 句子)]
+    selected_keys = []
+    used = 0
+
+    def try_add(candidate):
+        nonlocal used
+        score, rank, position, sentence, key, tokens = candidate
+        if used + tokens > token_budget:
+            return False
+        if any(key == k or (len(key) >= 10 and key in k) for k in selected_keys):
+            return False
+        selected.setdefault(rank, []).append((position, sentence))
+        selected_keys.append(key)
+        used += tokens
+        return True
+
+    ordered = sorted(candidates, key=lambda c: (-c[0], c[1], c[2]))
+    added = set()
+    for rank in range(len(contexts)):
+        best = next((c for c in ordered if c[1] == rank), None)
+        if best and try_add(best):
+            added.add(id(best))
+    for candidate in ordered:
+        if id(candidate) not in added:
+            try_add(candidate)
+
+    packed = []
+    for rank, ctx in enumerate(contexts):
+        if rank in selected:
+            sentences = [s for _, s in sorted(selected[rank])]
+            packed.append(dict(ctx, text='\n'.join(sentences)))
+
+    # 没有任何相关句子时退回到最相关段落的开头部分
+    if not packed and contexts:
+        head = []
+        for sentence in split_sentences(clean_ocr_text(contexts[0]['text'])):
+            tokens = estimate_tokens(sentence)
+            if head and used + tokens > token_budget:
+                break
+            head.append(sentence)
+            used += tokens
+        packed.append(dict(contexts[0], text='\n'.join(head)))
+
+    stats = {
+        'context_tokens_before': sum(estimate_tokens(ctx['text']) for ctx in contexts),
+        'context_tokens_after': sum(estimate_tokens(ctx['text']) for ctx in packed),
+    }
+    return packed, stats
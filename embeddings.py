@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+向量模型清单 - 知识库记录构建时使用的向量模型，服务启动时校验并用同一模型生成查询向量
+
+knowledge_db/embedding_manifest.json:
+    model        向量模型（见 MODELS）
+    dimension    向量维度
+    normalized   向量是否已归一化
+    built_at     构建时间（UTC，ISO 8601）
+    chunks       段落数
+查询向量必须与构建时的模型一致，否则检索结果无意义（维度不同时 Chroma 直接报错）。
+启动时校验清单、模型登记信息与 HNSW 索引文件中的实际维度，任何不一致都抛出 EmbeddingMismatch。
+本地 ONNX 模型（all-MiniLM-L6-v2）只从本地缓存加载，检索过程不访问网络；
+缓存需在构建阶段下载（python embeddings.py --fetch-model）。
+
+用法：
+    python embeddings.py --check                为现有知识库校验清单
+    python embeddings.py --write-manifest       按 HNSW 索引推断维度，为旧知识库生成清单
+    python embeddings.py --fetch-model          下载本地 ONNX 模型到缓存
+"""
+
+import argparse
+import base64
+import glob
+import json
+import math
+import os
+import struct
+from datetime import datetime, timezone
+
+MANIFEST_NAME = 'embedding_manifest.json'
+
+# 已知的向量模型：provider 为 onnx 的模型在本地推理
+MODELS = {
+    'all-MiniLM-L6-v2': {'provider': 'onnx', 'dimension': 384, 'normalized': True},
+    'text-embedding-3-small': {'provider': 'openai', 'dimension': 1536, 'normalized': True},
+}
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+
+# hnswlib 索引头：持久化版本(int32)、offsetLevel0、max_elements、cur_element_count、
+# size_data_per_element、label_offset、offsetData(均为 size_t)
+_HNSW_HEADER = struct.Struct('<iQQQQQQ')
+
+
+class EmbeddingMismatch(Exception):
+    """知识库与查询向量模型不一致（或缺少清单 / 本地模型）"""
+
+
+def manifest_path(db_path):
+    return os.path.join(db_path, MANIFEST_NAME)
+
+
+def load_manifest(db_path):
+    path = manifest_path(db_path)
+    if not os.path.exists(path):
+        raise EmbeddingMismatch(
+            f'缺少向量模型清单 {path}：请重新构建知识库，或运行 python embeddings.py --write-manifest')
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(db_path, model, dimension, chunks=None, built_at=None):
+    spec = MODELS.get(model)
+    if spec is None:
+        raise EmbeddingMismatch(f'未知的向量模型: {model}')
+    manifest = {
+        'model': model,
+        'provider': spec['provider'],
+        'dimension': dimension,
+        'normalized': spec['normalized'],
+        'built_at': built_at or datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'chunks': chunks,
+    }
+    with open(manifest_path(db_path), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    return manifest
+
+
+def hnsw_segments(db_path):
+    """读取各 HNSW 段的索引头，返回 [{'path', 'dimension', 'elements'}]"""
+    segments = []
+    for header in sorted(glob.glob(os.path.join(db_path, '*', 'header.bin'))):
+        with open(header, 'rb') as f:
+            data = f.read(_HNSW_HEADER.size)
+        if len(data) < _HNSW_HEADER.size:
+            continue
+        _, _, _, elements, _, label_offset, offset_data = _HNSW_HEADER.unpack(data)
+        # 每个元素依次为：邻接表(offsetData 字节)、float32 向量、标签
+        dimension = (label_offset - offset_data) // 4
+        segments.append({'path': os.path.dirname(header), 'dimension': dimension, 'elements': elements})
+    return segments
+
+
+def validate(manifest, db_path):
+    """校验清单与模型登记信息、HNSW 索引维度是否一致，返回模型登记信息"""
+    model = manifest.get('model')
+    spec = MODELS.get(model)
+    if spec is None:
+        raise EmbeddingMismatch(f'知识库使用了未知的向量模型: {model}')
+    if manifest.get('dimension') != spec['dimension']:
+        raise EmbeddingMismatch(
+            f"清单中的维度 {manifest.get('dimension')} 与模型 {model} 的维度 {spec['dimension']} 不一致")
+    if bool(manifest.get('normalized')) != spec['normalized']:
+        raise EmbeddingMismatch(f'清单中的归一化设置与模型 {model} 不一致')
+    for segment in hnsw_segments(db_path):
+        if segment['dimension'] != spec['dimension']:
+            raise EmbeddingMismatch(
+                f"HNSW 索引 {segment['path']} 的维度为 {segment['dimension']}，"
+                f"而清单中的模型 {model} 为 {spec['dimension']} 维：请用同一模型重新构建知识库")
+    return spec
+
+
+def onnx_model_dir():
+    """Chroma 的 ONNX MiniLM 模型缓存目录"""
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+    return os.path.join(str(ONNXMiniLM_L6_V2.DOWNLOAD_PATH), ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME)
+
+
+def onnx_model_available():
+    model_dir = onnx_model_dir()
+    return all(os.path.exists(os.path.join(model_dir, name)) for name in ('model.onnx', 'tokenizer.json'))
+
+
+def fetch_onnx_model():
+    """下载本地 ONNX 模型（构建阶段执行，运行时不再访问网络）"""
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+    ONNXMiniLM_L6_V2()._download_model_if_not_exists()
+    return onnx_model_dir()
+
+
+def embedding_function(model):
+    """按模型创建 embedding 函数（本地模型缺失时抛出 EmbeddingMismatch）
+
+    本地模型使用进程内共享的 onnx_embedder.OnnxEmbedder（线程数受控、并发查询合批）
+    """
+    from chromadb.utils import embedding_functions
+
+    spec = MODELS[model]
+    if spec['provider'] == 'onnx':
+        if not onnx_model_available():
+            raise EmbeddingMismatch(
+                f'本地 ONNX 模型不存在（{onnx_model_dir()}）：请先运行 python embeddings.py --fetch-model')
+        import onnx_embedder
+        return onnx_embedder.shared_embedder(onnx_model_dir())
+
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise EmbeddingMismatch(f'知识库使用 {model} 构建，查询向量需要 OPENAI_API_KEY')
+    return embedding_functions.OpenAIEmbeddingFunction(api_key=api_key, model_name=model)
+
+
+class CachedEmbeddingFunction:
+    """查询向量经共享缓存（shared_cache 的 embedding 命名空间）：命中的文本不再推理，未命中的一次批量推理
+
+    向量以 float32 的 base64 存储；键包含模型名与推理变体（量化模型的输出与 fp32 略有不同）
+    """
+
+    def __init__(self, embedding_func, cache, model):
+        self.embedding_func = embedding_func
+        self.cache = cache
+        self.variant = [model, bool(getattr(embedding_func, 'quantized', False))]
+
+    def __call__(self, input):
+        import numpy as np
+
+        texts = list(input)
+        vectors = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            cached = self.cache.get(self.variant, text)
+            if cached is None:
+                missing.append(i)
+            else:
+                vectors[i] = np.frombuffer(base64.b64decode(cached), dtype=np.float32).tolist()
+        if missing:
+            computed = self.embedding_func([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vectors[i] = list(vector)
+                encoded = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+                self.cache.set(encoded, self.variant, texts[i])
+        return vectors
+
+    def snapshot(self):
+        return runtime_snapshot(self.embedding_func)
+
+
+def runtime_snapshot(embedding_func):
+    """embedding 函数的运行统计（本地推理时为线程设置与合批情况）"""
+    snapshot = getattr(embedding_func, 'snapshot', None)
+    return snapshot() if snapshot else {'type': type(embedding_func).__name__}
+
+
+def query_embedding_function(db_path):
+    """服务启动时调用：加载并校验清单，返回与构建时一致的 embedding 函数与清单
+
+    本地模型额外用一条探测文本核对输出维度与归一化（不访问网络）
+    """
+    manifest = load_manifest(db_path)
+    spec = validate(manifest, db_path)
+    embedding_func = embedding_function(manifest['model'])
+    if spec['provider'] == 'onnx':
+        vector = embedding_func(['英国的最低工资'])[0]
+        if len(vector) != spec['dimension']:
+            raise EmbeddingMismatch(f"{manifest['model']} 输出 {len(vector)} 维向量，清单为 {spec['dimension']} 维")
+        norm = math.sqrt(sum(x * x for x in vector))
+        if spec['normalized'] and abs(norm - 1.0) > 1e-3:
+            raise EmbeddingMismatch(f"{manifest['model']} 输出的向量未归一化（范数 {norm:.4f}）")
+    return embedding_func, manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='知识库向量模型清单')
+    parser.add_argument('--db', default='knowledge_db', help='知识库目录')
+    parser.add_argument('--check', action='store_true', help='校验清单与 HNSW 索引')
+    parser.add_argument('--write-manifest', action='store_true', help='按 HNSW 索引推断维度并写入清单')
+    parser.add_argument('--model', default=DEFAULT_MODEL, choices=sorted(MODELS), help='--write-manifest 时的模型')
+    parser.add_argument('--fetch-model', action='store_true', help='下载本地 ONNX 模型')
+    args = parser.parse_args()
+
+    if args.fetch_model:
+        print(f"✓ ONNX 模型已就绪: {fetch_onnx_model()}")
+
+    if args.write_manifest:
+        segments = hnsw_segments(args.db)
+        if not segments:
+            raise SystemExit(f'✗ {args.db} 中没有 HNSW 索引，无法推断维度')
+        dimension = segments[0]['dimension']
+        # 以索引文件的修改时间作为构建时间
+        built_at = datetime.fromtimestamp(
+            os.path.getmtime(os.path.join(segments[0]['path'], 'header.bin')), timezone.utc)
+        manifest = write_manifest(args.db, args.model, dimension, chunks=sum(s['elements'] for s in segments),
+                                  built_at=built_at.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        validate(manifest, args.db)
+        print(f"✓ 已写入 {manifest_path(args.db)}: {manifest}")
+
+    if args.check:
+        manifest = load_manifest(args.db)
+        validate(manifest, args.db)
+        print(f"✓ 清单与索引一致: {manifest['model']}（{manifest['dimension']} 维，{manifest.get('chunks')} 段）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+结构化事实表 - 国家 × 主题 的单值查询（年假天数、试用期、每周工时、最低工资、加班费率）
+
+离线阶段从知识库抽取事实并写入 knowledge_db/fact_table.json，
+在线阶段由 /api/ask 加载到内存索引，命中时无需检索和大模型即可直接回答。
+答案不经大模型核对，因此只收录明确的取值：数值须与主题词在同一分句且紧挨着，
+同一 (国家, 主题) 的原文取值不一致时不收录，这类问题仍走检索 + 大模型。
+
+用法：
+    python fact_table.py                # 从知识库重建事实表
+    python fact_table.py --show 德国    # 查看某国已抽取的事实
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+# 数值（可带区间，如 "3到6"、"1,500"）
+_VALUE = r'(\d[\d,]*(?:\.\d+)?(?:\s*(?:到|至|-|~|－|—)\s*\d[\d,]*(?:\.\d+)?)?)'
+
+# 事实主题：名称取自 HR 术语表（HR_TERM_RULES），
+# triggers 用于识别问题主题，evidence 用于在原文中定位句子，pattern 抽取 (数值, 单位)
+FACT_TOPICS = {
+    '年假': {
+        'label': '带薪年假',
+        'triggers': ('年假', '带薪休假'),
+        'evidence': ('年假', '带薪休假', '带薪假期'),
+        'pattern': _VALUE + r'\s*(?:个)?(工作日|天|日|周)',
+    },
+    '试用期': {
+        'label': '试用期',
+        'triggers': ('试用期', 'probation'),
+        'evidence': ('试用期',),
+        'pattern': _VALUE + r'\s*(?:个)?(月|周|天)',
+    },
+    '工作时长': {
+        'label': '每周标准工作时间',
+        'triggers': ('工作时长', '工作时间', '工时'),
+        'evidence': ('工作时间', '工作时长', '工时'),
+        'pattern': r'(?:每周|一周|周)\D{0,8}?' + _VALUE + r'\s*(?:个)?(小时)',
+    },
+    '最低工资': {
+        'label': '最低工资',
+        'triggers': ('最低工资', '底薪'),
+        'evidence': ('最低工资',),
+        'pattern': _VALUE + r'\s*(美元|欧元|英镑|日元|韩元|新加坡元|新元|港币|港元|新台币|雷亚尔|'
+                   r'加元|澳元|纽元|卢比|泰铢|越南盾|印尼盾|比索|林吉特|里拉|里亚尔|迪拉姆|法郎|克朗|'
+                   r'兹罗提|卢布|兰特|埃及镑|谢克尔|坚戈|索姆|福林|列弗|列伊|第纳尔|塞迪|奈拉|元)',
+    },
+    '加班': {
+        'label': '加班工资标准',
+        'triggers': ('加班费', '加班工资', '加班'),
+        'evidence': ('加班',),
+        'pattern': _VALUE + r'\s*(%|倍)',
+    },
+}
+
+# 问题中出现这些词才视为"查一个数"的问题，其余问题（如"加班政策"）仍走检索 + 大模型
+LOOKUP_CUES = ('多少', '几天', '几个', '多长', '多久', '几小时', '标准', '是几')
+
+# 问题中出现这些连接词（或被标点分成多个分句）说明不止问一个数，交给检索 + 大模型
+MULTI_PART_CUES = ('以及', '还有', '并且', '而且', '另外', '同时')
+
+# 句子中出现这些词说明是法定标准；只用于在取值一致的候选中挑选原文依据，不参与取值
+STATUTORY_CUES = ('法定', '至少', '最少', '不少于', '不超过', '最长', '最高', '标准')
+
+# 数值与主题词之间最多相隔的字符数（"28天带薪年假"、"最低工资标准为每小时12.41欧元"），超出时不算直接陈述
+ADJACENT_CHARS = 8
+
+# 金额的计算周期（"每小时12.41欧元"、"月薪1,500美元"、"12.41欧元/小时"），写入单位
+_PERIOD = re.compile(r'(?:每|/|／|按)(小时|时|天|日|周|月|年)|(时|日|周|月|年)薪')
+_PERIOD_NAMES = {'时': '小时', '天': '日'}
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[。；！？\n])')
+_CLAUSE_SPLIT = re.compile(r'[，；;]|,(?!\d)')  # 不拆开千分位（1,500）
+_QUESTION_CLAUSE_SPLIT = re.compile(r'[，,；;。？?！!]')
+_WORKING_DAY = re.compile(r'\s*[（(]?\s*工作日')
+_COMPILED_PATTERNS = {topic: re.compile(spec['pattern']) for topic, spec in FACT_TOPICS.items()}
+
+
+def detect_topics(question):
+    """识别问题涉及的事实主题（可能为多个）"""
+    lowered = question.lower()
+    return [topic for topic, spec in FACT_TOPICS.items()
+            if any(t in question or t in lowered for t in spec['triggers'])]
+
+
+def is_lookup_question(question):
+    """问题是否为单值查询"""
+    return any(cue in question for cue in LOOKUP_CUES)
+
+
+def is_single_part_question(question):
+    """问题是否只有一个分句（没有"，期间解雇需要通知吗"之类的追问）"""
+    clauses = [c for c in _QUESTION_CLAUSE_SPLIT.split(question) if c.strip()]
+    return len(clauses) <= 1 and not any(cue in question for cue in MULTI_PART_CUES)
+
+
+def strip_topic_terms(question, topic):
+    """去掉问题中某主题的触发词，用于检查问题是否还涉及其他主题"""
+    for term in sorted(FACT_TOPICS[topic]['triggers'], key=len, reverse=True):
+        question = question.replace(term, ' ')
+    return question
+
+
+def _distance(span, term_spans):
+    """数值与最近一个主题词之间相隔的字符数"""
+    start, end = span
+    return min(max(t_start - end, start - t_end, 0) for t_start, t_end in term_spans)
+
+
+def _period(clause, span):
+    """离数值最近的计算周期（小时 / 日 / 周 / 月 / 年），没有时返回 None"""
+    best = None
+    for m in _PERIOD.finditer(clause):
+        distance = _distance(span, [m.span()])
+        if best is None or distance < best[0]:
+            best = (distance, m.group(1) or m.group(2))
+    return _PERIOD_NAMES.get(best[1], best[1]) if best else None
+
+
+def _clause_fact(topic, clause):
+    """在一个分句中取离主题词最近的数值，返回 (数值, 单位, 相隔字符数)；分句不含主题词或数值时返回 None"""
+    term_spans = [m.span() for term in FACT_TOPICS[topic]['evidence'] for m in re.finditer(re.escape(term), clause)]
+    if not term_spans:
+        return None
+    # 距离从数值起算（工作时长的模式以"每周"开头，可能包含主题词本身）
+    matches = [(_distance((m.start(1), m.end()), term_spans), m) for m in _COMPILED_PATTERNS[topic].finditer(clause)]
+    if not matches:
+        return None
+    distance, match = min(matches, key=lambda found: found[0])
+    unit = match.group(2)
+    if unit == '月':
+        unit = '个月'
+    elif unit in ('天', '日') and topic == '年假' and _WORKING_DAY.match(clause, match.end()):
+        unit = '工作日'  # "20天（工作日）"
+    elif topic == '最低工资':
+        period = _period(clause, match.span())
+        if period:
+            unit = f'{unit}/{period}'
+    return re.sub(r'[\s,]', '', match.group(1)), unit, distance
+
+
+def _candidate_facts(topic, doc_id, doc, meta):
+    """在一个段落中抽取某主题的候选事实，返回 [(排名, 事实), ...]
+
+    每个分句只取离主题词最近的数值（"每周工作5天的员工每年享有至少28天带薪年假"取 28 天）；
+    排名 = (是否正文, 是否紧挨主题词, 是否法定标准, -相隔字符数, -句长)
+    """
+    candidates = []
+    for sentence in _SENTENCE_SPLIT.split(doc):
+        sentence = ' '.join(sentence.split())
+        if not sentence:
+            continue
+        for clause in _CLAUSE_SPLIT.split(sentence):
+            found = _clause_fact(topic, clause)
+            if found is None:
+                continue
+            value, unit, distance = found
+            rank = (
+                meta.get('type') != 'ocr',  # 正文优先于 OCR 表格
+                distance <= ADJACENT_CHARS,
+                any(cue in sentence for cue in STATUTORY_CUES),
+                -distance,
+                -len(sentence),
+            )
+            candidates.append((rank, {
+                'country': meta.get('country', ''),
+                'topic': topic,
+                'label': FACT_TOPICS[topic]['label'],
+                'value': value,
+                'unit': unit,
+                'chunk_id': doc_id,
+                'title': meta.get('title', ''),
+                'url': meta.get('url', ''),
+                'excerpt': sentence[:200],
+            }))
+    return candidates
+
+
+def pick_fact(candidates):
+    """从同一 (国家, 主题) 的候选中选出明确胜出的事实，没有明确胜出者时返回 None
+
+    只有紧挨主题词的直接陈述才可能被采用；最高一档（是否正文, 是否紧挨主题词）中的候选
+    取值必须全部一致（如一处写 20 天、另一处写 25 天则不采用，交给检索 + 大模型）
+    """
+    if not candidates:
+        return None
+    candidates = sorted(candidates, key=lambda c: c[0], reverse=True)
+    tier = candidates[0][0][:2]
+    if not tier[1]:
+        return None
+    values = {(fact['value'], fact['unit']) for rank, fact in candidates if rank[:2] == tier}
+    return candidates[0][1] if len(values) == 1 else None
+
+
+def extract_facts(ids, documents, metadatas):
+    """从知识库全部段落中为每个 (国家, 主题) 选出一条明确的事实（有冲突的不收录）"""
+    candidates = {}
+    for doc_id, doc, meta in zip(ids, documents, metadatas):
+        for topic in FACT_TOPICS:
+            for rank, fact in _candidate_facts(topic, doc_id, doc, meta):
+                candidates.setdefault((fact['country'], topic), []).append((rank, fact))
+    facts = (pick_fact(found) for found in candidates.values())
+    return sorted((fact for fact in facts if fact), key=lambda f: (f['country'], f['topic']))
+
+
+class FactIndex:
+    """内存中的 (国家, 主题) -> 事实 索引"""
+
+    def __init__(self, facts=()):
+        self._facts = {(f['country'], f['topic']): f for f in facts}
+
+    def __len__(self):
+        return len(self._facts)
+
+    def get(self, country, topic):
+        return self._facts.get((country, topic))
+
+
+def load_fact_index(path):
+    """加载事实表，文件不存在时返回空索引（快速通道自动关闭）"""
+    if not os.path.exists(path):
+        return FactIndex()
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return FactIndex(data.get('facts', []))
+
+
+def build_fact_table(collection, path):
+    """从知识库抽取事实并写入 path，返回事实列表"""
+    docs = collection.get()
+    facts = extract_facts(docs['ids'], docs['documents'], docs['metadatas'])
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'chunk_count': len(docs['ids']),
+            'facts': facts,
+        }, f, ensure_ascii=False, indent=2)
+    return facts
+
+
+def main():
+    import qa_service_redesign as qa
+
+    parser = argparse.ArgumentParser(description='构建结构化事实表')
+    parser.add_argument('--show', metavar='COUNTRY', help='只查看某国已抽取的事实，不重建')
+    args = parser.parse_args()
+
+    if args.show:
+        index = load_fact_index(qa.FACT_TABLE_PATH)
+        for topic in FACT_TOPICS:
+            fact = index.get(args.show, topic)
+            if fact:
+                print(f"  {topic}: {fact['value']}{fact['unit']}  [{fact['chunk_id']}] {fact['excerpt']}")
+            else:
+                print(f"  {topic}: -")
+        return
+
+    qa.init_services()
+    started = time.perf_counter()
+    facts = build_fact_table(qa.collection, qa.FACT_TABLE_PATH)
+    elapsed = time.perf_counter() - started
+
+    print(f"✓ 抽取 {len(facts)} 条事实，用时 {elapsed:.1f}s，已写入 {qa.FACT_TABLE_PATH}")
+    for topic in FACT_TOPICS:
+        covered = sum(1 for f in facts if f['topic'] == topic)
+        print(f"  {topic}: {covered} 个国家")
+
+
+if __name__ == '__main__':
+    main()
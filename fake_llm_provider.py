@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+本地假大模型服务 - OpenAI 兼容的 /chat/completions，按 RPM / TPM 限流
+
+请求数和 token 数（prompt 估算 + max_tokens）按分钟限额连续补充，超限时返回 429 与 retry-after，
+每个响应都带 x-ratelimit-* 头。用于在不消耗真实额度的情况下验证 llm_scheduler 的排队与重试。
+
+用法：
+    python fake_llm_provider.py --port 8900 --rpm 20 --tpm 8000
+        然后设置 DEEPSEEK_BASE_URL=http://127.0.0.1:8900 DEEPSEEK_API_KEY=fake 启动问答服务
+    python fake_llm_provider.py --burst 30
+        启动临时服务并并发发送 30 个请求：先直接发送，再经 llm_scheduler 发送，对比 429 次数
+"""
+
+import argparse
+import collections
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import context_packing
+import llm_scheduler
+
+
+class ReplenishingLimit:
+    """与 OpenAI / DeepSeek 一致：请求数与 token 数按分钟限额连续补充"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_accept(self, tokens):
+        """返回 (是否接受, 限流响应头, retry-after 秒)"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed_min = (now - self._updated) / 60.0
+            self._requests = min(self.rpm, self._requests + elapsed_min * self.rpm)
+            self._tokens = min(self.tpm, self._tokens + elapsed_min * self.tpm)
+            self._updated = now
+
+            accepted = self._requests >= 1 and self._tokens >= tokens
+            if accepted:
+                self._requests -= 1
+                self._tokens -= tokens
+            retry_after = max((1 - self._requests) / self.rpm, (tokens - self._tokens) / self.tpm, 0) * 60
+            headers = {
+                'x-ratelimit-limit-requests': str(self.rpm),
+                'x-ratelimit-limit-tokens': str(self.tpm),
+                'x-ratelimit-remaining-requests': str(int(self._requests)),
+                'x-ratelimit-remaining-tokens': str(int(self._tokens)),
+                'x-ratelimit-reset-requests': f'{(self.rpm - self._requests) / self.rpm * 60:.3f}s',
+                'x-ratelimit-reset-tokens': f'{(self.tpm - self._tokens) / self.tpm * 60:.3f}s',
+            }
+            return accepted, headers, retry_after
+
+
+def make_handler(limit, latency_s):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, headers):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send(404, {'error': {'message': 'not found'}}, {})
+                return
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            prompt = '\n'.join(str(m.get('content', '')) for m in payload.get('messages', []))
+            prompt_tokens = context_packing.estimate_tokens(prompt)
+            max_tokens = payload.get('max_tokens', 1000)
+
+            accepted, headers, retry_after = limit.try_accept(prompt_tokens + max_tokens)
+            if not accepted:
+                headers['retry-after'] = f'{max(retry_after, 0.1):.1f}'
+                self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_error'}}, headers)
+                return
+
+            time.sleep(latency_s)
+            completion_tokens = min(max_tokens, 120)
+            self._send(200, {
+                'id': 'fake-' + str(int(time.time() * 1000)),
+                'object': 'chat.completion',
+                'model': payload.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'finish_reason': 'stop',
+                    'message': {'role': 'assistant', 'content': '【精准回答】\n（本地假服务的回答）'},
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens,
+                },
+            }, headers)
+
+    return Handler
+
+
+def serve(port=0, rpm=20, tpm=8000, latency_s=0.2):
+    """在后台线程启动服务，返回 server（server.server_address[1] 为端口）"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(ReplenishingLimit(rpm, tpm), latency_s))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class UpstreamError(Exception):
+    """与 SDK 异常形状一致：status_code + response.headers"""
+
+    def __init__(self, error):
+        super().__init__(f'HTTP {error.code}')
+        self.status_code = error.code
+        self.response = error
+
+
+def _post(url, prompt, max_tokens):
+    body = json.dumps({'model': 'fake', 'max_tokens': max_tokens,
+                       'messages': [{'role': 'user', 'content': prompt}]}).encode('utf-8')
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            data = json.loads(response.read())
+            return data, response.headers, data['usage']['prompt_tokens'] + max_tokens
+    except urllib.error.HTTPError as e:
+        raise UpstreamError(e)
+
+
+def run_burst(count, rpm, tpm, latency_s, deadline_s, prompt_chars=300, max_tokens=500):
+    prompt = '用工' * (prompt_chars // 2)
+    est_tokens = context_packing.estimate_tokens(prompt) + max_tokens
+
+    # 1. 直接发送
+    server = serve(rpm=rpm, tpm=tpm, latency_s=latency_s)
+    url = f'http://127.0.0.1:{server.server_address[1]}/chat/completions'
+
+    def direct(_):
+        try:
+            _post(url, prompt, max_tokens)
+            return 'ok'
+        except UpstreamError as e:
+            return f'http_{e.status_code}'
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        outcomes = collections.Counter(pool.map(direct, range(count)))
+    server.shutdown()
+    print(f"直接发送 {count} 个请求: {dict(outcomes)}")
+
+    # 2. 经调度器发送（全新的服务，窗口从零开始）
+    server = serve(rpm=rpm, tpm=tpm, latency_s=latency_s)
+    url = f'http://127.0.0.1:{server.server_address[1]}/chat/completions'
+    scheduler = llm_scheduler.LLMScheduler(limits={'fake': (rpm, tpm)})
+    started = time.monotonic()
+
+    def scheduled(_):
+        try:
+            scheduler.call('fake', lambda: _post(url, prompt, max_tokens), est_tokens,
+                           time.monotonic() + deadline_s)
+            return 'ok'
+        except llm_scheduler.RateLimited:
+            return 'rate_limited'
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        outcomes = collections.Counter(pool.map(scheduled, range(count)))
+    server.shutdown()
+    print(f"经调度器发送 {count} 个请求（截止 {deadline_s:.0f}s）: {dict(outcomes)}，"
+          f"用时 {time.monotonic() - started:.1f}s")
+    print(f"  调度统计: {scheduler.snapshot()['fake']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地假大模型服务（按 RPM / TPM 限流）')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--rpm', type=int, default=20)
+    parser.add_argument('--tpm', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.2, help='每次调用的模拟耗时（秒）')
+    parser.add_argument('--burst', type=int, metavar='N', help='对比直接发送与经调度器发送 N 个并发请求')
+    parser.add_argument('--deadline', type=float, default=30.0, help='--burst 时每个请求的截止时间（秒）')
+    args = parser.parse_args()
+
+    if args.burst:
+        run_burst(args.burst, args.rpm, args.tpm, args.latency, args.deadline)
+        return
+
+    server = serve(args.port, args.rpm, args.tpm, args.latency)
+    print(f"✓ 假大模型服务已启动: http://127.0.0.1:{args.port}（RPM {args.rpm}, TPM {args.tpm}）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
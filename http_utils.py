@@ -0,0 +1,79 @@
+"""
+HTTP 缓存与压缩协商的通用工具（不依赖 Flask）
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只使用 gzip
+    brotli = None
+
+# 动态内容（JSON）压缩：小于该大小不压缩；压缩级别偏向速度
+COMPRESS_MIN_BYTES = 512
+DYNAMIC_GZIP_LEVEL = 6
+DYNAMIC_BROTLI_QUALITY = 5
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回 {编码: q值}"""
+    accepted = {}
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def negotiate_encoding(header, available=('br', 'gzip')):
+    """按 br > gzip 的优先级选择客户端可接受的压缩编码，都不接受时返回 'identity'"""
+    accepted = parse_accept_encoding(header)
+    for encoding in available:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def format_etag(base, encoding='identity'):
+    """强 ETag：同一内容的不同压缩版本使用不同的后缀"""
+    return f'"{base}"' if encoding == 'identity' else f'"{base}-{encoding}"'
+
+
+def etag_matches(if_none_match, base):
+    """If-None-Match 中是否有与 base 对应的 ETag（忽略弱标记与压缩后缀）"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == base or tag.rsplit('-', 1)[0] == base:
+            return True
+    return False
+
+
+def dynamic_encodings():
+    """动态压缩可用的编码（按优先级）"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding):
+    """按指定编码压缩动态内容"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=DYNAMIC_BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=DYNAMIC_GZIP_LEVEL, mtime=0)
+    return data
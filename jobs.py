@@ -0,0 +1,300 @@
+"""
+后台任务 - 耗时的联网搜索在后台线程池中执行，结果写入本地 SQLite 并保留一段时间
+
+HTTP 连接只用于提交和取结果：连接中断（如代理超时）不会丢弃已付费的结果。
+任务 ID 由问题（或调用方给出的去重键，如规范化后的问题）决定，同一问题进行中或未过期的任务被所有请求共享。
+    pending → running → done | failed
+推测性任务（知识库无答案时的预取）只在有空闲名额时提交，不排队；
+过期前被用户取用计为命中，从未被取用计为浪费。
+多个进程（worker）共享同一个数据库：未完成的任务记录执行它的进程（owner）与租约到期时间，
+执行进程定期续约，租约有效的任务同样被其他进程共享；租约过期（进程退出或崩溃）的任务
+标记为 failed（interrupted），再次提交时重新执行。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+FINISHED = ('done', 'failed')
+LEASE_S = 30         # 未完成任务的租约时长，执行进程每 LEASE_S / 3 秒续约一次
+WAIT_POLL_S = 0.5    # wait() 轮询数据库的间隔（其他进程执行的任务完成时不会通知本进程）
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    status TEXT NOT NULL,
+    answer TEXT,
+    error TEXT,
+    error_kind TEXT,
+    speculative INTEGER NOT NULL DEFAULT 0,
+    attached INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+# 早期版本的任务表没有租约列，打开时补上（租约为 0 的未完成任务视为已过期）
+_LEASE_COLUMNS = (('owner', 'TEXT'), ('lease_until', 'REAL NOT NULL DEFAULT 0'))
+
+_EXPIRE = (
+    "UPDATE jobs SET status = 'failed', error = 'interrupted', error_kind = 'interrupted', updated = ? "
+    "WHERE status IN ('pending', 'running') AND lease_until < ?")
+
+
+def job_id_for(question):
+    """问题对应的任务 ID"""
+    return hashlib.sha256(question.strip().encode('utf-8')).hexdigest()[:16]
+
+
+class JobQueueFull(Exception):
+    """进行中的任务已达上限"""
+
+
+class JobStore:
+    """SQLite 任务表（WAL 模式，单连接 + 锁；首次使用时才打开）
+
+    owner 标识本进程中的这个 JobStore；未完成的任务由创建它的 owner 续约（见 renew）
+    """
+
+    def __init__(self, path, lease_s=LEASE_S):
+        self.path = path
+        self.lease_s = lease_s
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        """调用方需持有 self._lock"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            with conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(_SCHEMA)
+                columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+                for name, definition in _LEASE_COLUMNS:
+                    if name not in columns:
+                        conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {definition}')
+                now = time.time()
+                conn.execute(_EXPIRE, (now, now))
+            self._conn = conn
+        return self._conn
+
+    def get(self, job_id):
+        """任务的最新状态；租约已过期的未完成任务先标记为 interrupted"""
+        with self._lock:
+            row = self.conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            now = time.time()
+            if row and row['status'] not in FINISHED and row['lease_until'] < now:
+                with self.conn:
+                    self.conn.execute(_EXPIRE, (now, now))
+                row = self.conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def create(self, job_id, question, speculative):
+        """以本 owner 创建（或重新执行）任务，返回 (任务, 是否由本 owner 创建)
+
+        其他进程持有有效租约的未完成任务不会被覆盖，此时返回该任务与 False
+        """
+        now = time.time()
+        with self._lock, self.conn:
+            created = self.conn.execute(
+                'INSERT INTO jobs (id, question, status, speculative, attached, created, updated, owner, lease_until) '
+                "VALUES (?, ?, 'pending', ?, 0, ?, ?, ?, ?) "
+                'ON CONFLICT(id) DO UPDATE SET question = excluded.question, status = excluded.status, '
+                'answer = NULL, error = NULL, error_kind = NULL, speculative = excluded.speculative, '
+                'attached = 0, created = excluded.created, updated = excluded.updated, '
+                'owner = excluded.owner, lease_until = excluded.lease_until '
+                "WHERE jobs.status IN ('done', 'failed') OR jobs.lease_until < excluded.updated",
+                (job_id, question, int(speculative), now, now, self.owner, now + self.lease_s)).rowcount
+        return self.get(job_id), bool(created)
+
+    def update(self, job_id, **fields):
+        fields['updated'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock, self.conn:
+            self.conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def update_owned(self, job_id, **fields):
+        """只更新本 owner 的任务（租约过期后被其他进程重新执行的任务不再由本进程写入），返回是否更新"""
+        fields['updated'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock, self.conn:
+            return bool(self.conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ? AND owner = ?',
+                                          (*fields.values(), job_id, self.owner)).rowcount)
+
+    def renew(self, job_ids):
+        """为本 owner 未完成的任务续约"""
+        if not job_ids:
+            return
+        placeholders = ', '.join('?' for _ in job_ids)
+        with self._lock, self.conn:
+            self.conn.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN ('pending', 'running') "
+                f'AND id IN ({placeholders})', (time.time() + self.lease_s, self.owner, *job_ids))
+
+    def purge(self, ttl_s):
+        """删除过期的已完成任务，返回其中从未被取用的推测性任务数"""
+        cutoff = time.time() - ttl_s
+        with self._lock, self.conn:
+            wasted = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('done', 'failed') AND updated < ? "
+                'AND speculative = 1 AND attached = 0', (cutoff,)).fetchone()[0]
+            self.conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (cutoff,))
+        return wasted
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+
+class JobQueue:
+    """有界线程池执行任务，按问题去重；fn(question, speculative) 返回答案文本，出错时抛出异常"""
+
+    def __init__(self, fn, store, max_workers, max_pending, max_speculative, ttl_s, name='jobs'):
+        self._fn = fn
+        self.store = store
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_speculative = max_speculative
+        self.ttl_s = ttl_s
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._cond = threading.Condition()
+        self._active = {}  # 任务ID -> 是否推测性（本进程中 pending / running 的任务）
+        self._heartbeat = None  # 为 _active 中的任务续约的线程，第一次提交时启动
+        self._stats = {'submitted': 0, 'shared': 0, 'rejected': 0, 'done': 0, 'failed': 0,
+                       'prefetch_started': 0, 'prefetch_skipped': 0, 'prefetch_hits': 0,
+                       'prefetch_hits_in_flight': 0, 'prefetch_wasted': 0}
+        self._last_purge = 0.0
+
+    def _purge(self):
+        now = time.monotonic()
+        if now - self._last_purge >= min(60.0, self.ttl_s):
+            self._last_purge = now
+            self._stats['prefetch_wasted'] += self.store.purge(self.ttl_s)
+
+    def submit(self, question, speculative=False, key=None):
+        """提交问题，返回任务；同一问题已有进行中或未过期的任务时直接共享
+
+        进行中的任务包括其他进程中租约有效的任务；
+        key 为去重用的文本（默认为 question 本身），fn 收到的始终是 question 原文；
+        推测性提交在没有空闲名额时返回 None；普通提交在进行中的任务已达上限时抛出 JobQueueFull
+        """
+        job_id = job_id_for(question if key is None else key)
+        with self._cond:
+            self._purge()
+            job = self.store.get(job_id)
+            if job is not None and self._fresh(job):
+                return self._share(job, speculative)
+
+            if speculative:
+                if (sum(self._active.values()) >= self.max_speculative
+                        or len(self._active) >= self.max_workers):
+                    self._stats['prefetch_skipped'] += 1
+                    return None
+                self._stats['prefetch_started'] += 1
+            elif len(self._active) >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise JobQueueFull(f'进行中的任务已达上限（{self.max_pending}）')
+
+            job, created = self.store.create(job_id, question, speculative)
+            if not created:
+                # 其他进程刚刚创建了同一个任务
+                return self._share(job, speculative)
+            self._stats['submitted'] += 1
+            self._active[job_id] = speculative
+            if not speculative:
+                self.store.update(job_id, attached=1)
+            self._start_heartbeat()
+        self._executor.submit(self._run, job_id, question, speculative)
+        return job
+
+    def _fresh(self, job):
+        """任务可以共享：未完成（get 已把租约过期的任务标记为 interrupted），或已完成且未过期"""
+        if job['status'] not in FINISHED:
+            return True
+        return job['status'] == 'done' and time.time() - job['updated'] < self.ttl_s
+
+    def _share(self, job, speculative):
+        if not speculative:
+            self._stats['shared'] += 1
+            self._attach(job)
+        return job
+
+    def _start_heartbeat(self):
+        """调用方需持有 self._cond"""
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._renew_leases, name='jobs-heartbeat', daemon=True)
+            self._heartbeat.start()
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(self.store.lease_s / 3)
+            with self._cond:
+                active = list(self._active)
+            try:
+                self.store.renew(active)
+            except sqlite3.Error as e:
+                print(f"  后台任务续约失败: {str(e)}")
+
+    def _attach(self, job):
+        """用户取用任务结果：推测性任务第一次被取用时计为预取命中"""
+        if job['speculative'] and not job['attached']:
+            self._stats['prefetch_hits'] += 1
+            if job['status'] not in FINISHED:
+                self._stats['prefetch_hits_in_flight'] += 1
+            self.store.update(job['id'], attached=1)
+            job['attached'] = 1
+
+    def _run(self, job_id, question, speculative):
+        self.store.update_owned(job_id, status='running', lease_until=time.time() + self.store.lease_s)
+        try:
+            answer = self._fn(question, speculative)
+            self.store.update_owned(job_id, status='done', answer=answer)
+            outcome = 'done'
+        except Exception as e:
+            print(f"  后台任务 {job_id} 失败: {str(e)}")
+            self.store.update_owned(job_id, status='failed', error=str(e), error_kind=type(e).__name__)
+            outcome = 'failed'
+        with self._cond:
+            self._stats[outcome] += 1
+            self._active.pop(job_id, None)
+            self._cond.notify_all()
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def wait(self, job_id, timeout):
+        """等待任务完成，最多 timeout 秒，返回任务的最新状态（不存在时返回 None）
+
+        本进程的任务完成时立即唤醒；其他进程执行的任务每 WAIT_POLL_S 秒查询一次
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            while True:
+                job = self.store.get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job['status'] in FINISHED or remaining <= 0:
+                    return job
+                self._cond.wait(min(remaining, WAIT_POLL_S))
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['active'] = len(self._active)
+            stats['active_prefetch'] = sum(self._active.values())
+        stats['stored'] = self.store.count()
+        started = stats['prefetch_started']
+        stats['prefetch_hit_rate'] = round(stats['prefetch_hits'] / started, 3) if started else 0.0
+        return stats
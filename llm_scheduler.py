@@ -0,0 +1,299 @@
+"""
+大模型调用调度 - 按服务商跟踪 RPM / TPM 预算，在请求被上游拒绝之前排队或改用其他服务商
+
+每个服务商一个 ProviderLimiter，包含两个令牌桶：
+    requests   每分钟请求数（RPM），每次调用消耗 1
+    tokens     每分钟 token 数（TPM），上游按 prompt + max_tokens 计入限额：发送前按估算的
+               prompt token 数 + max_tokens 预扣，返回后按 usage 中的实际 prompt token 数多退少补
+上游响应头（x-ratelimit-* / anthropic-ratelimit-*）会校正桶的容量与剩余量；
+收到 429 时按 retry-after（没有时按带抖动的指数退避）暂停该服务商，并在截止时间内重试。
+在截止时间前无法获得预算时抛出 RateLimited，由调用方改用下一个服务商或降级。
+"""
+
+import email.utils
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+# 默认限额 (RPM, TPM)，可用环境变量 <服务商>_RPM / <服务商>_TPM 覆盖，运行中由响应头校正
+DEFAULT_LIMITS = {
+    'deepseek': (300, 1000000),
+    'openai': (500, 200000),
+    'claude': (50, 40000),
+}
+
+MAX_RETRIES = 4
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 8.0
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+
+class RateLimited(Exception):
+    """在截止时间前无法获得该服务商的调用预算"""
+
+    def __init__(self, provider, wait_s):
+        super().__init__(f'{provider} 限流（需等待 {wait_s:.1f}s）')
+        self.provider = provider
+        self.wait_s = wait_s
+
+
+def parse_duration(value):
+    """解析 "1s" / "6m0s" / "20ms" / "0.5" 形式的时长（秒）"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers):
+    """读取 retry-after-ms / retry-after（秒数或 HTTP 日期），返回秒"""
+    if not headers:
+        return None
+    millis = headers.get('retry-after-ms')
+    if millis is not None:
+        try:
+            return float(millis) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _reset_seconds(value):
+    """重置时间：时长（OpenAI）或 RFC 3339 时间点（Anthropic）"""
+    seconds = parse_duration(value)
+    if seconds is not None or value is None:
+        return seconds
+    try:
+        return max(0.0, datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() - time.time())
+    except ValueError:
+        return None
+
+
+def _header_int(headers, name):
+    value = headers.get(name)
+    try:
+        return int(float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """每分钟补满 capacity 的令牌桶；余量可以为负（预扣不足时记为欠账）"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """余量足够 amount 还需等待的秒数（超过容量的请求在桶满时放行）"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+    def observe(self, limit, remaining, reset_s, now):
+        """按上游返回的限额 / 剩余量 / 重置时间校正"""
+        self._refill(now)
+        if limit:
+            self.capacity = float(limit)
+            self.rate = limit / 60.0
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+            # 剩余量在 reset_s 后恢复到上限，按此推算的补充速度更慢时以其为准
+            if reset_s and self.capacity > remaining:
+                self.rate = min(self.rate, (self.capacity - remaining) / reset_s)
+
+
+class ProviderLimiter:
+    """单个服务商的 RPM / TPM 预算"""
+
+    # (桶, 限额头, 剩余头, 重置头)
+    HEADER_SETS = (
+        ('requests', 'x-ratelimit-limit-requests', 'x-ratelimit-remaining-requests', 'x-ratelimit-reset-requests'),
+        ('tokens', 'x-ratelimit-limit-tokens', 'x-ratelimit-remaining-tokens', 'x-ratelimit-reset-tokens'),
+        ('requests', 'anthropic-ratelimit-requests-limit', 'anthropic-ratelimit-requests-remaining',
+         'anthropic-ratelimit-requests-reset'),
+        ('tokens', 'anthropic-ratelimit-tokens-limit', 'anthropic-ratelimit-tokens-remaining',
+         'anthropic-ratelimit-tokens-reset'),
+    )
+
+    def __init__(self, provider, rpm, tpm):
+        self.provider = provider
+        self.buckets = {'requests': TokenBucket(rpm), 'tokens': TokenBucket(tpm)}
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'queued': 0, 'queue_wait_ms_total': 0.0,
+                       'upstream_429': 0, 'retries': 0, 'rejected': 0}
+
+    def _wait_time(self, est_tokens, now):
+        return max(self.blocked_until - now,
+                   self.buckets['requests'].wait_time(1, now),
+                   self.buckets['tokens'].wait_time(est_tokens, now))
+
+    def reserve(self, est_tokens, deadline):
+        """等待 RPM / TPM 都有余量后预扣；截止时间前无法获得时抛出 RateLimited（不预扣）"""
+        started = time.monotonic()
+        queued = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._wait_time(est_tokens, now)
+                if wait <= 0:
+                    self.buckets['requests'].take(1)
+                    self.buckets['tokens'].take(est_tokens)
+                    self._stats['calls'] += 1
+                    if queued:
+                        self._stats['queued'] += 1
+                        self._stats['queue_wait_ms_total'] += (now - started) * 1000
+                    return
+                if now + wait > deadline:
+                    self._stats['rejected'] += 1
+                    raise RateLimited(self.provider, wait)
+            queued = True
+            time.sleep(min(wait, 1.0))
+
+    def settle(self, est_tokens, actual_tokens):
+        """按实际用量退还或补扣预扣的 token"""
+        with self._lock:
+            if actual_tokens is None:
+                return
+            bucket = self.buckets['tokens']
+            if actual_tokens < est_tokens:
+                bucket.give_back(est_tokens - actual_tokens)
+            else:
+                bucket.take(actual_tokens - est_tokens)
+
+    def observe_headers(self, headers):
+        if not headers:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for bucket, limit_h, remaining_h, reset_h in self.HEADER_SETS:
+                limit = _header_int(headers, limit_h)
+                remaining = _header_int(headers, remaining_h)
+                if limit is None and remaining is None:
+                    continue
+                self.buckets[bucket].observe(limit, remaining, _reset_seconds(headers.get(reset_h)), now)
+
+    def count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def penalize(self, pause_s):
+        """收到 429：暂停该服务商 pause_s 秒（所有等待中的请求一起推迟）"""
+        with self._lock:
+            self._stats['upstream_429'] += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause_s)
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            stats = dict(self._stats)
+            wait_total = stats.pop('queue_wait_ms_total')
+            stats['avg_queue_wait_ms'] = round(wait_total / stats['queued'], 1) if stats['queued'] else 0.0
+            for name, bucket in self.buckets.items():
+                bucket._refill(now)
+                stats[f'{name}_limit_per_min'] = int(bucket.capacity)
+                stats[f'{name}_available'] = int(bucket.level)
+            stats['blocked_ms'] = max(0, int((self.blocked_until - now) * 1000))
+            return stats
+
+
+def is_rate_limit_error(error):
+    """SDK 抛出的 429 异常（openai.RateLimitError / anthropic.RateLimitError 等）"""
+    return getattr(error, 'status_code', None) == 429
+
+
+def _error_headers(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'headers', None) or {}
+
+
+class LLMScheduler:
+    """按服务商调度大模型调用"""
+
+    def __init__(self, limits=None):
+        self._limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, provider):
+        with self._lock:
+            if provider not in self._limiters:
+                rpm, tpm = self._limits.get(provider, (60, 100000))
+                rpm = int(os.getenv(f'{provider.upper()}_RPM', rpm))
+                tpm = int(os.getenv(f'{provider.upper()}_TPM', tpm))
+                self._limiters[provider] = ProviderLimiter(provider, rpm, tpm)
+            return self._limiters[provider]
+
+    def call(self, provider, fn, est_tokens, deadline):
+        """在预算内调用 fn()，fn 返回 (结果, 响应头, 实际计入限额的token数，即 prompt_tokens + max_tokens)
+
+        429 时暂停该服务商并在截止时间内重试；deadline 为 time.monotonic() 时间点
+        """
+        limiter = self.limiter(provider)
+        attempt = 0
+        while True:
+            limiter.reserve(est_tokens, deadline)
+            try:
+                result, headers, actual_tokens = fn()
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    limiter.settle(est_tokens, 0)
+                    raise
+                headers = _error_headers(e)
+                limiter.settle(est_tokens, 0)
+                limiter.observe_headers(headers)
+                retry_after = parse_retry_after(headers)
+                backoff = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)
+                # 有 retry-after 时在其基础上加少量抖动，避免所有请求同时重试
+                pause = retry_after + random.uniform(0, BACKOFF_BASE_S) if retry_after is not None \
+                    else random.uniform(0, backoff)
+                limiter.penalize(pause)
+                attempt += 1
+                if attempt > MAX_RETRIES or time.monotonic() + pause > deadline:
+                    limiter.count('rejected')
+                    raise RateLimited(provider, pause)
+                limiter.count('retries')
+                continue
+            # 先按实际用量结算，再以上游返回的剩余量为准校正
+            limiter.settle(est_tokens, actual_tokens)
+            limiter.observe_headers(headers)
+            return result
+
+    def snapshot(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.provider: limiter.snapshot() for limiter in limiters}
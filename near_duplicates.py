@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+近重复段落检测 - MinHash + LSH 找出内容几乎相同的段落
+
+OCR 图片中的表格常常与正文中的同一张表重复，文章之间也有转载的段落。近重复段落浪费索引空间、
+在 top-k 中占据多个位置，并让大模型的输入重复。检测方法：
+    shingle     去掉空白与标点后的 5 字符片段
+    MinHash     128 个哈希函数的最小值签名，估计 Jaccard 相似度
+    LSH         16 个 band × 8 行，签名某个 band 相同即为候选（约在 Jaccard 0.7 处陡增）
+    校验        候选对按真实 Jaccard ≥ 阈值确认，并查集合并为簇
+每个簇的代表段落：正文优先于 OCR，其次更长、更靠前的段落。
+构建知识库时近重复段落直接丢弃（build_knowledge_base.py）；对已有知识库运行本脚本生成
+knowledge_db/near_duplicates.json，检索时每个簇最多返回排名最高的一个段落。
+
+用法：
+    python near_duplicates.py                   审计现有知识库，写入簇文件并报告压缩率与 top-3 多样性
+    python near_duplicates.py --threshold 0.8
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import time
+import zlib
+
+SHINGLE_CHARS = 5
+NUM_PERM = 128
+BANDS = 16
+DEFAULT_THRESHOLD = 0.7
+CLUSTERS_NAME = 'near_duplicates.json'
+
+_PRIME = 4294967291  # 小于 2^32 的最大素数：a * x + b 不会溢出 uint64
+_STRIP = re.compile(r'[\W_]+')
+
+
+def shingles(text):
+    normalized = _STRIP.sub('', text)
+    if len(normalized) <= SHINGLE_CHARS:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_CHARS] for i in range(len(normalized) - SHINGLE_CHARS + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """h_i(x) = (a_i * x + b_i) mod p，签名为每个 h_i 在 shingle 哈希上的最小值"""
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        import numpy as np
+
+        rng = random.Random(seed)
+        self._np = np
+        self._a = np.array([rng.randrange(1, _PRIME) for _ in range(num_perm)], dtype=np.uint64)[:, None]
+        self._b = np.array([rng.randrange(0, _PRIME) for _ in range(num_perm)], dtype=np.uint64)[:, None]
+
+    def signature(self, shingle_set):
+        np = self._np
+        if not shingle_set:
+            return np.full(self._a.shape[0], _PRIME, dtype=np.uint64)
+        hashes = np.array([zlib.crc32(s.encode('utf-8')) % _PRIME for s in shingle_set], dtype=np.uint64)
+        return ((self._a * hashes[None, :] + self._b) % _PRIME).min(axis=1)
+
+
+class LSHIndex:
+    """按 band 分桶：两个签名有任一 band 完全相同即为候选"""
+
+    def __init__(self, bands=BANDS):
+        self.bands = bands
+        self._buckets = {}
+
+    def _keys(self, signature):
+        rows = len(signature) // self.bands
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def candidates(self, signature):
+        found = set()
+        for key in self._keys(signature):
+            found.update(self._buckets.get(key, ()))
+        return found
+
+    def insert(self, key, signature):
+        for bucket in self._keys(signature):
+            self._buckets.setdefault(bucket, []).append(key)
+
+
+class NearDuplicateIndex:
+    """构建知识库时逐段检查：与已保留段落近重复时返回其 ID（该段落应丢弃），否则保留并返回 None"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._hasher = MinHasher()
+        self._lsh = LSHIndex()
+        self._shingles = {}
+
+    def add(self, key, text):
+        shingle_set = shingles(text)
+        signature = self._hasher.signature(shingle_set)
+        for other in self._lsh.candidates(signature):
+            if jaccard(shingle_set, self._shingles[other]) >= self.threshold:
+                return other
+        self._lsh.insert(key, signature)
+        self._shingles[key] = shingle_set
+        return None
+
+
+def _representative_rank(position, doc, meta):
+    """代表段落的排序键：正文优先，其次更长、更靠前"""
+    return (meta.get('type') == 'ocr', -len(doc), position)
+
+
+def find_clusters(ids, documents, metadatas, threshold=DEFAULT_THRESHOLD):
+    """返回近重复簇列表（至少两个段落），每个簇的第一个 ID 为代表段落"""
+    hasher = MinHasher()
+    lsh = LSHIndex()
+    shingle_sets = [shingles(doc) for doc in documents]
+    parent = list(range(len(ids)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, shingle_set in enumerate(shingle_sets):
+        signature = hasher.signature(shingle_set)
+        for j in lsh.candidates(signature):
+            if find(i) != find(j) and jaccard(shingle_set, shingle_sets[j]) >= threshold:
+                parent[find(i)] = find(j)
+        lsh.insert(i, signature)
+
+    groups = {}
+    for i in range(len(ids)):
+        groups.setdefault(find(i), []).append(i)
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda i: _representative_rank(i, documents[i], metadatas[i]))
+        clusters.append([ids[i] for i in members])
+    return clusters
+
+
+def save_clusters(path, clusters, chunk_count, threshold):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'threshold': threshold,
+            'chunk_count': chunk_count,
+            'clusters': clusters,
+        }, f, ensure_ascii=False, indent=2)
+
+
+def load_cluster_map(path):
+    """段落 ID -> 所在簇的代表段落 ID（只包含近重复簇中的段落）；文件不存在时返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {member: cluster[0] for cluster in data.get('clusters', []) for member in cluster}
+
+
+def top3_diversity(qa, questions, cluster_map):
+    """每个问题 top-3 中不同簇的数量（均值）与含近重复的问题数"""
+    distinct = []
+    with_duplicates = 0
+    for question in questions:
+        contexts = qa.query_knowledge_base_with_status(question, top_k=3)['contexts']
+        if not contexts:
+            continue
+        clusters = {cluster_map.get(ctx['id'], ctx['id']) for ctx in contexts}
+        distinct.append(len(clusters))
+        with_duplicates += len(clusters) < len(contexts)
+    return (sum(distinct) / len(distinct) if distinct else 0.0), with_duplicates
+
+
+def main():
+    import benchmark
+    import qa_service_redesign as qa
+
+    parser = argparse.ArgumentParser(description='近重复段落审计')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Jaccard 相似度阈值')
+    args = parser.parse_args()
+
+    qa.init_services()
+    docs = qa.collection.get()
+    started = time.perf_counter()
+    clusters = find_clusters(docs['ids'], docs['documents'], docs['metadatas'], args.threshold)
+    elapsed = time.perf_counter() - started
+    save_clusters(qa.NEAR_DUP_PATH, clusters, len(docs['ids']), args.threshold)
+
+    types = dict(zip(docs['ids'], (m.get('type', '') for m in docs['metadatas'])))
+    duplicates = sum(len(c) - 1 for c in clusters)
+    mixed = sum(1 for c in clusters if len({types[i] for i in c}) > 1)
+    total = len(docs['ids'])
+    print(f"✓ {total} 个段落中发现 {len(clusters)} 个近重复簇（其中 {mixed} 个同时包含 OCR 与正文），"
+          f"用时 {elapsed:.1f}s，已写入 {qa.NEAR_DUP_PATH}")
+    print(f"  每簇只保留一个时可去掉 {duplicates} 个段落（{duplicates / total * 100 if total else 0:.1f}%）")
+
+    cluster_map = load_cluster_map(qa.NEAR_DUP_PATH)
+    qa.retriever.cache = None  # 缓存的检索结果对应启动时的近重复设置
+    qa.retriever.duplicate_clusters = {}
+    before, before_dup = top3_diversity(qa, benchmark.BENCHMARK_QUESTIONS, cluster_map)
+    qa.retriever.duplicate_clusters = cluster_map
+    after, after_dup = top3_diversity(qa, benchmark.BENCHMARK_QUESTIONS, cluster_map)
+    print(f"  top-3 中不同簇的平均数: {before:.2f} → {after:.2f}；"
+          f"top-3 含近重复的问题: {before_dup} → {after_dup}")
+
+
+if __name__ == '__main__':
+    main()
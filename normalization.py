@@ -0,0 +1,118 @@
+"""
+问题规范化 - 每个请求执行一次，结果用于国家识别、HR术语提取、分词以及所有缓存键
+
+同一个问题的不同写法规范化后完全相同（共享同一份缓存）：
+    NFKC        全角字母 / 数字 / 标点转为半角，兼容字符转为标准字符
+    繁→简       繁体字转为简体（安装 opencc 时使用 opencc，否则使用内置的常用字表），
+                并把港台常用的国名 / 用语改为大陆用法（纽西兰→新西兰、特休→年假 ...）
+    英文国名    UK / united kingdom / Germany ... 替换为标准中文国名（US 只识别大写，避免与单词 us 混淆）
+    大小写      其余拉丁字母转为小写（casefold）
+    标点空白    连续空白合并为一个空格，中文之间的空白去掉，重复标点合并，去掉结尾的问号 / 句号等
+规范化结果按原始问题缓存（lru_cache），同一请求中多次调用只计算一次。
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+try:
+    import opencc
+    _opencc = opencc.OpenCC('t2s')
+except ImportError:  # opencc 为可选依赖，未安装时使用内置字表
+    _opencc = None
+
+# 内置繁简对照：覆盖国名、HR 术语与常见疑问用语中的繁体字（一对一且没有歧义的字）
+_TRADITIONAL = (
+    '國蘭亞爾聯羅馬來賓韓臺灣紐麥烏茲別庫薩達義盧脫魯倫臘維麼為沒嗎幾與這還們員須請問題週於關將當後裡種樣'
+    '總額計給發應該條歲婦兩場務實際內幣鎊單據錢間決從簡體學習歷經驗說話讀寫權責帶態轉換續約屆滿讓辦處罰違紀'
+    '錄類減設項點開門網線頁電腦車費過進運邊選認識詢諮詳細課級紅結構變盡監護衛術專屬絡係統組織劃歸檢彈輪曆慶'
+    '傳喪禮賀撫僑駐華語領導團隊戶滯糾紛爭議訴訟審師顧繳納優補貼獎懲階層鐘頭兌匯漲價貨銀帳號碼現餘憑紙郵訂'
+    '範製則綱執災殘遺親嬰園練講鑑評擇資試勞動僱傭險稅產兒醫療養銷訓績遠靈業規賠償競協會視傷簽證許辭離職個時'
+    '長節調終標準數區對'
+)
+_SIMPLIFIED = (
+    '国兰亚尔联罗马来宾韩台湾纽麦乌兹别库萨达义卢脱鲁伦腊维么为没吗几与这还们员须请问题周于关将当后里种样'
+    '总额计给发应该条岁妇两场务实际内币镑单据钱间决从简体学习历经验说话读写权责带态转换续约届满让办处罚违纪'
+    '录类减设项点开门网线页电脑车费过进运边选认识询咨详细课级红结构变尽监护卫术专属络系统组织划归检弹轮历庆'
+    '传丧礼贺抚侨驻华语领导团队户滞纠纷争议诉讼审师顾缴纳优补贴奖惩阶层钟头兑汇涨价货银账号码现余凭纸邮订'
+    '范制则纲执灾残遗亲婴园练讲鉴评择资试劳动雇佣险税产儿医疗养销训绩远灵业规赔偿竞协会视伤签证许辞离职个时'
+    '长节调终标准数区对'
+)
+_T2S = str.maketrans(_TRADITIONAL, _SIMPLIFIED)
+
+# 港台用语 -> 大陆用语（在繁→简之后替换）
+REGIONAL_TERMS = {
+    '义大利': '意大利',
+    '纽西兰': '新西兰',
+    '沙乌地阿拉伯': '沙特阿拉伯',
+    '卡达': '卡塔尔',
+    '迦纳': '加纳',
+    '多明尼加': '多米尼加',
+    '奈及利亚': '尼日利亚',
+    '哥斯大黎加': '哥斯达黎加',
+    '马尔他': '马耳他',
+    '特休': '年假',
+    '资遣费': '遣散费',
+}
+
+# 英文国名（小写）-> 标准中文国名；包括部分未收录的国家，使其能被识别为"不在支持列表中"
+ENGLISH_COUNTRY_NAMES = {
+    'uk': '英国', 'united kingdom': '英国', 'great britain': '英国', 'britain': '英国', 'england': '英国',
+    'usa': '美国', 'united states': '美国', 'united states of america': '美国', 'america': '美国',
+    'germany': '德国', 'deutschland': '德国', 'france': '法国', 'japan': '日本',
+    'korea': '韩国', 'south korea': '韩国', 'north korea': '朝鲜', 'singapore': '新加坡',
+    'hong kong': '中国香港', 'taiwan': '中国台湾', 'brazil': '巴西', 'argentina': '阿根廷', 'mexico': '墨西哥',
+    'canada': '加拿大', 'australia': '澳大利亚', 'new zealand': '新西兰', 'india': '印度', 'thailand': '泰国',
+    'vietnam': '越南', 'viet nam': '越南', 'indonesia': '印度尼西亚', 'philippines': '菲律宾',
+    'malaysia': '马来西亚', 'turkey': '土耳其', 'türkiye': '土耳其', 'saudi arabia': '沙特阿拉伯',
+    'uae': '阿联酋', 'united arab emirates': '阿联酋', 'italy': '意大利', 'spain': '西班牙',
+    'netherlands': '荷兰', 'holland': '荷兰', 'belgium': '比利时', 'switzerland': '瑞士', 'sweden': '瑞典',
+    'denmark': '丹麦', 'norway': '挪威', 'poland': '波兰', 'russia': '俄罗斯', 'south africa': '南非',
+    'egypt': '埃及', 'israel': '以色列', 'qatar': '卡塔尔', 'kazakhstan': '哈萨克斯坦',
+    'uzbekistan': '乌兹别克斯坦', 'kyrgyzstan': '吉尔吉斯斯坦', 'tajikistan': '塔吉克斯坦',
+    'turkmenistan': '土库曼斯坦', 'ghana': '加纳', 'hungary': '匈牙利', 'luxembourg': '卢森堡',
+    'bulgaria': '保加利亚', 'latvia': '拉脱维亚', 'slovakia': '斯洛伐克', 'peru': '秘鲁', 'romania': '罗马尼亚',
+    'algeria': '阿尔及利亚', 'dominican republic': '多米尼加共和国', 'nigeria': '尼日利亚',
+    'colombia': '哥伦比亚', 'costa rica': '哥斯达黎加', 'greece': '希腊', 'malta': '马耳他',
+    'pakistan': '巴基斯坦', 'china': '中国', 'iceland': '冰岛', 'chile': '智利', 'ireland': '爱尔兰',
+    'portugal': '葡萄牙', 'austria': '奥地利', 'finland': '芬兰',
+}
+# 同时是常用英文单词的国家简称只识别大写
+CASE_SENSITIVE_COUNTRY_NAMES = {'US': '美国'}
+
+_ENGLISH_NAMES = re.compile(
+    r'(?<![a-z])(' + '|'.join(re.escape(name) for name in sorted(ENGLISH_COUNTRY_NAMES, key=len, reverse=True))
+    + r')(?![a-z])', re.IGNORECASE)
+_CASE_SENSITIVE_NAMES = re.compile(
+    r'(?<![A-Za-z])(' + '|'.join(map(re.escape, CASE_SENSITIVE_COUNTRY_NAMES)) + r')(?![A-Za-z])')
+_REGIONAL_TERMS = re.compile('|'.join(sorted(map(re.escape, REGIONAL_TERMS), key=len, reverse=True)))
+_CJK = r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff]'
+_SPACES = re.compile(r'\s+')
+_CJK_GAP = re.compile(rf'(?<={_CJK}) (?={_CJK})|(?<={_CJK}) (?=[^\w\s])|(?<=[^\w\s]) (?={_CJK})')
+_REPEATED_PUNCTUATION = re.compile(r'([^\w\s])\1+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s?？!！。.~～…]+$')
+
+
+def to_simplified(text):
+    """繁体转简体，并替换港台用语"""
+    text = _opencc.convert(text) if _opencc is not None else text.translate(_T2S)
+    return _REGIONAL_TERMS.sub(lambda m: REGIONAL_TERMS[m.group(0)], text)
+
+
+def map_country_names(text):
+    """英文国名替换为标准中文国名"""
+    text = _CASE_SENSITIVE_NAMES.sub(lambda m: CASE_SENSITIVE_COUNTRY_NAMES[m.group(1)], text)
+    return _ENGLISH_NAMES.sub(lambda m: ENGLISH_COUNTRY_NAMES[m.group(1).casefold()], text)
+
+
+@lru_cache(maxsize=4096)
+def normalize(question):
+    """规范化问题（见模块说明）；空问题返回空字符串"""
+    text = unicodedata.normalize('NFKC', question or '')
+    text = to_simplified(text)
+    text = map_country_names(text)
+    text = text.casefold()
+    text = _SPACES.sub(' ', text).strip()
+    text = _CJK_GAP.sub('', text)
+    text = _REPEATED_PUNCTUATION.sub(r'\1', text)
+    return _TRAILING_PUNCTUATION.sub('', text)
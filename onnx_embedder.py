@@ -0,0 +1,198 @@
+"""
+ONNX 向量推理 - 每个进程一个推理会话，限制线程数，并把并发到达的单条查询合并成小批量推理
+
+Chroma 自带的 ONNXMiniLM_L6_V2 使用 onnxruntime 的默认设置：intra-op 线程数等于 CPU 核数，
+多 worker 部署时各进程互相争抢；每条文本固定补齐到 256 个 token，单条查询也无法与其他请求合批。
+OnnxEmbedder 使用同一模型文件与分词器、同样的均值池化与归一化，输出与之一致，区别在于：
+    会话     每个进程一个（shared_embedder），第一次使用时创建
+    线程     intra-op / inter-op 线程数可配置（EMBED_INTRA_OP_THREADS / EMBED_INTER_OP_THREADS）
+    补齐     按批内最长的文本补齐，而不是固定 256
+    合批     并发到达的查询在 EMBED_BATCH_WINDOW_MS 毫秒内合并为一批（最多 EMBED_MAX_BATCH 条）；
+             推理进行中到达的查询在下一批一起处理
+    量化     EMBED_QUANTIZED=1 时使用 int8 动态量化模型（model.int8.onnx，由 quantize_model 生成），
+             与建库时的 fp32 向量有微小偏差
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+MAX_LENGTH = 256  # 与 sentence-transformers / Chroma 的 all-MiniLM-L6-v2 一致
+QUANTIZED_MODEL = 'model.int8.onnx'
+
+
+def quantize_model(model_dir):
+    """生成 int8 动态量化模型，返回其路径"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    target = os.path.join(model_dir, QUANTIZED_MODEL)
+    quantize_dynamic(os.path.join(model_dir, 'model.onnx'), target, weight_type=QuantType.QInt8)
+    return target
+
+
+class MicroBatcher:
+    """单线程处理队列：等待 window_s 收集并发请求后一次调用 fn(items) -> results"""
+
+    def __init__(self, fn, max_batch, window_s, name='micro-batch'):
+        self._fn = fn
+        self.max_batch = max_batch
+        self.window_s = window_s
+        self._queue = queue.Queue()
+        self._stats = {'batches': 0, 'items': 0, 'largest_batch': 0}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._loop, name=name, daemon=True).start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window_s
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self._fn([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['items'] += len(batch)
+                self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_batch'] = round(stats['items'] / stats['batches'], 2) if stats['batches'] else 0.0
+        return stats
+
+
+class OnnxEmbedder:
+    """all-MiniLM-L6-v2 的 ONNX 推理，可直接作为 Chroma 的 embedding_function 使用
+
+    batch_window_ms 为 None 时不合批（离线批量向量化时使用）
+    """
+
+    def __init__(self, model_dir, intra_op_threads=1, inter_op_threads=1, quantized=False,
+                 max_batch=32, batch_window_ms=2.0):
+        self.model_dir = model_dir
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.quantized = quantized
+        self.max_batch = max_batch
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+        self._lock = threading.Lock()
+        self._batcher = None
+        if batch_window_ms is not None:
+            self._batcher = MicroBatcher(lambda texts: self.embed(texts).tolist(), max_batch,
+                                         batch_window_ms / 1000, 'embed-batch')
+
+    def _load(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+
+            tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, 'tokenizer.json'))
+            tokenizer.enable_truncation(max_length=MAX_LENGTH)
+            tokenizer.enable_padding(pad_id=0, pad_token='[PAD]')
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.intra_op_threads
+            options.inter_op_num_threads = self.inter_op_threads
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            model_file = QUANTIZED_MODEL if self.quantized else 'model.onnx'
+            path = os.path.join(self.model_dir, model_file)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f'模型文件不存在: {path}' + (
+                    '（可用 onnx_embedder.quantize_model 生成）' if self.quantized else ''))
+            session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+            self._input_names = tuple(i.name for i in session.get_inputs())
+            self._tokenizer = tokenizer
+            self._session = session
+
+    def _forward(self, texts):
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feed = {'input_ids': input_ids, 'attention_mask': attention_mask,
+                'token_type_ids': np.zeros_like(input_ids)}
+        hidden = self._session.run(None, {name: feed[name] for name in self._input_names})[0]
+
+        # 按 attention mask 均值池化后归一化
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        norms[norms == 0] = 1e-12
+        return (pooled / norms).astype(np.float32)
+
+    def embed(self, texts):
+        """直接推理（按 max_batch 分批），返回 (n, dim) 的 float32 数组"""
+        self._load()
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate([self._forward(texts[i:i + self.max_batch])
+                               for i in range(0, len(texts), self.max_batch)])
+
+    def __call__(self, input):
+        texts = list(input)
+        # 单条查询经合批线程与其他并发查询一起推理；批量文本直接推理
+        if self._batcher is not None and len(texts) == 1:
+            return [self._batcher.submit(texts[0])]
+        return self.embed(texts).tolist()
+
+    def snapshot(self):
+        stats = {
+            'intra_op_threads': self.intra_op_threads,
+            'inter_op_threads': self.inter_op_threads,
+            'quantized': self.quantized,
+            'loaded': self._session is not None,
+        }
+        if self._batcher is not None:
+            stats['batching'] = self._batcher.snapshot()
+        return stats
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_embedder(model_dir):
+    """进程内共享的 OnnxEmbedder（按环境变量配置）"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            window = float(os.getenv('EMBED_BATCH_WINDOW_MS', '2'))
+            _shared = OnnxEmbedder(
+                model_dir,
+                intra_op_threads=int(os.getenv('EMBED_INTRA_OP_THREADS', '1')),
+                inter_op_threads=int(os.getenv('EMBED_INTER_OP_THREADS', '1')),
+                quantized=os.getenv('EMBED_QUANTIZED', '0') == '1',
+                max_batch=int(os.getenv('EMBED_MAX_BATCH', '32')),
+                batch_window_ms=window if window >= 0 else None,
+            )
+        return _shared
@@ -4,16 +4,37 @@
 绿色主色调 + 出海元素 + 高级感 + 科技感
 """
 
-from flask import Flask, request, jsonify, render_template_string
+import startup
+startup.profile.start_import_timing()
+
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import chromadb
-from chromadb.utils import embedding_functions
-from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+import functools
+import hashlib
+import json
 import os
+import threading
+import time
 from dotenv import load_dotenv
-import anthropic
-import jieba
-from openai import OpenAI
+import fact_table
+import near_duplicates
+import context_packing
+import static_assets
+import http_utils
+import admission
+import llm_scheduler
+import jobs
+import embeddings
+import shared_cache
+import answer_invalidation
+from retriever import (
+    RETRIEVAL_MODES, DeadlineExceeded, Retriever, RetrieverConfig, cut_words,
+    extract_hr_terms, extract_keywords, find_fictional_keyword, normalize_question, resolve_countries,
+)
+
+# chromadb、jieba 与服务商 SDK 导入较慢：chromadb / jieba 在后台加载知识库时导入，
+# 服务商 SDK 在第一次调用该服务商时才导入（未配置密钥的服务商从不导入）
+startup.profile.stop_import_timing()
 
 # 设置 Transformers 离线模式以使用本地缓存的模型
 os.environ['TRANSFORMERS_OFFLINE'] = '1'
@@ -21,56 +42,279 @@ os.environ['HF_DATASETS_OFFLINE'] = '1'
 
 load_dotenv(override=True)
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
 # 配置
 DB_PATH = "knowledge_db"
 COLLECTION_NAME = "country_employment_guides"
+FACT_TABLE_PATH = os.path.join(DB_PATH, "fact_table.json")  # 由 fact_table.py 离线生成
+NEAR_DUP_PATH = os.path.join(DB_PATH, near_duplicates.CLUSTERS_NAME)  # 由 near_duplicates.py 离线生成
+# 检索结果中每个近重复簇只保留排名最高的段落（NEAR_DUP_COLLAPSE=0 关闭）
+NEAR_DUP_COLLAPSE = os.getenv('NEAR_DUP_COLLAPSE', '1') != '0'
+
+# 检索模式：lexical（关键词评分 + 向量补充，串行）| hybrid（关键词与向量并行 + RRF融合），见 retriever.py
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'lexical')
+RETRIEVAL_WORKERS = int(os.getenv('RETRIEVAL_WORKERS', '8'))
+COMPARISON_TOP_K = int(os.getenv('COMPARISON_TOP_K', '2'))  # 多国对比时每个国家取的段落数
+
+# 上下文压缩：调用大模型前只保留相关句子，并控制在 token 预算内（CONTEXT_PACKING=0 关闭）
+# 压缩结果随问题变化，放在缓存断点之后（只有系统指令命中前缀缓存）；关闭时完整检索内容可被缓存
+CONTEXT_PACKING = os.getenv('CONTEXT_PACKING', '1') != '0'
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1200'))
+# 按问题类型选择 max_tokens：单值查询答案很短，多国对比需要按国家分别展开
+MAX_TOKENS_BY_TYPE = {'lookup': 600, 'general': 1200, 'comparison': 2000}
+
+# 响应中 sources 的形式：full（完整段落，兼容旧客户端）| compact（段落 ID + 短摘录，全文按需从 /api/chunk/<id> 获取）
+SOURCE_MODES = ('full', 'compact')
+SOURCE_EXCERPT_CHARS = 120
+
+# GET /api/ask 的缓存策略：同一知识库版本下答案可共享，浏览器缓存 10 分钟，CDN / 反向代理缓存 1 天
+ASK_CACHE_CONTROL = os.getenv('ASK_CACHE_CONTROL', 'public, max-age=600, s-maxage=86400')
+
+# 准入控制：每个接口同时调用大模型的请求数、排队上限与最长排队时间（毫秒）
+# /api/ask 排不上时降级为本地抽取式答案，/api/deepseek 排不上时返回 503
+ASK_LLM_CONCURRENCY = int(os.getenv('ASK_LLM_CONCURRENCY', '4'))
+ASK_LLM_QUEUE = int(os.getenv('ASK_LLM_QUEUE', '16'))
+ASK_LLM_MAX_WAIT_MS = int(os.getenv('ASK_LLM_MAX_WAIT_MS', '2000'))
+DEEPSEEK_CONCURRENCY = int(os.getenv('DEEPSEEK_CONCURRENCY', '2'))
+DEEPSEEK_QUEUE = int(os.getenv('DEEPSEEK_QUEUE', '8'))
+DEEPSEEK_MAX_WAIT_MS = int(os.getenv('DEEPSEEK_MAX_WAIT_MS', '5000'))
+
+# 大模型服务商：每次调用在 LLM_DEADLINE_S 秒内按 RPM / TPM 预算排队、遇 429 重试（见 llm_scheduler.py）
+PROVIDER_KEYS = (('deepseek', 'DEEPSEEK_API_KEY'), ('openai', 'OPENAI_API_KEY'), ('claude', 'ANTHROPIC_API_KEY'))
+PROVIDER_LABELS = {'deepseek': 'DeepSeek', 'openai': 'OpenAI', 'claude': 'Claude'}
+DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
+LLM_DEADLINE_S = float(os.getenv('LLM_DEADLINE_S', '30'))
+
+# 请求截止时间：/api/ask 从收到请求起的总预算（毫秒），可用请求头 X-Request-Deadline-Ms 覆盖（不超过上限）
+# 剩余时间不足时跳过可选工作：向量补充 / hybrid 向量分支，以及大模型生成（改用抽取式答案）
+REQUEST_DEADLINE_MS = int(os.getenv('REQUEST_DEADLINE_MS', '20000'))
+MAX_REQUEST_DEADLINE_MS = int(os.getenv('MAX_REQUEST_DEADLINE_MS', '60000'))
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+SUPPLEMENT_MIN_BUDGET_MS = 500
+LLM_MIN_BUDGET_MS = 2000
+
+# DeepSeek 联网搜索以后台任务执行（见 jobs.py）：提交后立即返回任务ID，客户端轮询或通过 SSE 等待结果
+# 结果写入 DEEPSEEK_JOB_DB 并保留 DEEPSEEK_JOB_TTL_S 秒；进行中的任务超过 DEEPSEEK_JOB_QUEUE 个时返回 503
+DEEPSEEK_JOB_DB = os.getenv('DEEPSEEK_JOB_DB', 'deepseek_jobs.sqlite3')
+DEEPSEEK_JOB_WORKERS = int(os.getenv('DEEPSEEK_JOB_WORKERS', '4'))
+DEEPSEEK_JOB_QUEUE = int(os.getenv('DEEPSEEK_JOB_QUEUE', '32'))
+DEEPSEEK_JOB_TTL_S = int(os.getenv('DEEPSEEK_JOB_TTL_S', '3600'))
+SSE_HEARTBEAT_S = 15
+
+# 推测性预取：知识库没有答案时提前提交联网搜索任务，用户点击按钮时直接取用
+# 默认关闭（用户不点击时是额外的调用费用）；同时进行的预取任务不超过 PREFETCH_CONCURRENCY 个
+DEEPSEEK_PREFETCH = os.getenv('DEEPSEEK_PREFETCH', '0') == '1'
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', '2'))
+
+# 知识库更新后失效的热门答案在后台重新生成（见 answer_invalidation.py）：每分钟最多几个、最多排队几个、
+# 至少被缓存命中过几次；REGENERATE_PER_MIN=0 时不重新生成
+REGENERATE_PER_MIN = float(os.getenv('REGENERATE_PER_MIN', '6'))
+REGENERATE_MAX_PENDING = int(os.getenv('REGENERATE_MAX_PENDING', '50'))
+REGENERATE_MIN_HITS = int(os.getenv('REGENERATE_MIN_HITS', '1'))
+NOT_FOUND_STATUSES = ('no_country', 'no_content', 'irrelevant', 'no_results')
 
 # 初始化
 client = None
-collection = None
-claude_client = None
+collection = None  # 知识库加载完成前为 None，/api/ask 返回 503
+retriever = None
+embedding_manifest = None
+query_embedder = None
+startup_state = {'status': 'starting', 'error': None}  # 'starting' | 'ready' | 'failed'
+STARTUP_RETRY_AFTER_S = 2
+_provider_clients = {}
+_provider_clients_lock = threading.Lock()
+fact_index = fact_table.FactIndex()
+kb_version = 'unknown'          # 知识库版本标签（X-KB-Version、/api/metrics；可由 KB_VERSION 指定）
+kb_content_version = 'unknown'  # 由段落内容指纹计算的版本，用于 ETag 与检索缓存的键
+landing_assets = static_assets.StaticAssets()
+ask_admission = admission.AdmissionController(
+    '/api/ask', ASK_LLM_CONCURRENCY, ASK_LLM_QUEUE, ASK_LLM_MAX_WAIT_MS / 1000)
+deepseek_admission = admission.AdmissionController(
+    '/api/deepseek', DEEPSEEK_CONCURRENCY, DEEPSEEK_QUEUE, DEEPSEEK_MAX_WAIT_MS / 1000)
+provider_scheduler = llm_scheduler.LLMScheduler()
+# 查询向量、检索结果与答案的共享缓存（后端由 CACHE_BACKEND 选择，见 shared_cache.py）
+caches = shared_cache.from_env()
+answer_deps = answer_invalidation.AnswerDependencies(caches)
+answer_regenerator = answer_invalidation.Regenerator(
+    lambda question, retrieval_mode: regenerate_answer(question, retrieval_mode),
+    REGENERATE_PER_MIN, REGENERATE_MAX_PENDING, REGENERATE_MIN_HITS)
+deepseek_jobs = jobs.JobQueue(
+    lambda question, speculative: run_deepseek_job(question, speculative), jobs.JobStore(DEEPSEEK_JOB_DB),
+    DEEPSEEK_JOB_WORKERS, DEEPSEEK_JOB_QUEUE, PREFETCH_CONCURRENCY, DEEPSEEK_JOB_TTL_S, 'deepseek-job')
 
 def init_services():
-    """初始化服务"""
-    global client, collection, claude_client
+    """初始化服务（加载知识库、事实表与分词词典；collection 最后赋值，赋值后即视为就绪）"""
+    global client, collection, retriever, fact_index, kb_version, kb_content_version, embedding_manifest, query_embedder
+    profile = startup.profile
 
     # 初始化ChromaDB
-    client = chromadb.PersistentClient(path=DB_PATH)
-
-    # 使用与构建时相同的embedding函数
-    openai_key = os.getenv('OPENAI_API_KEY')
-    if openai_key:
-        embedding_func = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=openai_key,
-            model_name="text-embedding-3-small"
-        )
+    with profile.phase('导入 chromadb'):
+        chromadb = profile.lazy_import('chromadb')
+        profile.lazy_import('chromadb.utils.embedding_functions')
+
+    # 查询向量使用与构建时相同的模型（见 embeddings.py），不一致时抛出 EmbeddingMismatch，服务不会就绪
+    with profile.phase('校验向量模型'):
+        query_embedder, embedding_manifest = embeddings.query_embedding_function(DB_PATH)
+        query_embedder = embeddings.CachedEmbeddingFunction(
+            query_embedder, caches.namespace('embedding'), embedding_manifest['model'])
+    print(f"✓ 向量模型: {embedding_manifest['model']}（{embedding_manifest['dimension']} 维）")
+
+    with profile.phase('打开向量库'):
+        client = chromadb.PersistentClient(path=DB_PATH)
+        try:
+            kb_collection = client.get_collection(
+                name=COLLECTION_NAME,
+                embedding_function=query_embedder
+            )
+        except Exception as e:
+            print(f"  警告: 获取集合失败 ({e})，尝试创建新集合")
+            kb_collection = client.create_collection(
+                name=COLLECTION_NAME,
+                embedding_function=query_embedder
+            )
+
+    # 知识库版本：段落 ID 与内容指纹的摘要，用于答案的 ETag 与缓存键；
+    # 环境变量 KB_VERSION 只替换对外展示的版本标签，知识库内容变化时缓存照样失效
+    with profile.phase('计算知识库版本'):
+        fingerprints = answer_invalidation.chunk_fingerprints(kb_collection)
+        kb_content_version = answer_invalidation.version_of(fingerprints)
+        kb_version = os.getenv('KB_VERSION') or kb_content_version
+    print(f"✓ 知识库版本: {kb_version}")
+
+    # 知识库更新后只让用到变更段落的缓存答案失效
+    with profile.phase('同步答案缓存'):
+        changed, invalidated = answer_deps.sync(kb_version, fingerprints)
+    if changed:
+        print(f"✓ 知识库有 {changed} 个段落变更，{len(invalidated)} 个缓存答案已失效")
+
+    # 加载结构化事实表（单值查询快速通道）
+    with profile.phase('加载事实表'):
+        fact_index = fact_table.load_fact_index(FACT_TABLE_PATH)
+    if len(fact_index):
+        print(f"✓ 事实表已加载: {len(fact_index)} 条")
     else:
-        # 使用 ONNX 版本，不需要 sentence-transformers
-        embedding_func = ONNXMiniLM_L6_V2()
-
-    try:
-        collection = client.get_collection(
-            name=COLLECTION_NAME,
-            embedding_function=embedding_func
-        )
-    except Exception as e:
-        print(f"  警告: 获取集合失败 ({e})，尝试创建新集合")
-        collection = client.create_collection(
-            name=COLLECTION_NAME,
-            embedding_function=embedding_func
-        )
-
-    # 初始化Claude
-    claude_client = anthropic.Anthropic(
-        api_key=os.getenv('ANTHROPIC_API_KEY')
-    )
-
+        print("  提示: 未找到事实表，单值查询快速通道关闭（可运行 python fact_table.py 生成）")
+
+    duplicate_clusters = {}  # 段落 ID -> 近重复簇代表段落 ID
+    if NEAR_DUP_COLLAPSE:
+        with profile.phase('加载近重复簇'):
+            duplicate_clusters = near_duplicates.load_cluster_map(NEAR_DUP_PATH)
+        if duplicate_clusters:
+            print(f"✓ 近重复簇已加载: {len(set(duplicate_clusters.values()))} 个簇（{len(duplicate_clusters)} 个段落）")
+
+    # 分词词典在第一次分词时才加载（约 1 秒），提前加载避免第一个问题变慢
+    with profile.phase('加载分词词典'):
+        profile.lazy_import('jieba').initialize()
+
+    retriever = Retriever(kb_collection, retriever_config(), duplicate_clusters,
+                          cache=caches.namespace('retrieval'), version=kb_content_version)
+    collection = kb_collection
+    startup_state.update(status='ready', error=None)
+    answer_regenerator.submit(invalidated)
+    profile.mark_ready()
     print("✓ 服务初始化完成")
+    profile.print_report()
+
+
+def retriever_config():
+    """按环境变量生成检索参数"""
+    return RetrieverConfig(mode=RETRIEVAL_MODE, comparison_top_k=COMPARISON_TOP_K,
+                           supplement_min_budget_ms=SUPPLEMENT_MIN_BUDGET_MS, workers=RETRIEVAL_WORKERS)
+
+
+def init_services_in_background():
+    """在后台线程初始化服务：首页与静态资源立即可用，/api/ask 在就绪前返回 503"""
+    def run():
+        try:
+            init_services()
+        except Exception as e:
+            startup_state.update(status='failed', error=str(e))
+            print(f"\n✗ 初始化失败: {str(e)}")
+            print("  请确保已运行: python build_knowledge_base.py")
+
+    thread = threading.Thread(target=run, name='init-services', daemon=True)
+    thread.start()
+    return thread
+
+
+def services_ready():
+  return collection is not None
+
+
+def requires_ready(view):
+  """知识库加载完成前返回 503（带 Retry-After），客户端稍后重试"""
+  @functools.wraps(view)
+  def wrapper(*args, **kwargs):
+      if not services_ready():
+          failed = startup_state['status'] == 'failed'
+          response = jsonify({
+              'error': '服务初始化失败' if failed else '知识库加载中，请稍后再试',
+              'loading': not failed,
+              'startup': startup_state['status']
+          })
+          if not failed:
+              response.headers['Retry-After'] = str(STARTUP_RETRY_AFTER_S)
+          return response, 503
+      return view(*args, **kwargs)
+  return wrapper
+
+
+def provider_client(provider):
+  """服务商 SDK 客户端：第一次调用时导入 SDK 并创建，之后复用（连接池）"""
+  with _provider_clients_lock:
+      if provider not in _provider_clients:
+          if provider == 'claude':
+              anthropic = startup.profile.lazy_import('anthropic')
+              _provider_clients[provider] = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+          elif provider == 'deepseek':
+              openai = startup.profile.lazy_import('openai')
+              _provider_clients[provider] = openai.OpenAI(
+                  api_key=os.environ.get('DEEPSEEK_API_KEY'), base_url=DEEPSEEK_BASE_URL)
+          else:
+              openai = startup.profile.lazy_import('openai')
+              _provider_clients[provider] = openai.OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+      return _provider_clients[provider]
+
+
+# 各状态的检索耗时统计（毫秒），供 /api/metrics 与 benchmark.py 使用
+retrieval_stats = {}
+_retrieval_stats_lock = threading.Lock()
+
+
+def record_retrieval_latency(status, elapsed_ms):
+  """按状态累计检索耗时"""
+  with _retrieval_stats_lock:
+      stats = retrieval_stats.setdefault(status, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+      stats['count'] += 1
+      stats['total_ms'] += elapsed_ms
+      stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+
+def retrieval_stats_snapshot():
+  """返回各状态的检索次数、平均耗时和最大耗时"""
+  with _retrieval_stats_lock:
+      return {
+          status: {
+              'count': s['count'],
+              'avg_ms': round(s['total_ms'] / s['count'], 3) if s['count'] else 0.0,
+              'max_ms': round(s['max_ms'], 3),
+          }
+          for status, s in retrieval_stats.items()
+      }
+
+
+def configured_providers():
+  """已配置密钥的服务商（按 generate_answer_with_usage 的优先级：DeepSeek > OpenAI > Claude）"""
+  return [provider for provider, key in PROVIDER_KEYS if os.environ.get(key)]
 
 
+def answer_provider():
+  """当前生成答案优先使用的服务商"""
+  providers = configured_providers()
+  return providers[0] if providers else 'extractive'
+
 
 def query_knowledge_base(question, top_k=3):
   """查询知识库 - 智能混合检索（兼容旧接口）"""
@@ -78,390 +322,85 @@ def query_knowledge_base(question, top_k=3):
   return result.get('contexts', [])
 
 
-def query_knowledge_base_with_status(question, top_k=3):
-  """查询知识库 - 智能混合检索，返回详细状态信息"""
-  import re
-  import jieba
-
-  # 支持的国家列表（知识库中有数据的国家）- 实际43个
-  supported_countries = ['英国', '美国', '德国', '法国', '日本', '韩国', '新加坡', '中国香港', '中国台湾',
-                         '巴西', '阿根廷', '墨西哥', '加拿大', '澳大利亚', '新西兰', '印度', '泰国',
-                         '越南', '印度尼西亚', '菲律宾', '马来西亚', '土耳其', '沙特阿拉伯', '阿联酋',
-                         '意大利', '西班牙', '荷兰', '比利时', '瑞士', '瑞典', '丹麦', '挪威',
-                         '波兰', '俄罗斯', '南非', '埃及', '以色列', '卡塔尔',
-                         '哈萨克斯坦', '乌兹别克斯坦', '吉尔吉斯斯坦', '塔吉克斯坦', '土库曼斯坦',
-                         '吉尔吉斯共和国', '加纳', '匈牙利', '卢森堡', '保加利亚',
-                         '拉脱维亚', '斯洛伐克', '秘鲁', '罗马尼亚', '阿尔及利亚',
-                         '多米尼加共和国', '尼日利亚', '哥伦比亚', '哥斯达黎加',
-                         '希腊', '马耳他', '巴基斯坦']
-  
-  # 国家名称别名映射（简称 -> 标准名）
-  country_aliases = {
-      '印尼': '印度尼西亚',
-      '大马': '马来西亚',
-      'UK': '英国',
-      'USA': '美国',
-      'US': '美国',
-      'America': '美国',
-      '德国': '德国',
-      'Deutschland': '德国',
-      '法国': '法国',
-      '日本': '日本',
-      '韩国': '韩国',
-      '俄国': '俄罗斯',
-      '澳洲': '澳大利亚',
-  }
-  
-  # 常见的国家名列表（用于检测用户是否询问了不在支持列表中的国家）
-  all_country_keywords = supported_countries + [
-      '中国', '中国大陆', '朝鲜', '蒙古', '缅甸', '老挝', '柬埔寨', '伊朗', '伊拉克', '叙利亚', '约旦', '黎巴嫩',
-      '哈萨克斯坦', '乌兹别克斯坦', '吉尔吉斯斯坦', '塔吉克斯坦', '土库曼斯坦',
-      '也门', '阿曼', '科威特', '巴林', '卡塔尔', '利比亚', '突尼斯', '阿尔及利亚', '摩洛哥', '苏丹', '埃塞俄比亚',
-      '肯尼亚', '坦桑尼亚', '乌干达', '赞比亚', '津巴布韦', '博茨瓦纳', '纳米比亚', '安哥拉', '莫桑比克', '马达加斯加',
-      '毛里求斯', '塞舌尔', '尼日利亚', '加纳', '科特迪瓦', '塞内加尔', '喀麦隆', '刚果', '卢旺达', '布隆迪',
-      '冰岛', '爱尔兰', '葡萄牙', '希腊', '奥地利', '芬兰', '卢森堡', '捷克', '斯洛伐克', '匈牙利', '罗马尼亚',
-      '保加利亚', '塞尔维亚', '克罗地亚', '斯洛文尼亚', '乌克兰', '白俄罗斯', '立陶宛', '拉脱维亚', '爱沙尼亚',
-      '巴基斯坦', '孟加拉', '斯里兰卡', '尼泊尔', '不丹', '马尔代夫', '阿富汗', '乌兹别克斯坦', '土库曼斯坦',
-      '吉尔吉斯斯坦', '塔吉克斯坦', '格鲁吉亚', '阿塞拜疆', '亚美尼亚', '韩国', '朝鲜', '文莱', '老挝', '东帝汶',
-      '巴布亚新几内亚', '斐济', '汤加', '萨摩亚', '瓦努阿图', '所罗门群岛', '基里巴斯', '瑙鲁', '帕劳', '图瓦卢',
-      '古巴', '牙买加', '海地', '多米尼加', '巴哈马', '巴巴多斯', '特立尼达和多巴哥', '格林纳达', '圣卢西亚',
-      '圣文森特和格林纳丁斯', '安提瓜和巴布达', '圣基茨和尼维斯', '伯利兹', '危地马拉', '洪都拉斯', '萨尔瓦多',
-      '尼加拉瓜', '哥斯达黎加', '巴拿马', '哥伦比亚', '委内瑞拉', '厄瓜多尔', '秘鲁', '玻利维亚', '巴拉圭', '乌拉圭',
-      '智利', '圭亚那', '苏里南', '法属圭亚那', '马尔维纳斯群岛', '格陵兰', '百慕大', '波多黎各', '关岛',
-      '美属维尔京群岛', '英属维尔京群岛', '安圭拉', '蒙特塞拉特', '特克斯和凯科斯群岛', '开曼群岛',
-      '阿鲁巴', '库拉索', '荷属圣马丁', '法属圣马丁', '瓜德罗普', '马提尼克', '留尼汪', '马约特', '法属波利尼西亚',
-      '新喀里多尼亚', '瓦利斯和富图纳', '托克劳', '纽埃', '库克群岛', '皮特凯恩群岛', '圣诞岛', '科科斯群岛',
-      '诺福克岛', '赫德岛和麦克唐纳群岛', '法属南部领地', '布韦岛', '南乔治亚和南桑威奇群岛', '英属印度洋领地',
-      '安道尔', '摩纳哥', '列支敦士登', '圣马力诺', '梵蒂冈', '马耳他', '塞浦路斯', '摩尔多瓦', '黑山',
-      '北马其顿', '波斯尼亚和黑塞哥维那', '阿尔巴尼亚', '科索沃', '直布罗陀', '根西岛', '泽西岛', '马恩岛',
-      '法罗群岛', '奥兰群岛', '斯瓦尔巴群岛', '扬马延岛', '新西伯利亚群岛', '法兰士约瑟夫地群岛',
-      '喀麦隆', '中非', '乍得', '刚果共和国', '刚果民主共和国', '赤道几内亚', '加蓬', '圣多美和普林西比',
-      '科摩罗', '吉布提', '厄立特里亚', '索马里', '南苏丹', '贝宁', '布基纳法索', '佛得角', '冈比亚',
-      '几内亚', '几内亚比绍', '利比里亚', '马里', '毛里塔尼亚', '尼日尔', '塞拉利昂', '多哥', '莱索托',
-      '斯威士兰', '马拉维', '科摩罗', '马约特', '留尼汪', '圣赫勒拿', '阿森松', '特里斯坦-达库尼亚',
-      '西撒哈拉', '索马里兰', '马耳他骑士团', '北塞浦路斯', '南奥塞梯', '阿布哈兹', '纳戈尔诺-卡拉巴赫',
-      '德涅斯特河沿岸', '卢甘斯克', '顿涅茨克', '克里米亚', '塞瓦斯托波尔', '科索沃', '巴勒斯坦',
-      '中华民国', '香港', '台湾', '澳门'
-  ]
-
-  target_country = None
-  
-  # 首先检查标准国家名
-  for country in supported_countries:
-      if country in question:
-          target_country = country
-          break
-  
-  # 然后检查别名
-  if not target_country:
-      for alias, standard in country_aliases.items():
-          if alias in question:
-              target_country = standard
-              print(f"通过别名 '{alias}' 识别到国家: {standard}")
-              break
-  
-  # 检查是否询问了不在支持列表中的国家
-  if not target_country:
-      for country in all_country_keywords:
-          if country in question:
-              print(f"问题中提到了不在支持列表中的国家 '{country}'")
-              return {
-                  'contexts': [],
-                  'status': 'no_country',
-                  'country': country
-              }
-  
-  # 检查是否包含明显的"测试"或虚构内容
-  test_keywords = ['火星', '月球', '测试', 'abcdefg', '不存在', '虚拟', '假的', '虚构', '幻想']
-  for kw in test_keywords:
-      if kw in question:
-          print(f"检测到测试关键词 '{kw}'")
-          return {
-              'contexts': [],
-              'status': 'fictional',
-              'country': ''
-          }
+def query_knowledge_base_with_status(question, top_k=3, retrieval_mode=None, deadline=None):
+  """查询知识库 - 智能混合检索，返回详细状态信息（含各阶段耗时 timings，见 retriever.Retriever.retrieve）
 
-  # 如果指定了国家，先按国家过滤
-  if target_country:
-      print(f"检测到目标国家: {target_country}")
-      # 获取该国所有文档
-      country_docs = collection.get(
-          where={'country': target_country},
-          limit=100  # 获取该国所有文档
-      )
+  retrieval_mode 为 None 时使用环境变量 RETRIEVAL_MODE（默认 lexical）；
+  deadline 为 time.monotonic() 时间点：可选阶段在时间不足时跳过并记入 cut_short，
+  必需阶段超时则抛出 DeadlineExceeded
+  """
+  started = time.perf_counter()
+  try:
+      result = retriever.retrieve(question, top_k, retrieval_mode, deadline)
+  except DeadlineExceeded:
+      record_retrieval_latency('timeout', round((time.perf_counter() - started) * 1000, 3))
+      raise
+  record_retrieval_latency(result['status'], result['timings']['total'])
+  return result
 
-      if not country_docs['documents']:
-          # 没有该国数据
-          print(f"知识库中没有 {target_country} 的数据")
-          return {
-              'contexts': [],
-              'status': 'no_content',
-              'country': target_country
-          }
 
-      # 提取问题关键词（包含分词和保留原始问题中的重要术语）
-      keywords = list(jieba.cut(question))
-      allowed_single_chars = ['年', '假', '税', '金', '费', '期']
-      keywords = [k for k in keywords
-                 if k not in ['什么', '哪些', '如何', '怎么', '多少', '为什么', '是否', '有没有', '的', '了', '吗', '呢', target_country, '？']
-                 and (len(k) > 1 or k in allowed_single_chars)]
-
-      # 额外检查问题中的HR关键术语（完整词组）
-      hr_terms_in_question = []
-      if '年假' in question:
-          hr_terms_in_question.append('年假')
-      if '试用期' in question or 'probation' in question.lower():
-          hr_terms_in_question.append('试用期')
-      if '工作时长' in question or '工作时间' in question:
-          hr_terms_in_question.extend(['工作时长', '工作时间'])
-      if '加班' in question:
-          hr_terms_in_question.append('加班')
-      if '工资' in question or '薪资' in question or '最低' in question:
-          hr_terms_in_question.extend(['工资', '薪资', '最低'])
-      if '合同' in question:
-          hr_terms_in_question.append('合同')
-      if '休假' in question or '假期' in question:
-          hr_terms_in_question.extend(['休假', '假期'])
-      if '社保' in question or '保险' in question:
-          hr_terms_in_question.extend(['社保', '保险'])
-      if '解雇' in question or '辞退' in question or '离职' in question:
-          hr_terms_in_question.extend(['解雇', '辞退', '离职'])
-      if '招聘' in question or '雇佣' in question:
-          hr_terms_in_question.extend(['招聘', '雇佣'])
-      if '个税' in question or '所得税' in question:
-          hr_terms_in_question.extend(['个税', '所得税'])
-      if '福利' in question:
-          hr_terms_in_question.append('福利')
-      if '工时' in question or '工时' in question:
-          hr_terms_in_question.append('工时')
-      if '病假' in question:
-          hr_terms_in_question.append('病假')
-      if '产假' in question:
-          hr_terms_in_question.append('产假')
-      if '陪产假' in question:
-          hr_terms_in_question.append('陪产假')
-      if '育儿假' in question:
-          hr_terms_in_question.append('育儿假')
-      if '法定节假日' in question or '公共假期' in question:
-          hr_terms_in_question.extend(['法定节假日', '公共假期'])
-      if '调休' in question:
-          hr_terms_in_question.append('调休')
-      if '遣散费' in question or '赔偿金' in question:
-          hr_terms_in_question.extend(['遣散费', '赔偿金'])
-      if '竞业禁止' in question or '保密协议' in question:
-          hr_terms_in_question.extend(['竞业禁止', '保密协议'])
-      if '工会' in question:
-          hr_terms_in_question.append('工会')
-      if '歧视' in question:
-          hr_terms_in_question.append('歧视')
-      if '安全' in question and '健康' in question:
-          hr_terms_in_question.extend(['安全', '健康'])
-      if '工伤' in question:
-          hr_terms_in_question.append('工伤')
-      if '移民' in question or '签证' in question or '工作许可' in question or '工作签证' in question:
-          hr_terms_in_question.extend(['移民', '签证', '工作许可', '工作签证'])
-      if '养老金' in question or '退休金' in question:
-          hr_terms_in_question.extend(['养老金', '退休金'])
-      if '医疗' in question:
-          hr_terms_in_question.append('医疗')
-      if '奖金' in question or '年终奖' in question or '十三薪' in question:
-          hr_terms_in_question.extend(['奖金', '年终奖', '十三薪'])
-      if '津贴' in question or '补贴' in question:
-          hr_terms_in_question.extend(['津贴', '补贴'])
-      if '报销' in question:
-          hr_terms_in_question.append('报销')
-      if '培训' in question:
-          hr_terms_in_question.append('培训')
-      if '绩效' in question:
-          hr_terms_in_question.append('绩效')
-      if '考勤' in question:
-          hr_terms_in_question.append('考勤')
-      if '远程工作' in question or '居家办公' in question:
-          hr_terms_in_question.extend(['远程工作', '居家办公'])
-      if '灵活工作' in question:
-          hr_terms_in_question.append('灵活工作')
-      if '最低工资' in question or '底薪' in question:
-          hr_terms_in_question.extend(['最低工资', '底薪'])
-      if '薪酬' in question:
-          hr_terms_in_question.append('薪酬')
-      if '待遇' in question:
-          hr_terms_in_question.append('待遇')
-      if '劳动' in question or '劳工' in question:
-          hr_terms_in_question.extend(['劳动', '劳工'])
-      if '雇佣' in question:
-          hr_terms_in_question.append('雇佣')
-      if '就业' in question:
-          hr_terms_in_question.append('就业')
-      if 'HR' in question or '人力资源' in question:
-          hr_terms_in_question.extend(['HR', '人力资源'])
-      if '合规' in question:
-          hr_terms_in_question.append('合规')
-      if '法律' in question and '劳动' in question:
-          hr_terms_in_question.append('劳动法')
-      if '法规' in question and ('劳动' in question or '雇佣' in question):
-          hr_terms_in_question.append('劳动法规')
-          
-      # 如果问题中没有任何HR相关关键词，则认为不相关
-      if not hr_terms_in_question:
-          print(f"问题 '{question}' 不包含任何HR相关关键词，返回irrelevant")
-          return {
-              'contexts': [],
-              'status': 'irrelevant',
-              'country': target_country
-          }
+# 事实表快速通道的命中 / 未命中次数，供 /api/metrics 使用
+fact_path_stats = {'hits': 0, 'misses': 0}
+_fact_path_stats_lock = threading.Lock()
 
-      # 对该国文档进行关键词评分
-      scored_docs = []
-      for i, (doc, meta) in enumerate(zip(country_docs['documents'], country_docs['metadatas'])):
-          keyword_score = sum(1 for kw in keywords if kw in doc)
-
-          # 特殊关键词加分：只对问题中提到的概念加分
-          bonus = 0
-          for term in hr_terms_in_question:
-              if term in doc:
-                  if term == '年假':
-                      bonus += 25
-                  elif '试用期' in term or 'probation' in term.lower():
-                      bonus += 20
-                  elif term == '加班':
-                      bonus += 20
-                  elif '工作' in term:
-                      bonus += 15
-                  elif '工资' in term or '薪资' in term or '最低' in term:
-                      bonus += 15
-                  elif '合同' in term:
-                      bonus += 12
-
-          # OCR内容包含问题时询问的关键词时，额外加分
-          if meta.get('type') == 'ocr':
-              # 只有当OCR包含完整的HR关键术语时才加分
-              has_hr_term = any(term in doc for term in hr_terms_in_question)
-              if has_hr_term:
-                  # 但如果article有更高匹配，不给予OCR额外优势
-                  bonus += 5  # 降低OCR加分
-
-          total_score = keyword_score * 10 + bonus
-
-          if total_score > 0:  # 只保留有相关性的
-              scored_docs.append({
-                  'doc': doc,
-                  'metadata': meta,
-                  'score': total_score
-              })
-
-      # 按得分排序
-      scored_docs.sort(key=lambda x: x['score'], reverse=True)
-      
-      # 设置最低相关性阈值 - 如果最高分低于阈值，说明问题与该国内容不相关
-      MIN_RELEVANCE_THRESHOLD = 15  # 最低相关性阈值
-      if not scored_docs or scored_docs[0]['score'] < MIN_RELEVANCE_THRESHOLD:
-          print(f"{target_country} 的相关文档与问题相关性太低")
-          return {
-              'contexts': [],
-              'status': 'irrelevant',
-              'country': target_country
-          }
 
-      # 如果关键词匹配的结果太少，补充向量检索结果
-      if len(scored_docs) < top_k:
-          results = collection.query(
-              query_texts=[question],
-              n_results=top_k - len(scored_docs),
-              where={'country': target_country}
-          )
-          for i, doc in enumerate(results['documents'][0]):
-              metadata = results['metadatas'][0][i]
-              scored_docs.append({
-                  'doc': doc,
-                  'metadata': metadata,
-                  'score': 0
-              })
-
-      # 取top_k（补充后可能超过）
-      scored_docs = scored_docs[:top_k]
-
-      contexts = []
-      for item in scored_docs:
-          contexts.append({
-              'text': item['doc'],
-              'country': item['metadata'].get('country', 'Unknown'),
-              'source': item['metadata'].get('title', ''),
-              'url': item['metadata'].get('url', '')
-          })
-      
-      return {
-          'contexts': contexts,
-          'status': 'found',
-          'country': target_country
-      }
+def record_fact_path(outcome):
+  """累计事实表快速通道的命中（hits）/ 未命中（misses）次数"""
+  with _fact_path_stats_lock:
+      fact_path_stats[outcome] += 1
 
-  else:
-      # 没有指定国家，使用标准向量检索 + 关键词增强
-      results = collection.query(query_texts=[question], n_results=min(15, top_k * 5))
-
-      keywords = list(jieba.cut(question))
-      keywords = [k for k in keywords if len(k) > 1 and k not in ['什么', '哪些', '如何', '怎么', '多少', '为什么', '是否', '有没有', '的', '了', '吗', '呢']]
-
-      scored_docs = []
-      for i, doc in enumerate(results['documents'][0]):
-          metadata = results['metadatas'][0][i]
-          keyword_score = sum(1 for kw in keywords if kw in doc)
-          rank_score = len(results['documents'][0]) - i
-          total_score = keyword_score * 3 + rank_score
-
-          scored_docs.append({
-              'doc': doc,
-              'metadata': metadata,
-              'score': total_score
-          })
 
-      scored_docs.sort(key=lambda x: x['score'], reverse=True)
-      
-      # 设置最低相关性阈值，过滤低质量结果
-      MIN_SCORE_THRESHOLD = 12  # 提高最低分数阈值，确保相关性
-      
-      # 如果最高分低于阈值，说明没有相关结果
-      if not scored_docs or scored_docs[0]['score'] < MIN_SCORE_THRESHOLD:
-          return {
-              'contexts': [],
-              'status': 'no_results',
-              'country': ''
-          }
-      
-      # 只保留达到阈值的结果
-      scored_docs = [doc for doc in scored_docs if doc['score'] >= MIN_SCORE_THRESHOLD][:top_k]
-
-      contexts = []
-      for item in scored_docs:
-          metadata = item['metadata']
-          contexts.append({
-              'text': item['doc'],
-              'country': metadata.get('country', 'Unknown'),
-              'source': metadata.get('title', ''),
-              'url': metadata.get('url', '')
-          })
+def fact_path_stats_snapshot():
+  """返回事实表快速通道的命中统计"""
+  with _fact_path_stats_lock:
+      return dict(fact_path_stats)
 
-      return {
-          'contexts': contexts,
-          'status': 'found',
-          'country': contexts[0]['country'] if contexts else ''
-      }
 
-def generate_answer(question, contexts):
-  """使用Claude生成答案 - 四部分结构：精准回答 + 更多参考 + 原文段落 + 文章链接"""
-  # 构建prompt
-  context_text = "\n\n---\n\n".join([
-      f"【段落{i+1} - 来源：{ctx['country']} - {ctx['source']}】\n{ctx['text']}"
-      for i, ctx in enumerate(contexts)
-  ])
+def answer_from_fact_table(question):
+  """单值查询快速通道：单一国家 + 单一事实主题 + 查询语气，命中事实表则直接组装答案
 
-  prompt = f"""你是一个专业的国际HR顾问助手。请根据以下从国家用工指南中检索到的相关内容，回答用户的问题。
+  问题有多个分句或还涉及其他HR主题（如"试用期最长多久，期间解雇需要通知吗"）时不走快速通道；
+  不做检索、不调用大模型；未命中时返回 None，由调用方走常规流程
+  """
+  question = normalize_question(question)
+  if not len(fact_index) or not fact_table.is_lookup_question(question):
+      return None
+  if find_fictional_keyword(question) or not fact_table.is_single_part_question(question):
+      return None
+  topics = fact_table.detect_topics(question)
+  if len(topics) != 1 or extract_hr_terms(fact_table.strip_topic_terms(question, topics[0])):
+      return None
+  countries, _ = resolve_countries(question)
+  if len(countries) != 1:
+      return None
+
+  fact = fact_index.get(countries[0], topics[0])
+  if fact is None:
+      record_fact_path('misses')
+      return None
+  record_fact_path('hits')
+
+  context = {
+      'id': fact['chunk_id'],
+      'text': fact['excerpt'],
+      'country': fact['country'],
+      'source': fact['title'],
+      'url': fact['url']
+  }
+  answer = "## ✨ 第一部分：精准回答\n\n"
+  answer += f"- **{fact['country']}{fact['label']}：{fact['value']} {fact['unit']}**\n"
+  answer += f"- 原文依据：{fact['excerpt']}\n"
+  answer += "\n## 📖 第二部分：更多相关参考\n\n"
+  answer += "以上数据直接摘自知识库原文，具体适用条件（如工龄、行业、地区差异）请参考下方原文段落。\n"
+  return {
+      'answer': _append_sources(answer, [context]),
+      'sources': [context],
+      'fact': fact
+  }
 
-检索到的相关内容：
-{context_text}
 
-用户问题：{question}
+# 固定的系统指令：放在 prompt 最前面且逐字不变，便于命中 DeepSeek / OpenAI 的前缀缓存与 Claude 的 prompt caching
+ANSWER_SYSTEM_PROMPT = """你是一个专业的国际HR顾问助手。请根据用户消息中从国家用工指南检索到的相关内容，回答用户的问题。
 
 回答格式要求（非常重要）：
 请只输出以下两部分内容（系统会自动添加带标题的第三、四部分）：
@@ -475,131 +414,334 @@ def generate_answer(question, contexts):
 注意：
 - 如果检索内容确实包含答案，就明确回答，不要说"未找到"
 - 如果检索内容与问题相关但不完全匹配，也要从中提取有用信息
-- 知识库原文段落和原始文章链接会由系统自动添加，你不需要写
+- 知识库原文段落和原始文章链接会由系统自动添加，你不需要写"""
 
-回答："""
+# 各服务商的用量统计（含命中缓存的 prompt token 数），供 /api/metrics 使用
+llm_usage_stats = {}
+_llm_usage_lock = threading.Lock()
 
-  # AI 答案生成 - 优先级：DeepSeek > OpenAI > Claude > 智能提取
-  import os
-  deepseek_key = os.environ.get('DEEPSEEK_API_KEY')
-  openai_key = os.environ.get('OPENAI_API_KEY')
-  anthropic_key = os.environ.get('ANTHROPIC_API_KEY')
 
-  # 优先使用 DeepSeek（便宜、支持国内支付）
-  if deepseek_key:
-      try:
-          from openai import OpenAI
-          deepseek_client = OpenAI(
-              api_key=deepseek_key,
-              base_url="https://api.deepseek.com"
-          )
-          response = deepseek_client.chat.completions.create(
-              model="deepseek-chat",  # DeepSeek 的对话模型
-              max_tokens=2000,
-              messages=[{
-                  "role": "user",
-                  "content": prompt
-              }]
-          )
-          if response.choices and len(response.choices) > 0:
-              answer = response.choices[0].message.content
-          else:
-              answer = "抱歉，生成答案时出现问题。"
-      except Exception as e:
-          answer = f"抱歉，DeepSeek 生成答案时出错：{str(e)}"
-  # 如果有OpenAI密钥，使用GPT-3.5生成答案
-  elif openai_key:
-      try:
-          openai_client = OpenAI(api_key=openai_key)
-          response = openai_client.chat.completions.create(
-              model="gpt-3.5-turbo",
-              max_tokens=2000,
-              messages=[{
-                  "role": "user",
-                  "content": prompt
-              }]
-          )
-          if response.choices and len(response.choices) > 0:
-              answer = response.choices[0].message.content
-          else:
-              answer = "抱歉，生成答案时出现问题。"
-      except Exception as e:
-          answer = f"抱歉，OpenAI 生成答案时出错：{str(e)}"
-  # 如果有API密钥，使用Claude生成答案
-  elif anthropic_key:
+def build_answer_prompt(question, contexts, countries=None, packed=False):
+  """构建三段式 prompt：固定系统指令 → 按 chunk ID 排序的检索内容 → 问题
+
+  检索内容的顺序只取决于 chunk ID（与得分并列时的排序无关），
+  同一批段落总是生成相同的前缀；问题和本题特有的要求放在最后。
+  packed 为 True 时检索内容是按问题挑选的句子，每个问题都不同：放进问题部分（缓存断点之后），
+  context 为空字符串，免得每次都写入一个不会再被命中的缓存前缀
+  """
+  ordered = sorted(contexts, key=lambda ctx: ctx.get('id', ''))
+  context_text = "检索到的相关内容：\n" + "\n\n---\n\n".join([
+      f"【段落 {ctx.get('id', '')} - 来源：{ctx['country']} - {ctx['source']}】\n{ctx['text']}"
+      for ctx in ordered
+  ])
+
+  question_text = f"用户问题：{question}"
+  if countries and len(countries) > 1:
+      question_text += f"""
+
+这是一个多国对比问题，涉及：{'、'.join(countries)}。
+【精准回答】部分请按国家分别列出关键数据或规定（每个国家用"### 国家名"作小标题），最后用一两句话总结主要差异。某个国家的检索内容中没有相关信息时请明确说明，不要编造。"""
+  question_text += "\n\n回答："
+
+  if packed:
+      return {'system': ANSWER_SYSTEM_PROMPT, 'context': '', 'question': context_text + "\n\n" + question_text}
+  return {
+      'system': ANSWER_SYSTEM_PROMPT,
+      'context': context_text,
+      'question': question_text
+  }
+
+
+def _openai_usage(response, provider, elapsed_ms):
+  """从 OpenAI 兼容接口的 usage 中读取用量（DeepSeek: prompt_cache_hit_tokens；OpenAI: prompt_tokens_details.cached_tokens）"""
+  usage = getattr(response, 'usage', None)
+  cached = getattr(usage, 'prompt_cache_hit_tokens', None)
+  if cached is None:
+      details = getattr(usage, 'prompt_tokens_details', None)
+      if isinstance(details, dict):
+          cached = details.get('cached_tokens')
+      else:
+          cached = getattr(details, 'cached_tokens', None)
+  return {
+      'provider': provider,
+      'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+      'cached_tokens': cached or 0,
+      'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+      'latency_ms': round(elapsed_ms, 1)
+  }
+
+
+def _anthropic_usage(message, elapsed_ms):
+  """从 Claude 的 usage 中读取用量（input_tokens 不含缓存读写部分）"""
+  usage = getattr(message, 'usage', None)
+  cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+  cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+  return {
+      'provider': 'claude',
+      'prompt_tokens': (getattr(usage, 'input_tokens', 0) or 0) + cache_read + cache_write,
+      'cached_tokens': cache_read,
+      'completion_tokens': getattr(usage, 'output_tokens', 0) or 0,
+      'latency_ms': round(elapsed_ms, 1)
+  }
+
+
+def record_llm_usage(usage):
+  """按服务商累计用量"""
+  with _llm_usage_lock:
+      stats = llm_usage_stats.setdefault(usage['provider'], {
+          'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0, 'total_ms': 0.0
+      })
+      stats['calls'] += 1
+      stats['prompt_tokens'] += usage['prompt_tokens']
+      stats['cached_tokens'] += usage['cached_tokens']
+      stats['completion_tokens'] += usage['completion_tokens']
+      stats['total_ms'] += usage['latency_ms']
+
+
+def llm_usage_snapshot():
+  """返回各服务商的调用次数、token 用量、缓存命中率和平均耗时"""
+  with _llm_usage_lock:
+      return {
+          provider: {
+              'calls': s['calls'],
+              'prompt_tokens': s['prompt_tokens'],
+              'cached_tokens': s['cached_tokens'],
+              'completion_tokens': s['completion_tokens'],
+              'cache_hit_ratio': round(s['cached_tokens'] / s['prompt_tokens'], 3) if s['prompt_tokens'] else 0.0,
+              'avg_ms': round(s['total_ms'] / s['calls'], 1) if s['calls'] else 0.0,
+          }
+          for provider, s in llm_usage_stats.items()
+      }
+
+
+def classify_question_type(question, countries=None):
+  """问题类型：comparison（多国对比）| lookup（查一个数）| general"""
+  if countries and len(countries) > 1:
+      return 'comparison'
+  if fact_table.is_lookup_question(question):
+      return 'lookup'
+  return 'general'
+
+
+def pack_answer_contexts(question, contexts, countries=None):
+  """上下文压缩阶段：按问题关键词与HR术语挑选句子、去重，并适配 token 预算"""
+  keywords = extract_keywords(question, exclude=tuple(countries or ()))
+  hr_terms = extract_hr_terms(question)
+  # 多国对比时每多一个国家预算增加一半
+  budget = CONTEXT_TOKEN_BUDGET + max(0, len(countries or ()) - 1) * CONTEXT_TOKEN_BUDGET // 2
+  return context_packing.pack_contexts(contexts, keywords, hr_terms, budget)
+
+
+def generate_answer(question, contexts, countries=None):
+  """使用Claude生成答案 - 四部分结构：精准回答 + 更多参考 + 原文段落 + 文章链接（兼容旧接口）"""
+  return generate_answer_with_usage(question, contexts, countries)['answer']
+
+
+def generate_answer_with_usage(question, contexts, countries=None, pack=None, extractive=False, deadline=None):
+  """生成答案，同时返回本次大模型调用的 token 用量（含缓存命中数）
+
+  countries 包含多个国家时使用对比形式的 prompt，多国对比只调用一次大模型；
+  pack 为 None 时按 CONTEXT_PACKING 决定是否压缩上下文（第三部分原文段落始终展示完整检索结果）；
+  extractive 为 True 时不调用大模型，直接使用智能提取（过载降级）；
+  deadline 为请求截止时间，大模型调用以剩余时间为超时，剩余时间不足或超时时改用智能提取；
+  question 为用户原文（写入 prompt），问题类型与上下文压缩使用规范化后的问题；
+  服务商调用出错时答案为错误提示，provider_error 为 True（这样的答案不缓存）
+  """
+  comparison = bool(countries) and len(countries) > 1
+  pack = CONTEXT_PACKING if pack is None else pack
+  normalized = normalize_question(question)
+  question_type = classify_question_type(normalized, countries)
+  max_tokens = MAX_TOKENS_BY_TYPE[question_type]
+
+  packing_stats = None
+  prompt_contexts = contexts
+  if pack and contexts:
+      prompt_contexts, packing_stats = pack_answer_contexts(normalized, contexts, countries)
+  prompt = build_answer_prompt(question, prompt_contexts, countries, packed=packing_stats is not None)
+  usage = None
+  answer = None
+
+  # AI 答案生成 - 优先级：DeepSeek > OpenAI > Claude > 智能提取
+  # 调用经调度器排队，某个服务商在截止时间内没有 RPM / TPM 余量时改用下一个
+  providers = [] if extractive else configured_providers()
+  cut_short = []
+  provider_error = False
+  llm_deadline = time.monotonic() + LLM_DEADLINE_S
+  if deadline is not None:
+      llm_deadline = min(llm_deadline, deadline)
+      if providers and (deadline - time.monotonic()) * 1000 < LLM_MIN_BUDGET_MS:
+          cut_short.append('generate')
+  est_tokens = context_packing.estimate_tokens(''.join(prompt.values())) + max_tokens
+  for provider in ([] if cut_short else providers):
       try:
-          message = claude_client.messages.create(
-              model="claude-sonnet-4.5-20240514",
-              max_tokens=2000,
-              messages=[{
-                  "role": "user",
-                  "content": prompt
-              }]
-          )
-          # 安全获取答案
-          if message.content and len(message.content) > 0:
-              answer = message.content[0].text
-          else:
-              answer = "抱歉，生成答案时出现问题。"
+          answer, usage = provider_scheduler.call(
+              provider, lambda p=provider: _call_provider(p, prompt, max_tokens, llm_deadline),
+              est_tokens, llm_deadline)
+          break
+      except llm_scheduler.RateLimited as e:
+          print(f"  {e}，改用下一个服务商")
       except Exception as e:
-          answer = f"抱歉，Claude 生成答案时出错：{str(e)}"
-  else:
-      # 没有API密钥，使用智能提取逻辑
-      # 只处理最相关的第一个段落
+          if _is_timeout_error(e):
+              print(f"  {PROVIDER_LABELS[provider]} 生成答案超时，改用智能提取")
+              cut_short.append('generate')
+              break
+          answer = f"抱歉，{PROVIDER_LABELS[provider]} 生成答案时出错：{str(e)}"
+          provider_error = True
+          break
+
+  degraded = False
+  if answer is None:
+      # 没有API密钥（或所有服务商都被限流 / 超时），使用智能提取逻辑
+      degraded = bool(providers)
       if not contexts:
-          return "抱歉，未找到相关信息。"
-
-      primary_ctx = contexts[0]
-      text = primary_ctx['text']
-
-      # 清理OCR表格格式（删除多余空格）
-      text = text.replace('  ', ' ').replace('   ', ' ').strip()
-
-      # 提取问题关键词，用于选择最相关的段落
-      question_keywords = list(jieba.cut(question))
-      question_keywords = [k for k in question_keywords
-                         if len(k) > 1 and k not in ['什么', '哪些', '如何', '怎么', '多少', '为什么', '是否', '有没有', '的', '了', '吗', '呢', '？']]
-
-      # 按句子分割
-      sentences = text.replace('。', '。|').replace('；', '；|').split('|')
-
-      # 评分并选择句子
-      scored_sentences = []
-      for sent in sentences:
-          sent = sent.strip()
-          if len(sent) < 10:
-              continue
-
-          score = 0
-          # 包含数字的句子优先（通常包含具体规定）
-          if any(c.isdigit() for c in sent):
-              score += 3
-          # 包含关键词
-          score += sum(1 for kw in question_keywords if kw in sent)
-          # 常见HR关键词
-          hr_keywords = ['工资', '年假', '试用期', '小时', '天', '周', '月', '小时', '美元', '欧元', '英镑']
-          score += sum(1 for kw in hr_keywords if kw in sent)
-
-          if score > 0:
-              scored_sentences.append((sent, score))
-
-      # 按得分排序，取前5句
-      scored_sentences.sort(key=lambda x: x[1], reverse=True)
-      selected = [s for s, score in scored_sentences[:5]]
-
-      # 如果没找到好的句子，就取前几句
-      if not selected:
-          selected = [s.strip() for s in sentences[:3] if len(s.strip()) > 20]
-
-      # 构建四部分结构（无API密钥时的简化版）
-      answer = "## ✨ 第一部分：精准回答\n\n"
-      for sent in selected:
-          answer += f"- {sent}\n"
-      
-      answer += "\n## 📖 第二部分：更多相关参考\n\n"
-      answer += "基于检索到的政策内容，建议关注具体实施细节和最新法规更新。\n"
+          return {'answer': "抱歉，未找到相关信息。", 'usage': None, 'degraded': degraded, 'cut_short': cut_short}
+
+      if comparison:
+          answer = _extract_comparison_answer(question, contexts, countries)
+      else:
+          answer = _extract_answer(question, contexts)
+
+  if usage:
+      record_llm_usage(usage)
+      usage['question_type'] = question_type
+      usage['max_tokens'] = max_tokens
+      if packing_stats:
+          usage.update(packing_stats)
 
   # 统一添加带emoji的四部分标题（如果API返回的内容没有标题）
+  return {'answer': _append_sources(answer, contexts), 'usage': usage, 'degraded': degraded,
+          'cut_short': cut_short, 'provider_error': provider_error}
+
+
+def _is_timeout_error(error):
+  """SDK 的超时异常（openai.APITimeoutError / anthropic.APITimeoutError）"""
+  return isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__
+
+
+def _call_provider(provider, prompt, max_tokens, deadline):
+  """调用一次服务商（以距 deadline 的剩余时间为超时），返回 ((答案, 用量), 响应头, 计入限额的 token 数)"""
+  started = time.perf_counter()
+  timeout = max(0.1, deadline - time.monotonic())
+  if provider == 'claude':
+      # 系统指令与检索内容分别打上缓存断点，问题不缓存（压缩后的检索内容在问题部分，见 build_answer_prompt）
+      content = [{"type": "text", "text": prompt['question']}]
+      if prompt['context']:
+          content.insert(0, {"type": "text", "text": prompt['context'], "cache_control": {"type": "ephemeral"}})
+      raw = provider_client('claude').messages.with_raw_response.create(
+          model="claude-sonnet-4.5-20240514",
+          max_tokens=max_tokens,
+          timeout=timeout,
+          system=[{
+              "type": "text",
+              "text": prompt['system'],
+              "cache_control": {"type": "ephemeral"}
+          }],
+          messages=[{"role": "user", "content": content}]
+      )
+      message = raw.parse()
+      usage = _anthropic_usage(message, (time.perf_counter() - started) * 1000)
+      # 安全获取答案
+      if message.content and len(message.content) > 0:
+          answer = message.content[0].text
+      else:
+          answer = "抱歉，生成答案时出现问题。"
+  else:
+      # 优先使用 DeepSeek（便宜、支持国内支付）
+      model = "deepseek-chat" if provider == 'deepseek' else "gpt-3.5-turbo"
+      llm_client = provider_client(provider)
+      # OpenAI 兼容接口：system + user（检索内容在前、问题在后），前缀缓存由服务端自动匹配
+      raw = llm_client.chat.completions.with_raw_response.create(
+          model=model,
+          max_tokens=max_tokens,
+          timeout=timeout,
+          messages=[
+              {"role": "system", "content": prompt['system']},
+              {"role": "user", "content": "\n\n".join(part for part in (prompt['context'], prompt['question']) if part)}
+          ]
+      )
+      response = raw.parse()
+      usage = _openai_usage(response, provider, (time.perf_counter() - started) * 1000)
+      if response.choices and len(response.choices) > 0:
+          answer = response.choices[0].message.content
+      else:
+          answer = "抱歉，生成答案时出现问题。"
+  return (answer, usage), raw.headers, usage['prompt_tokens'] + max_tokens
+
+
+def _select_sentences(question, text):
+  """智能提取：从段落中选出与问题最相关的句子（最多5句）"""
+  # 清理OCR表格格式（删除多余空格）
+  text = text.replace('  ', ' ').replace('   ', ' ').strip()
+
+  # 提取问题关键词，用于选择最相关的段落
+  question_keywords = list(cut_words(question))
+  question_keywords = [k for k in question_keywords
+                     if len(k) > 1 and k not in ['什么', '哪些', '如何', '怎么', '多少', '为什么', '是否', '有没有', '的', '了', '吗', '呢', '？']]
+
+  # 按句子分割
+  sentences = text.replace('。', '。|').replace('；', '；|').split('|')
+
+  # 评分并选择句子
+  scored_sentences = []
+  for sent in sentences:
+      sent = sent.strip()
+      if len(sent) < 10:
+          continue
+
+      score = 0
+      # 包含数字的句子优先（通常包含具体规定）
+      if any(c.isdigit() for c in sent):
+          score += 3
+      # 包含关键词
+      score += sum(1 for kw in question_keywords if kw in sent)
+      # 常见HR关键词
+      hr_keywords = ['工资', '年假', '试用期', '小时', '天', '周', '月', '小时', '美元', '欧元', '英镑']
+      score += sum(1 for kw in hr_keywords if kw in sent)
+
+      if score > 0:
+          scored_sentences.append((sent, score))
+
+  # 按得分排序，取前5句
+  scored_sentences.sort(key=lambda x: x[1], reverse=True)
+  selected = [s for s, score in scored_sentences[:5]]
+
+  # 如果没找到好的句子，就取前几句
+  if not selected:
+      selected = [s.strip() for s in sentences[:3] if len(s.strip()) > 20]
+  return selected
+
+
+def _extract_answer(question, contexts):
+  """无API密钥时的简化版答案：只处理最相关的第一个段落"""
+  answer = "## ✨ 第一部分：精准回答\n\n"
+  for sent in _select_sentences(question, contexts[0]['text']):
+      answer += f"- {sent}\n"
+
+  answer += "\n## 📖 第二部分：更多相关参考\n\n"
+  answer += "基于检索到的政策内容，建议关注具体实施细节和最新法规更新。\n"
+  return answer
+
+
+def _extract_comparison_answer(question, contexts, countries):
+  """无API密钥时的多国对比答案：每个国家取其最相关的第一个段落"""
+  answer = "## ✨ 第一部分：精准回答\n\n"
+  for country in countries:
+      answer += f"### {country}\n\n"
+      primary_ctx = next((ctx for ctx in contexts if ctx['country'] == country), None)
+      if primary_ctx is None:
+          answer += "- 知识库中未检索到相关内容\n\n"
+          continue
+      for sent in _select_sentences(question, primary_ctx['text']):
+          answer += f"- {sent}\n"
+      answer += "\n"
+
+  answer += "## 📖 第二部分：更多相关参考\n\n"
+  answer += "以上为各国规定的要点摘录，建议对照下方原文段落确认具体实施细节和最新法规更新。\n"
+  return answer
+
+
+def _append_sources(answer, contexts):
+  """统一四部分结构：补齐前两部分标题，追加知识库原文段落与原始文章链接"""
   if not answer.startswith('## '):
       # API返回的内容，需要添加标题
       answer = "## ✨ 第一部分：精准回答\n\n" + answer
@@ -634,1044 +776,542 @@ def generate_answer(question, contexts):
 
 @app.route('/')
 def index():
-  """首页 - 全新设计：绿色主题 + 出海元素"""
-  html = """
-  <!DOCTYPE html>
-  <html lang="zh-CN">
-  <head>
-      <meta charset="UTF-8">
-      <meta name="viewport" content="width=device-width, initial-scale=1.0">
-      <title>全球用工智能问答 | Global HR Intelligence v2</title>\n        <meta http-equiv="Cache-Control" content="no-cache, no-store, must-revalidate">\n        <meta http-equiv="Pragma" content="no-cache">\n        <meta http-equiv="Expires" content="0">
-      <link rel="preconnect" href="https://fonts.googleapis.com">
-      <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-      <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap" rel="stylesheet">
-      <style>
-          * {
-              margin: 0;
-              padding: 0;
-              box-sizing: border-box;
-          }
-
-          :root {
-              /* 品牌标准色 */
-              --deep-green: #002D28;        /* 深绿主色 */
-              --ui-green: #00726d;          /* UI深绿 */
-              --sand: #CEA472;              /* 墨金辅助色 */
-              --light-green: #E8FFF9;       /* 浅绿背景 */
-
-              /* 功能色 */
-              --dark-bg: #002D28;
-              --card-bg: #FFFFFF;
-              --text-primary: #000000;
-              --text-secondary: #666666;
-              --border-color: #CCCCCC;
-              --gray-80: #333333;
-              --gray-60: #666666;
-              --gray-20: #CCCCCC;
-
-              /* 阴影 */
-              --shadow-sm: 0 2px 8px rgba(0, 45, 40, 0.08);
-              --shadow-lg: 0 20px 60px rgba(0, 45, 40, 0.15);
-          }
-
-          body {
-              font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-              background: linear-gradient(165deg, #F5FAF9 0%, #FFFFFF 50%, #FAF8F5 100%);
-              min-height: 100vh;
-              padding: 0;
-              position: relative;
-              overflow-x: hidden;
-          }
-
-          /* 背景装饰元素 - 地球网格 */
-          body::before {
-              content: '';
-              position: fixed;
-              top: -50%;
-              left: -50%;
-              width: 200%;
-              height: 200%;
-              background-image:
-                  radial-gradient(circle at 20% 30%, rgba(0, 114, 109, 0.05) 0%, transparent 50%),
-                  radial-gradient(circle at 80% 70%, rgba(206, 164, 114, 0.03) 0%, transparent 50%);
-              z-index: -1;
-              animation: float 20s ease-in-out infinite;
-          }
-
-          @keyframes float {
-              0%, 100% { transform: translate(0, 0) rotate(0deg); }
-              50% { transform: translate(20px, 20px) rotate(5deg); }
-          }
-
-          /* 全球网格背景 */
-          .globe-grid {
-              position: fixed;
-              top: 0;
-              left: 0;
-              width: 100%;
-              height: 100%;
-              background-image: url("data:image/svg+xml,%3Csvg width='60' height='60' xmlns='http://www.w3.org/2000/svg'%3E%3Cpath d='M0 30h60M30 0v60' stroke='%2300726d' stroke-width='0.5' opacity='0.1' fill='none'/%3E%3C/svg%3E");
-              opacity: 0.3;
-              z-index: -1;
-          }
-
-          .container {
-              max-width: 1000px;
-              margin: 0 auto;
-              padding: 40px 20px;
-          }
-
-          /* Header */
-          .header {
-              text-align: center;
-              margin-bottom: 50px;
-              position: relative;
-          }
-
-          .title-section {
-              display: flex;
-              align-items: center;
-              justify-content: center;
-              gap: 20px;
-              margin-bottom: 12px;
-          }
-
-          .globe-icon {
-              font-size: 48px;
-              animation: rotate 20s linear infinite;
-              cursor: pointer;
-          }
-
-          .globe-icon:hover {
-              transform: scale(1.1);
-          }
-
-          @keyframes rotate {
-              from { transform: rotate(0deg); }
-              to { transform: rotate(360deg); }
-          }
-
-          .header h1 {
-              font-size: 2.8em;
-              font-weight: 700;
-              background: linear-gradient(135deg, var(--deep-green), var(--ui-green));
-              -webkit-background-clip: text;
-              -webkit-text-fill-color: transparent;
-              background-clip: text;
-              letter-spacing: -0.5px;
-              margin: 0;
-          }
-
-          .header .subtitle {
-              font-size: 1.2em;
-              color: var(--text-secondary);
-              font-weight: 400;
-              letter-spacing: 0.5px;
-          }
-
-          .stats-bar {
-              display: flex;
-              justify-content: center;
-              gap: 40px;
-              margin-top: 25px;
-              padding: 20px;
-              background: rgba(255, 255, 255, 0.7);
-              backdrop-filter: blur(10px);
-              border-radius: 15px;
-              border: 1px solid var(--border-color);
-          }
-
-          .stat-item {
-              text-align: center;
-          }
-
-          .stat-number {
-              font-size: 2em;
-              font-weight: 700;
-              color: var(--ui-green);
-          }
-
-          /* 金色强调元素 */
-          .stat-item:nth-child(2) .stat-number {
-              color: var(--sand);
-          }
-
-          .stat-label {
-              font-size: 0.9em;
-              color: var(--text-secondary);
-              margin-top: 5px;
-          }
+  """首页 - 全新设计：绿色主题 + 出海元素（预构建的静态页面，见 static/src）"""
+  return _serve_static_asset('index.html')
 
-          /* Card */
-          .card {
-              background: var(--card-bg);
-              border-radius: 24px;
-              padding: 40px;
-              box-shadow: var(--shadow-lg);
-              border: 1px solid var(--border-color);
-              backdrop-filter: blur(10px);
-              position: relative;
-              overflow: hidden;
-          }
 
-          .card::before {
-              content: '';
-              position: absolute;
-              top: 0;
-              left: 0;
-              right: 0;
-              height: 4px;
-              background: linear-gradient(90deg, var(--deep-green), var(--ui-green), var(--sand));
-          }
+@app.route('/assets/<path:name>')
+def assets(name):
+  """带内容哈希的 CSS / JS，可长期缓存"""
+  return _serve_static_asset(name)
 
-          /* Search Box */
-          .search-box {
-              position: relative;
-              margin-bottom: 30px;
-              z-index: 1;
-          }
 
-          #question {
-              width: 100%;
-              padding: 20px 60px 20px 24px;
-              border: 2px solid var(--border-color);
-              border-radius: 16px;
-              font-size: 16px;
-              transition: all 0.3s ease;
-              background: #FAFAFA;
-              font-family: inherit;
-          }
+def _serve_static_asset(name):
+  served = landing_assets.serve(
+      name,
+      if_none_match=request.headers.get('If-None-Match'),
+      accept_encoding=request.headers.get('Accept-Encoding')
+  )
+  if served is None:
+      return jsonify({'error': '资源不存在'}), 404
+  status, headers, body = served
+  return Response(body, status=status, headers=headers)
 
-          #question:focus {
-              outline: none;
-              border-color: var(--ui-green);
-              background: white;
-              box-shadow: 0 0 0 4px rgba(0, 114, 109, 0.1);
-          }
-
-          .search-button {
-              position: absolute;
-              right: 8px;
-              top: 50%;
-              transform: translateY(-50%);
-              padding: 12px 24px;
-              background: linear-gradient(135deg, var(--ui-green), var(--deep-green));
-              color: white;
-              border: none;
-              border-radius: 12px;
-              font-size: 16px;
-              font-weight: 600;
-              cursor: pointer;
-              transition: all 0.3s ease;
-              z-index: 10;
-          }
-
-          .search-button:hover {
-              transform: translateY(-50%) scale(1.05);
-              box-shadow: 0 8px 20px rgba(0, 114, 109, 0.3);
-          }
-
-          .search-button:disabled {
-              opacity: 0.6;
-              cursor: not-allowed;
-          }
+@app.route('/api/ask', methods=['POST'])
+@requires_ready
+def ask():
+  """API: 回答问题"""
+  try:
+      data = request.json
+      question = data.get('question', '')
 
-          /* Examples */
-          .examples {
-              margin-top: 25px;
-          }
+      if not normalize_question(question):
+          return jsonify({'error': '问题不能为空'}), 400
 
-          .examples h3 {
-              font-size: 14px;
-              color: var(--text-secondary);
-              margin-bottom: 15px;
-              font-weight: 600;
-              text-transform: uppercase;
-              letter-spacing: 1px;
-          }
+      retrieval_mode = data.get('retrieval_mode') or RETRIEVAL_MODE
+      if retrieval_mode not in RETRIEVAL_MODES:
+          return jsonify({'error': f'不支持的检索模式: {retrieval_mode}'}), 400
 
-          .example-grid {
-              display: grid;
-              grid-template-columns: repeat(4, 1fr);
-              gap: 12px;
-          }
+      sources_mode = data.get('sources') or 'full'
+      if sources_mode not in SOURCE_MODES:
+          return jsonify({'error': f'不支持的 sources 形式: {sources_mode}'}), 400
 
-          .tag {
-              padding: 12px 18px;
-              background: rgba(0, 114, 109, 0.06);
-              border: 1px solid rgba(0, 114, 109, 0.15);
-              border-radius: 12px;
-              font-size: 14px;
-              cursor: pointer;
-              transition: all 0.3s ease;
-              text-align: center;
-              color: var(--text-primary);
-          }
+      payload, _ = answer_question(question, retrieval_mode, sources_mode=sources_mode,
+                                   deadline=request_deadline())
+      return jsonify(payload)
 
-          .tag:hover {
-              background: var(--ui-green);
-              color: white;
-              transform: translateY(-2px);
-              box-shadow: var(--shadow-sm);
-          }
+  except DeadlineExceeded as e:
+      print(f"  {e}")
+      return jsonify({'error': '请求超时，请稍后重试', 'cut_short': e.cut_short}), 504
+  except Exception as e:
+      print(f"错误: {str(e)}")
+      return jsonify({'error': str(e)}), 500
 
-          /* 给部分标签添加金色 */
-          .tag:nth-child(3):hover {
-              background: var(--sand);
-          }
 
-          .tag:nth-child(6):hover {
-              background: var(--sand);
-          }
+@app.route('/api/ask', methods=['GET'])
+@requires_ready
+def ask_cacheable():
+  """API: 回答问题（GET 形式，可被浏览器 / CDN 缓存）
 
-          /* Result */
-          .result {
-              margin-top: 30px;
-              animation: fadeIn 0.5s ease;
-          }
+  /api/ask?q=<问题>[&retrieval_mode=hybrid][&sources=compact]
+  ETag 由知识库版本、答案服务商与检索到的段落 ID 决定；If-None-Match 命中时返回 304，不调用大模型
+  """
+  try:
+      question = request.args.get('q', '')
+      if not normalize_question(question):
+          return jsonify({'error': '问题不能为空'}), 400
 
-          @keyframes fadeIn {
-              from { opacity: 0; transform: translateY(20px); }
-              to { opacity: 1; transform: translateY(0); }
-          }
+      retrieval_mode = request.args.get('retrieval_mode') or RETRIEVAL_MODE
+      if retrieval_mode not in RETRIEVAL_MODES:
+          return jsonify({'error': f'不支持的检索模式: {retrieval_mode}'}), 400
+
+      sources_mode = request.args.get('sources') or 'full'
+      if sources_mode not in SOURCE_MODES:
+          return jsonify({'error': f'不支持的 sources 形式: {sources_mode}'}), 400
+
+      payload, etag_base = answer_question(question, retrieval_mode, sources_mode=sources_mode,
+                                           if_none_match=request.headers.get('If-None-Match'),
+                                           deadline=request_deadline())
+      response = not_modified(etag_base) if payload is None else jsonify(payload)
+      response.headers['X-KB-Version'] = kb_version
+      if payload is not None and (payload.get('degraded') or payload.get('cut_short')
+                                  or payload.get('provider_error')):
+          # 降级 / 被截断 / 服务商出错的答案不缓存，避免恢复后客户端仍通过 304 沿用不完整的答案
+          response.headers['Cache-Control'] = 'no-store'
+          return response
+      if payload is not None:
+          response.headers['ETag'] = http_utils.format_etag(etag_base)
+      response.headers['Cache-Control'] = ASK_CACHE_CONTROL
+      return response
+
+  except DeadlineExceeded as e:
+      print(f"  {e}")
+      response = jsonify({'error': '请求超时，请稍后重试', 'cut_short': e.cut_short})
+      response.headers['Cache-Control'] = 'no-store'
+      return response, 504
+  except Exception as e:
+      print(f"错误: {str(e)}")
+      response = jsonify({'error': str(e)})
+      response.headers['Cache-Control'] = 'no-store'
+      return response, 500
 
-          .answer {
-              background: linear-gradient(135deg, #FAFFFE 0%, #FFFFFF 100%);
-              padding: 30px;
-              border-radius: 16px;
-              border-left: 4px solid var(--ui-green);
-              line-height: 1.8;
-              color: var(--text-primary);
-              box-shadow: var(--shadow-sm);
-              position: relative;
-              font-size: 15px;
-          }
 
-          .answer::after {
-              content: '';
-              position: absolute;
-              top: 0;
-              right: 0;
-              width: 80px;
-              height: 80px;
-              background: radial-gradient(circle at top right, var(--sand), transparent);
-              opacity: 0.1;
-              border-radius: 0 16px 0 0;
-          }
+def request_deadline(default_ms=REQUEST_DEADLINE_MS):
+  """本次请求的截止时间（time.monotonic() 时间点）：默认 default_ms，可由 X-Request-Deadline-Ms 请求头覆盖"""
+  budget_ms = default_ms
+  header = request.headers.get(DEADLINE_HEADER)
+  if header:
+      try:
+          budget_ms = int(header)
+      except ValueError:
+          pass
+  budget_ms = max(1, min(budget_ms, MAX_REQUEST_DEADLINE_MS))
+  return time.monotonic() + budget_ms / 1000
+
+
+def answer_etag(retrieval_mode, sources_mode, status, context_ids):
+  """答案的 ETag：同一知识库版本、答案服务商、检索模式下，检索到相同段落即视为相同答案"""
+  key = '|'.join([kb_content_version, answer_provider(), retrieval_mode, sources_mode, status] + list(context_ids))
+  return hashlib.sha256(key.encode('utf-8')).hexdigest()[:20]
+
+
+def shape_sources(contexts, sources_mode):
+  """按 sources_mode 输出来源：compact 只保留段落 ID、国家、标题、链接和短摘录"""
+  if sources_mode != 'compact':
+      return contexts
+  return [{
+      'id': ctx.get('id', ''),
+      'country': ctx['country'],
+      'source': ctx['source'],
+      'url': ctx['url'],
+      'excerpt': ctx['text'][:SOURCE_EXCERPT_CHARS] + ('...' if len(ctx['text']) > SOURCE_EXCERPT_CHARS else '')
+  } for ctx in contexts]
+
+
+def answer_question(question, retrieval_mode, sources_mode='full', if_none_match=None, deadline=None,
+                    priority=admission.PRIORITY_INTERACTIVE):
+  """/api/ask 的完整流程，返回 (响应数据, ETag)
+
+  If-None-Match 与检索结果对应的 ETag 一致时，响应数据为 None，跳过答案生成；
+  deadline 贯穿检索、排队与生成，被跳过或中断的阶段列在响应的 cut_short 中；
+  priority 为大模型调用的准入优先级（后台重新生成时为 PRIORITY_BACKGROUND）；
+  规范化后的问题只用于检索、匹配与缓存键，大模型（prompt、联网搜索）看到的是用户的原文
+  """
+  raw_question = question.strip()
+  question = normalize_question(question)
+  # 单值查询快速通道：直接由事实表回答
+  fact_answer = answer_from_fact_table(question)
+  if fact_answer:
+      etag_base = answer_etag('fact_table', sources_mode, 'found', [fact_answer['fact']['chunk_id']])
+      if http_utils.etag_matches(if_none_match, etag_base):
+          return None, etag_base
+      return {
+          'answer': fact_answer['answer'],
+          'sources': shape_sources(fact_answer['sources'], sources_mode),
+          'fast_path': 'fact_table'
+      }, etag_base
+
+  # 查询知识库，同时获取状态信息
+  result = query_knowledge_base_with_status(question, top_k=3, retrieval_mode=retrieval_mode, deadline=deadline)
+  contexts = result.get('contexts', [])
+  status = result.get('status', 'not_found')
+  country = result.get('country', '')
+
+  etag_base = answer_etag(retrieval_mode, sources_mode, status, [ctx.get('id', '') for ctx in contexts] or [country])
+  if http_utils.etag_matches(if_none_match, etag_base):
+      return None, etag_base
+
+  if not contexts:
+      payload = {
+          'not_found': True,
+          'status': status,  # 'no_country' | 'no_content' | 'irrelevant'
+          'country': country,
+          'answer': '',
+          'sources': []
+      }
+      if result.get('cut_short'):
+          payload['cut_short'] = result['cut_short']
+      # 用户多半会接着点击"求助 Deepseek"，提前提交联网搜索任务；票据即任务ID，由问题决定，缓存的响应中同样有效
+      if DEEPSEEK_PREFETCH and status in NOT_FOUND_STATUSES and os.environ.get('DEEPSEEK_API_KEY'):
+          job = deepseek_jobs.submit(raw_question, speculative=True, key=question)
+          if job:
+              payload['deepseek_ticket'] = job['id']
+      return payload, etag_base
+
+  # 同一问题、服务商与检索段落（内容未变）的答案可直接复用（其他 worker / 实例生成的也可以）
+  answer_key = answer_deps.key(question, answer_provider(), retrieval_mode, [ctx.get('id', '') for ctx in contexts])
+  cached = answer_deps.lookup(answer_key, contexts)
+  if cached is not None:
+      return {
+          'answer': cached['answer'],
+          'sources': shape_sources(contexts, sources_mode),
+          'usage': cached['usage'],
+          'cached': True
+      }, etag_base
+
+  # 生成答案：大模型调用受准入控制，排不上时降级为本地抽取式答案
+  countries = result.get('countries')
+  degraded = False
+  if answer_provider() == 'extractive':
+      generated = generate_answer_with_usage(raw_question, contexts, countries=countries)
+  else:
+      max_wait_s = None
+      if deadline is not None:
+          max_wait_s = max(0.0, min(ASK_LLM_MAX_WAIT_MS / 1000, deadline - time.monotonic()))
+      try:
+          with ask_admission.slot(priority, max_wait_s=max_wait_s):
+              generated = generate_answer_with_usage(raw_question, contexts, countries=countries, deadline=deadline)
+      except admission.Overloaded as e:
+          print(f"  {e}，降级为抽取式答案")
+          ask_admission.record_degraded()
+          generated = generate_answer_with_usage(raw_question, contexts, countries=countries, extractive=True)
+          degraded = True
+
+  payload = {
+      'answer': generated['answer'],
+      'sources': shape_sources(contexts, sources_mode),
+      'usage': generated['usage']
+  }
+  if degraded or generated.get('degraded'):
+      payload['degraded'] = True
+  if generated.get('provider_error'):
+      payload['provider_error'] = True
+  cut_short = result.get('cut_short', []) + generated.get('cut_short', [])
+  if cut_short:
+      payload['cut_short'] = cut_short
+  # 降级、被截断或服务商出错的答案不缓存
+  elif (not payload.get('degraded') and not payload.get('provider_error')
+        and (generated['usage'] or answer_provider() == 'extractive')):
+      answer_deps.record(answer_key, raw_question, retrieval_mode, contexts, kb_version,
+                         generated['answer'], generated['usage'])
+  return payload, etag_base
+
+
+def regenerate_answer(question, retrieval_mode):
+  """后台重新生成一个失效的答案（后台优先级，不与用户请求抢名额），返回是否生成并缓存了新答案"""
+  if not services_ready() or answer_provider() == 'extractive':
+      return False
+  payload, _ = answer_question(question, retrieval_mode, deadline=time.monotonic() + MAX_REQUEST_DEADLINE_MS / 1000,
+                               priority=admission.PRIORITY_BACKGROUND)
+  return bool(payload and payload.get('usage') and not payload.get('cached')
+              and not payload.get('degraded') and not payload.get('cut_short'))
+
+
+@app.route('/api/chunk/<path:chunk_id>', methods=['GET'])
+@requires_ready
+def get_chunk(chunk_id):
+  """API: 按 ID 获取段落全文（compact 形式的 sources 按需加载）"""
+  try:
+      result = collection.get(ids=[chunk_id])
+      if not result['ids']:
+          return jsonify({'error': '段落不存在'}), 404
 
-          .answer a {
-              color: var(--ui-green);
-              text-decoration: none;
-              font-weight: 500;
-              transition: color 0.3s;
-          }
+      etag_base = hashlib.sha256(f'{kb_content_version}|{chunk_id}'.encode('utf-8')).hexdigest()[:20]
+      if http_utils.etag_matches(request.headers.get('If-None-Match'), etag_base):
+          response = not_modified(etag_base)
+      else:
+          metadata = result['metadatas'][0] or {}
+          response = jsonify({
+              'id': chunk_id,
+              'text': result['documents'][0],
+              'country': metadata.get('country', 'Unknown'),
+              'source': metadata.get('title', ''),
+              'url': metadata.get('url', '')
+          })
+          response.headers['ETag'] = http_utils.format_etag(etag_base)
+      response.headers['Cache-Control'] = ASK_CACHE_CONTROL
+      return response
 
-          .answer a:hover {
-              color: var(--deep-green);
-              text-decoration: underline;
-          }
+  except Exception as e:
+      print(f"错误: {str(e)}")
+      return jsonify({'error': str(e)}), 500
 
-          .answer h3 {
-              color: #00726d;
-              font-size: 1.3em;
-              margin: 24px 0 12px 0;
-              padding-bottom: 8px;
-              border-bottom: 2px solid #E8FFF9;
-          }
 
-          .answer h4 {
-              color: #002D28;
-              font-size: 1.1em;
-              margin: 16px 0 8px 0;
-          }
+def response_encoding():
+  """本次请求的 JSON 响应使用的压缩编码（按 Accept-Encoding 协商）"""
+  return http_utils.negotiate_encoding(request.headers.get('Accept-Encoding'), http_utils.dynamic_encodings())
 
-          .answer strong {
-              color: #00726d;
-              font-weight: 600;
-          }
 
-          .answer blockquote {
-              margin: 12px 0;
-              padding: 12px 16px;
-              background: #F5FAF9;
-              border-left: 4px solid #CEA472;
-              color: #666;
-              font-size: 0.95em;
-              border-radius: 0 8px 8px 0;
-          }
+def not_modified(etag_base):
+  """304 响应：ETag（含压缩后缀）与 Vary 和同一请求的 200 响应一致
 
-          .answer hr {
-              border: none;
-              border-top: 1px solid #E8FFF9;
-              margin: 20px 0;
-          }
+  304 不经过 compress_json_response，这里按相同的协商结果设置
+  """
+  response = Response(status=304)
+  response.vary.add('Accept-Encoding')
+  response.headers['ETag'] = http_utils.format_etag(etag_base, response_encoding())
+  return response
 
-          /* Loading */
-          .loading {
-              text-align: center;
-              padding: 40px;
-              color: var(--text-secondary);
-          }
 
-          .spinner {
-              display: inline-block;
-              width: 40px;
-              height: 40px;
-              border: 4px solid rgba(0, 114, 109, 0.1);
-              border-top: 4px solid var(--ui-green);
-              border-radius: 50%;
-              animation: spin 1s linear infinite;
-          }
+@app.after_request
+def compress_json_response(response):
+  """JSON 响应按 Accept-Encoding 进行 brotli / gzip 压缩（静态资源已预压缩，不经过这里）
 
-          @keyframes spin {
-              0% { transform: rotate(0deg); }
-              100% { transform: rotate(360deg); }
-          }
+  带 ETag 的响应不论大小都按协商结果压缩，使 304（见 not_modified）无需响应体即可给出相同的 ETag
+  """
+  if (response.status_code != 200 or response.direct_passthrough
+          or response.mimetype != 'application/json'
+          or 'Content-Encoding' in response.headers):
+      return response
+
+  data = response.get_data()
+  if len(data) < http_utils.COMPRESS_MIN_BYTES and 'ETag' not in response.headers:
+      return response
+
+  response.vary.add('Accept-Encoding')
+  encoding = response_encoding()
+  if encoding == 'identity':
+      return response
+
+  response.set_data(http_utils.compress(data, encoding))
+  response.headers['Content-Encoding'] = encoding
+  # 同一 ETag 的不同压缩版本使用不同的强 ETag 后缀
+  etag = response.headers.get('ETag')
+  if etag and etag.startswith('"') and etag.endswith('"'):
+      response.headers['ETag'] = etag[:-1] + f'-{encoding}"'
+  return response
+
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+  """API: 就绪检查（知识库加载完成后返回 200，之前返回 503），附启动耗时报告"""
+  payload = {'status': startup_state['status'], 'startup': startup.profile.snapshot()}
+  if embedding_manifest:
+      payload['embedding'] = embedding_manifest
+  if startup_state['error']:
+      payload['error'] = startup_state['error']
+  response = jsonify(payload)
+  response.headers['Cache-Control'] = 'no-store'
+  if not services_ready():
+      return response, 503
+  return response
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+  """API: 服务运行指标（各状态检索耗时）"""
+  return jsonify({
+      'retrieval': retrieval_stats_snapshot(),
+      'fact_fast_path': fact_path_stats_snapshot(),
+      'llm': llm_usage_snapshot(),
+      'admission': {
+          ctl.endpoint: ctl.snapshot() for ctl in (ask_admission, deepseek_admission)
+      },
+      'llm_scheduler': provider_scheduler.snapshot(),
+      'deepseek_jobs': deepseek_jobs.snapshot(),
+      'cache': caches.snapshot(),
+      'answer_invalidation': dict(answer_deps.snapshot(), regeneration=answer_regenerator.snapshot()),
+      'startup': startup.profile.snapshot(),
+      'embedding': embeddings.runtime_snapshot(query_embedder) if query_embedder else None
+  })
+
+
+def deepseek_web_search(question, deadline=None):
+  """调用 Deepseek 进行联网搜索并生成答案（deadline 为 time.monotonic() 时间点，默认 LLM_DEADLINE_S 秒后），出错时抛出异常"""
+  deepseek_client = provider_client('deepseek')
+
+  prompt = f"""你是一个专业的国际HR顾问助手。请回答用户关于全球用工政策的问题。
 
-          .loading-text {
-              margin-top: 20px;
-              font-size: 16px;
-          }
+用户问题：{question}
 
-          /* Footer */
-          .footer {
-              text-align: center;
-              margin-top: 50px;
-              padding: 30px;
-              color: var(--text-secondary);
-              font-size: 14px;
-          }
+请通过联网搜索获取最新信息，并以清晰、专业的格式回答。如果无法确定具体数据，请说明信息来源的不确定性。
 
-          .footer-links {
-              display: flex;
-              justify-content: center;
-              gap: 30px;
-              margin-top: 15px;
-          }
+回答格式要求：
+1. 直接给出答案要点
+2. 使用简洁的列表或段落
+3. 如有相关法规或政策依据，请简要说明
+4. 注明信息来源（如官网、法规等）
 
-          .footer-links a {
-              color: var(--ui-green);
-              text-decoration: none;
-              font-weight: 500;
-              transition: color 0.3s;
-          }
+回答："""
 
-          .footer-links a:hover {
-              color: var(--sand);
-          }
+  max_tokens = 2000
+  deadline = deadline or time.monotonic() + LLM_DEADLINE_S
 
-          /* Responsive */
-          @media (max-width: 768px) {
-              .title-section {
-                  flex-direction: column;
-                  gap: 10px;
-              }
-
-              .globe-icon {
-                  font-size: 40px;
-              }
-
-              .header h1 {
-                  font-size: 2em;
-              }
-
-              .stats-bar {
-                  flex-direction: column;
-                  gap: 20px;
-              }
-
-              .example-grid {
-                  grid-template-columns: 1fr;
-              }
-
-              .card {
-                  padding: 25px;
-              }
-
-              .search-button {
-                  position: static;
-                  transform: none;
-                  width: 100%;
-                  margin-top: 10px;
-              }
-
-              #question {
-                  padding: 20px;
-              }
-          }
-      </style>
-  </head>
-  <body>
-      <div class="globe-grid"></div>
-
-      <div class="container">
-          <div class="header">
-              <div class="title-section">
-                  <div class="globe-icon" onclick="window.location.reload()">🌍</div>
-                  <h1>全球用工智能问答</h1>
-              </div>
-              <p class="subtitle">Global Employment Intelligence Platform</p>
-
-              <div class="stats-bar">
-                  <div class="stat-item">
-                      <div class="stat-number">43</div>
-                      <div class="stat-label">覆盖国家</div>
-                  </div>
-                  <div class="stat-item">
-                      <div class="stat-number">AI</div>
-                      <div class="stat-label">智能检索</div>
-                  </div>
-                  <div class="stat-item">
-                      <div class="stat-number">24/7</div>
-                      <div class="stat-label">随时查询</div>
-                  </div>
-              </div>
-          </div>
-
-          <div class="card">
-              <div class="search-box">
-                  <input
-                      type="text"
-                      id="question"
-                      placeholder="输入您的问题，例如：巴西的年假是多少天？"
-                  />
-                  <button class="search-button" onclick="askQuestion()">
-                      🔍 查询
-                  </button>
-              </div>
-
-              <div class="examples">
-                  <h3>💡 热门问题</h3>
-                  <div class="example-grid">
-                      <span class="tag" onclick="fillQuestion('巴西的年假是多少天？')">🇧🇷 巴西年假</span>
-                      <span class="tag" onclick="fillQuestion('德国的试用期有多长？')">🇩🇪 德国试用期</span>
-                      <span class="tag" onclick="fillQuestion('美国的法定假日有多少天？')">🇺🇸 美国假日</span>
-                      <span class="tag" onclick="fillQuestion('新加坡的病假规定是什么？')">🇸🇬 新加坡病假</span>
-                      <span class="tag" onclick="fillQuestion('法国的年假是多少天？')">🇫🇷 法国的年假</span>
-                      <span class="tag" onclick="fillQuestion('澳大利亚的合同期限规定？')">🇦🇺 澳洲合同</span>
-                      <span class="tag" onclick="fillQuestion('印度的最低工资标准？')">🇮🇳 印度工资</span>
-                      <span class="tag" onclick="fillQuestion('日本的加班政策')">🇯🇵 日本加班</span>
-                  </div>
-              </div>
-
-              <div id="result" class="result" style="display: none;">
-                  <div class="answer" id="answer"></div>
-              </div>
-
-              <div id="loading" class="loading" style="display: none;">
-                  <div class="spinner"></div>
-                  <p class="loading-text">AI 正在分析全球用工数据...</p>
-              </div>
-          </div>
-
-          <div class="footer">
-              <p>基于 43 个国家的官方用工政策数据 · 由 Claude AI 提供智能分析</p>
-              <div class="footer-links">
-                  <a href="https://mp.weixin.qq.com/mp/appmsgalbum?__biz=MzkwMDMzMTY2Mg==&action=getalbum&album_id=2668531001535954946" target="_blank">📚 数据来源：Horizons</a>
-              </div>
-          </div>
-      </div>
-
-      <script>
-          function fillQuestion(text) {
-              console.log('=== fillQuestion 被调用 ===');
-              const questionInput = document.getElementById('question');
-              if (questionInput) {
-                  questionInput.value = text;
-                  questionInput.focus();
-                  // 自动触发查询
-                  askQuestion();
-              } else {
-                  console.error('找不到 question 输入框');
-              }
-          }
+  def call():
+      raw = deepseek_client.chat.completions.with_raw_response.create(
+          model="deepseek-chat",
+          max_tokens=max_tokens,
+          timeout=max(0.1, deadline - time.monotonic()),
+          messages=[{
+              "role": "user",
+              "content": prompt
+          }],
+          extra_body={"search": True}  # 启用联网搜索
+      )
+      response = raw.parse()
+      prompt_tokens = getattr(getattr(response, 'usage', None), 'prompt_tokens', 0) or 0
+      return response, raw.headers, prompt_tokens + max_tokens
 
-          // formatAnswer v2 - 支持链接转换
-          function formatAnswer(answer) {
-              let lines = answer.split(String.fromCharCode(10));
-              let result = [];
-              let inList = false;
-              let listItems = [];
-              
-              for (let i = 0; i < lines.length; i++) {
-                  let line = lines[i];
-                  let trimmed = line.trim();
-                  
-                  // 跳过空行处理，但保留一个
-                  if (!trimmed) {
-                      if (inList) {
-                          result.push('</div>');
-                          inList = false;
-                          listItems = [];
-                      }
-                      continue;
-                  }
-                  
-                  // 分隔线 ---
-                  if (trimmed === '---') {
-                      if (inList) {
-                          result.push('</div>');
-                          inList = false;
-                      }
-                      result.push('<hr style="border:none;border-top:1px solid #E8FFF9;margin:20px 0;">');
-                      continue;
-                  }
-                  
-                  // 标题 ##
-                  if (trimmed.startsWith('## ')) {
-                      if (inList) {
-                          result.push('</div>');
-                          inList = false;
-                      }
-                      result.push('<h3 style="color:#00726d;font-size:1.3em;margin:20px 0 12px 0;padding-bottom:8px;border-bottom:2px solid #E8FFF9;">' + trimmed.substring(3) + '</h3>');
-                      continue;
-                  }
-                  if (trimmed.startsWith('### ')) {
-                      if (inList) {
-                          result.push('</div>');
-                          inList = false;
-                      }
-                      result.push('<h4 style="color:#002D28;font-size:1.1em;margin:16px 0 8px 0;">' + trimmed.substring(4) + '</h4>');
-                      continue;
-                  }
-                  
-                  // 引用块 >
-                  if (trimmed.startsWith('> ')) {
-                      if (inList) {
-                          result.push('</div>');
-                          inList = false;
-                      }
-                      result.push('<blockquote style="margin:12px 0;padding:12px 16px;background:#F5FAF9;border-left:4px solid #CEA472;color:#666;font-size:0.95em;">' + trimmed.substring(2) + '</blockquote>');
-                      continue;
-                  }
-                  
-                  // 先检查是否是列表项（在转换行内格式前，避免链接被分割）
-                  // 数字列表 1. 2. 3.
-                  let numMatch = trimmed.match(/^(\d+)\.\s+(.+)$/);
-                  // 无序列表 - * •
-                  let bulletMatch = trimmed.match(/^[-\*•]\s+(.+)$/);
-                  
-                  // 处理行内格式
-                  // Markdown 链接 [text](url) - 匹配到右括号结束
-                  line = line.replace(/\[([^\]]+)\]\((https?:\/\/[^)]+)\)/g, '<a href="$2" target="_blank" style="color:#00726d;text-decoration:none;font-weight:500;">$1</a>');
-                  
-                  // 加粗 **文本**
-                  line = line.replace(/\*\*([^*]+)\*\*/g, '<strong style="color:#00726d;">$1</strong>');
-                  
-                  // 移除代码块符号和中文方括号
-                  line = line.replace(/`/g, '').replace(/【/g, '').replace(/】/g, '');
-                  
-                  // 处理数字列表
-                  if (numMatch) {
-                      if (!inList) {
-                          result.push('<div style="margin:12px 0;">');
-                          inList = true;
-                      }
-                      // 提取列表项内容（去掉序号）
-                      let content = line.replace(/^\s*\d+\.\s*/, '');
-                      result.push('<div style="margin:6px 0;padding-left:20px;"><span style="color:#00726d;font-weight:600;">' + numMatch[1] + '.</span> ' + content + '</div>');
-                      continue;
-                  }
-                  
-                  // 处理无序列表
-                  if (bulletMatch) {
-                      if (!inList) {
-                          result.push('<div style="margin:12px 0;">');
-                          inList = true;
-                      }
-                      // 提取列表项内容（去掉 bullet）
-                      let content = line.replace(/^\s*[-\*•]\s*/, '');
-                      result.push('<div style="margin:6px 0;padding-left:20px;"><span style="color:#CEA472;margin-right:8px;">•</span>' + content + '</div>');
-                      continue;
-                  }
-                  
-                  // 普通段落
-                  if (inList) {
-                      result.push('</div>');
-                      inList = false;
-                  }
-                  result.push('<p style="margin:10px 0;line-height:1.8;">' + line + '</p>');
-              }
-              
-              if (inList) {
-                  result.push('</div>');
-              }
-              
-              return result.join('');
-          }
+  # 与答案生成共用 DeepSeek 的 RPM / TPM 预算；限流时任务失败，由 /api/deepseek 返回 503
+  response = provider_scheduler.call(
+      'deepseek', call, context_packing.estimate_tokens(prompt) + max_tokens, deadline)
 
-          async function askQuestion() {
-              console.log('=== askQuestion 被调用 ===');
-              const questionInput = document.getElementById('question');
-              const resultDiv = document.getElementById('result');
-              const loadingDiv = document.getElementById('loading');
-              const answerDiv = document.getElementById('answer');
-              
-              if (!questionInput || !resultDiv || !loadingDiv || !answerDiv) {
-                  console.error('找不到必要的DOM元素');
-                  alert('页面加载错误，请刷新页面重试');
-                  return;
-              }
-              
-              const question = questionInput.value.trim();
-              console.log('问题:', question);
-
-              if (!question) {
-                  alert('请输入问题');
-                  questionInput.focus();
-                  return;
-              }
-
-              console.log('开始查询...');
-
-              // 显示加载
-              resultDiv.style.display = 'none';
-              loadingDiv.style.display = 'block';
-
-              try {
-                  console.log('发送 fetch 请求到 /api/ask');
-                  const response = await fetch('/api/ask', {
-                      method: 'POST',
-                      headers: {
-                          'Content-Type': 'application/json'
-                      },
-                      body: JSON.stringify({ question })
-                  });
-
-                  console.log('响应状态:', response.status);
-
-                  if (!response.ok) {
-                      throw new Error('HTTP错误: ' + response.status);
-                  }
-
-                  const data = await response.json();
-                  console.log('响应数据:', data);
-
-                  if (data.error) {
-                      answerDiv.innerHTML = '<div style="color: #dc3545; padding: 10px; background: #f8d7da; border-radius: 8px;">错误: ' + data.error + '</div>';
-                  } else if (data.not_found) {
-                      // 知识库无答案，显示 Deepseek 求助按钮
-                      console.log('知识库未找到答案，状态:', data.status, '国家:', data.country);
-                      answerDiv.innerHTML = renderNotFoundPrompt(question, data.status, data.country);
-                  } else if (data.answer) {
-                      console.log('原始答案长度:', data.answer.length);
-                      // 格式化答案：美化显示
-                      const formatted = formatAnswer(data.answer);
-                      console.log('格式化后长度:', formatted.length);
-                      // 添加 Deepseek 拓展搜索按钮
-                      const deepseekButton = renderDeepseekButton(question, '拓展搜索');
-                      answerDiv.innerHTML = formatted + deepseekButton;
-                  } else {
-                      answerDiv.innerHTML = '<div style="color: #856404; padding: 10px; background: #fff3cd; border-radius: 8px;">未获取到答案</div>';
-                  }
-
-                  loadingDiv.style.display = 'none';
-                  resultDiv.style.display = 'block';
-                  console.log('查询完成');
-
-              } catch (error) {
-                  console.error('查询错误:', error);
-                  answerDiv.innerHTML = '<div style="color: #dc3545; padding: 10px; background: #f8d7da; border-radius: 8px;">发生错误: ' + error.message + '</div>';
-                  loadingDiv.style.display = 'none';
-                  resultDiv.style.display = 'block';
-              }
-          }
+  if response.choices and len(response.choices) > 0:
+      return response.choices[0].message.content
+  return "抱歉，Deepseek 未能生成有效答案。"
 
-          // 渲染知识库无答案时的提示界面
-          function renderNotFoundPrompt(question, status, country) {
-              let title = '未找到相关答案';
-              let description = '';
-              let icon = '🔍';
-              
-              if (status === 'no_country') {
-                  icon = '🌍';
-                  title = `${country} 暂未收录`;
-                  description = `目前知识库暂未收录 <strong style="color: #00726d;">${country}</strong> 的用工指南数据。`;
-              } else if (status === 'no_content') {
-                  icon = '📚';
-                  title = `${country} 数据缺失`;
-                  description = `知识库中暂无 <strong style="color: #00726d;">${country}</strong> 的详细用工指南数据。`;
-              } else if (status === 'irrelevant') {
-                  icon = '❓';
-                  title = `${country} 暂无相关内容`;
-                  description = `知识库中收录了 <strong style="color: #00726d;">${country}</strong> 的用工指南，但未找到与您问题相关的内容。`;
-              } else {
-                  description = '在 <strong style="color: #00726d;">43 个国家</strong> 的用工指南知识库中，没有找到与您问题相关的内容。';
-              }
-              
-              return `
-              <div style="text-align: center; padding: 40px 20px;">
-                  <div style="font-size: 48px; margin-bottom: 20px;">${icon}</div>
-                  <h3 style="color: #002D28; font-size: 1.3em; margin-bottom: 16px;">${title}</h3>
-                  <p style="color: #666; font-size: 15px; line-height: 1.6; margin-bottom: 24px; max-width: 500px; margin-left: auto; margin-right: auto;">
-                      ${description}
-                  </p>
-                  <div style="background: linear-gradient(135deg, #E8FFF9 0%, #F5FAF9 100%); border-radius: 16px; padding: 24px; margin: 20px 0; border: 1px solid rgba(0, 114, 109, 0.15);">
-                      <div style="font-size: 32px; margin-bottom: 12px;">🤖</div>
-                      <p style="color: #333; font-size: 14px; margin-bottom: 16px;">
-                          您可以通过 Deepseek AI 进行<strong style="color: #00726d;">联网搜索</strong>获取答案
-                      </p>
-                      <button onclick='callDeepseekSearch("${question.replace(/"/g, '\\"')}")' 
-                              style="background: linear-gradient(135deg, #00726d, #002D28); 
-                                     color: white; border: none; padding: 14px 32px; 
-                                     border-radius: 12px; font-size: 15px; font-weight: 600; 
-                                     cursor: pointer; transition: all 0.3s ease;
-                                     box-shadow: 0 4px 15px rgba(0, 114, 109, 0.3);">
-                          ✨ 求助 Deepseek 联网搜索
-                      </button>
-                  </div>
-                  <p style="color: #999; font-size: 12px; margin-top: 16px;">
-                      💡 提示：您也可以尝试换个问法，或询问其他国家/地区的用工政策
-                  </p>
-              </div>
-              `;
-          }
 
-          // 渲染 Deepseek 拓展搜索按钮（用于正确答案底部）
-          function renderDeepseekButton(question, buttonText = '拓展搜索更多内容') {
-              return `
-              <div style="margin-top: 30px; padding: 20px; background: linear-gradient(135deg, #E8FFF9 0%, #F5FAF9 100%); border-radius: 16px; border: 1px solid rgba(0, 114, 109, 0.15); text-align: center;">
-                  <div style="display: flex; align-items: center; justify-content: center; gap: 10px; margin-bottom: 12px;">
-                      <span style="font-size: 24px;">🤖</span>
-                      <span style="color: #002D28; font-weight: 600; font-size: 14px;">想要了解更多？</span>
-                  </div>
-                  <p style="color: #666; font-size: 13px; margin-bottom: 15px;">
-                      通过 Deepseek AI 联网搜索获取更多相关信息
-                  </p>
-                  <button onclick='callDeepseekSearch("${question.replace(/"/g, '\\"')}")' 
-                          style="background: linear-gradient(135deg, #00726d, #002D28); 
-                                 color: white; border: none; padding: 12px 28px; 
-                                 border-radius: 10px; font-size: 14px; font-weight: 600; 
-                                 cursor: pointer; transition: all 0.3s ease;
-                                 box-shadow: 0 4px 15px rgba(0, 114, 109, 0.3);">
-                      🔍 ${buttonText}
-                  </button>
-              </div>
-              `;
-          }
+def run_deepseek_job(question, speculative):
+  """后台任务：占用 /api/deepseek 的名额后联网搜索（预取任务优先级较低），过载 / 限流 / 出错时任务失败"""
+  priority = admission.PRIORITY_BACKGROUND if speculative else admission.PRIORITY_INTERACTIVE
+  with deepseek_admission.slot(priority=priority):
+      return deepseek_web_search(question)
 
-          // 调用 Deepseek 联网搜索
-          async function callDeepseekSearch(question) {
-              console.log('=== 调用 Deepseek 搜索 ===');
-              const resultDiv = document.getElementById('result');
-              const loadingDiv = document.getElementById('loading');
-              const answerDiv = document.getElementById('answer');
-              
-              // 显示加载状态
-              resultDiv.style.display = 'none';
-              loadingDiv.style.display = 'block';
-              
-              // 更新加载文本
-              const loadingText = loadingDiv.querySelector('.loading-text');
-              if (loadingText) {
-                  loadingText.textContent = 'Deepseek AI 正在联网搜索全球用工数据...';
-              }
-
-              try {
-                  const response = await fetch('/api/deepseek', {
-                      method: 'POST',
-                      headers: {
-                          'Content-Type': 'application/json'
-                      },
-                      body: JSON.stringify({ question })
-                  });
-
-                  if (!response.ok) {
-                      throw new Error('HTTP错误: ' + response.status);
-                  }
-
-                  const data = await response.json();
-                  console.log('Deepseek 响应:', data);
-
-                  if (data.error) {
-                      answerDiv.innerHTML = '<div style="color: #dc3545; padding: 10px; background: #f8d7da; border-radius: 8px;">错误: ' + data.error + '</div>';
-                  } else if (data.answer) {
-                      // 格式化 Deepseek 答案，添加来源标记
-                      const formattedAnswer = formatDeepseekAnswer(data.answer);
-                      answerDiv.innerHTML = formattedAnswer;
-                  } else {
-                      answerDiv.innerHTML = '<div style="color: #856404; padding: 10px; background: #fff3cd; border-radius: 8px;">Deepseek 未能生成答案</div>';
-                  }
-
-              } catch (error) {
-                  console.error('Deepseek 调用错误:', error);
-                  answerDiv.innerHTML = '<div style="color: #dc3545; padding: 10px; background: #f8d7da; border-radius: 8px;">调用 Deepseek 时出错: ' + error.message + '</div>';
-              } finally {
-                  loadingDiv.style.display = 'none';
-                  resultDiv.style.display = 'block';
-                  // 恢复加载文本
-                  const loadingText = loadingDiv.querySelector('.loading-text');
-                  if (loadingText) {
-                      loadingText.textContent = 'AI 正在分析全球用工数据...';
-                  }
-              }
-          }
 
-          // 格式化 Deepseek 答案
-          function formatDeepseekAnswer(answer) {
-              // 添加 Deepseek 来源标记
-              let formatted = `
-              <div style="background: linear-gradient(135deg, #E8FFF9 0%, #F5FAF9 100%); padding: 16px 20px; border-radius: 12px; margin-bottom: 20px; border-left: 4px solid #00726d;">
-                  <div style="display: flex; align-items: center; gap: 10px; margin-bottom: 8px;">
-                      <span style="font-size: 20px;">🤖</span>
-                      <span style="color: #002D28; font-weight: 600; font-size: 14px;">Deepseek AI 联网搜索</span>
-                      <span style="background: #00726d; color: white; padding: 2px 8px; border-radius: 4px; font-size: 11px;">联网</span>
-                  </div>
-                  <p style="color: #666; font-size: 12px; margin: 0;">以下内容通过 Deepseek AI 联网搜索生成，仅供参考</p>
-              </div>
-              `;
-              
-              // 使用相同的 formatAnswer 函数处理内容
-              formatted += formatAnswer(answer);
-              
-              // 添加免责声明
-              formatted += `
-              <div style="margin-top: 24px; padding: 16px; background: #FFF8F0; border-radius: 12px; border-left: 4px solid #CEA472;">
-                  <p style="color: #886644; font-size: 12px; margin: 0; line-height: 1.6;">
-                      <strong style="color: #CEA472;">⚠️ 免责声明：</strong>
-                      以上内容由 AI 联网搜索生成，可能存在信息滞后或不准确的情况。
-                      重要决策前请核实官方最新政策或咨询专业法律顾问。
-                  </p>
-              </div>
-              `;
-              
-              return formatted;
-          }
+# 过载 / 限流导致的失败：客户端稍后重试即可
+RETRYABLE_JOB_ERRORS = ('Overloaded', 'RateLimited', 'JobQueueFull')
 
-          // 确保DOM加载完成后再绑定事件
-          document.addEventListener('DOMContentLoaded', function() {
-              document.getElementById('question').addEventListener('keypress', function(e) {
-                  if (e.key === 'Enter') {
-                      askQuestion();
-                  }
-              });
-          });
-      </script>
-  </body>
-  </html>
-  """
-  return render_template_string(html)
 
-@app.route('/api/ask', methods=['POST'])
-def ask():
-  """API: 回答问题"""
-  try:
-      data = request.json
-      question = data.get('question', '')
+def deepseek_job_urls(job_id):
+  return {
+      'poll': f'/api/deepseek/jobs/{job_id}',
+      'events': f'/api/deepseek/jobs/{job_id}/events'
+  }
 
-      if not question:
-          return jsonify({'error': '问题不能为空'}), 400
 
-      # 查询知识库，同时获取状态信息
-      result = query_knowledge_base_with_status(question, top_k=3)
-      contexts = result.get('contexts', [])
-      status = result.get('status', 'not_found')
-      country = result.get('country', '')
+def deepseek_job_payload(job):
+  """任务的对外表示：进行中时给出轮询 / 订阅地址，完成时给出答案"""
+  payload = {'job_id': job['id'], 'status': job['status']}
+  if job['status'] == 'done':
+      payload.update({'answer': job['answer'], 'source': 'deepseek_search'})
+      if job['speculative']:
+          payload['prefetched'] = True
+  elif job['status'] == 'failed':
+      if job['error_kind'] in RETRYABLE_JOB_ERRORS:
+          payload.update({'error': '联网搜索请求过多，请稍后再试', 'overloaded': True})
+      else:
+          payload['error'] = f"抱歉，调用 Deepseek 时出错：{job['error']}"
+  else:
+      payload.update(deepseek_job_urls(job['id']))
+  return payload
 
-      if not contexts:
-          return jsonify({
-              'not_found': True,
-              'status': status,  # 'no_country' | 'no_content' | 'irrelevant'
-              'country': country,
-              'answer': '',
-              'sources': []
-          })
 
-      # 生成答案
-      answer = generate_answer(question, contexts)
+def overloaded_response(payload=None):
+  response = jsonify(payload or {'error': '联网搜索请求过多，请稍后再试', 'overloaded': True})
+  response.headers['Retry-After'] = str(max(1, DEEPSEEK_MAX_WAIT_MS // 1000))
+  return response, 503
 
-      return jsonify({
-          'answer': answer,
-          'sources': contexts
-      })
 
-  except Exception as e:
-      print(f"错误: {str(e)}")
-      return jsonify({'error': str(e)}), 500
+def submit_deepseek_job():
+  """读取请求中的问题并提交任务，返回 (任务, 错误响应)"""
+  data = request.get_json(silent=True) or {}
+  question = (data.get('question') or '').strip()
 
+  if not normalize_question(question):
+      return None, (jsonify({'error': '问题不能为空'}), 400)
+  if not os.environ.get('DEEPSEEK_API_KEY'):
+      return None, (jsonify({'error': '抱歉，Deepseek 服务暂时不可用。'}), 503)
 
-def call_deepseek_search(question):
-  """调用 Deepseek 进行联网搜索并生成答案"""
-  deepseek_key = os.environ.get('DEEPSEEK_API_KEY')
-  if not deepseek_key:
-      return "抱歉，Deepseek 服务暂时不可用。"
-  
+  # 同一问题已有进行中或未过期的任务（包括预取）时直接共享
   try:
-      from openai import OpenAI
-      deepseek_client = OpenAI(
-          api_key=deepseek_key,
-          base_url="https://api.deepseek.com"
-      )
-      
-      prompt = f"""你是一个专业的国际HR顾问助手。请回答用户关于全球用工政策的问题。
+      # 任务按规范化后的问题去重，联网搜索使用原文
+      return deepseek_jobs.submit(question, key=normalize_question(question)), None
+  except jobs.JobQueueFull as e:
+      print(f"  {e}")
+      return None, overloaded_response()
 
-用户问题：{question}
 
-请通过联网搜索获取最新信息，并以清晰、专业的格式回答。如果无法确定具体数据，请说明信息来源的不确定性。
-
-回答格式要求：
-1. 直接给出答案要点
-2. 使用简洁的列表或段落
-3. 如有相关法规或政策依据，请简要说明
-4. 注明信息来源（如官网、法规等）
-
-回答："""
-      
-      response = deepseek_client.chat.completions.create(
-          model="deepseek-chat",
-          max_tokens=2000,
-          messages=[{
-              "role": "user",
-              "content": prompt
-          }],
-          extra_body={"search": True}  # 启用联网搜索
-      )
-      
-      if response.choices and len(response.choices) > 0:
-          return response.choices[0].message.content
-      else:
-          return "抱歉，Deepseek 未能生成有效答案。"
-          
-  except Exception as e:
-      print(f"Deepseek 调用错误: {str(e)}")
-      return f"抱歉，调用 Deepseek 时出错：{str(e)}"
+def deepseek_job_response(job):
+  payload = deepseek_job_payload(job)
+  if job['status'] == 'failed' and payload.get('overloaded'):
+      return overloaded_response(payload)
+  if job['status'] not in jobs.FINISHED:
+      response = jsonify(payload)
+      response.headers['Location'] = payload['poll']
+      return response, 202
+  return jsonify(payload)
 
 
 @app.route('/api/deepseek', methods=['POST'])
 def deepseek_search():
-  """API: 使用 Deepseek 联网搜索回答问题"""
+  """API: 使用 Deepseek 联网搜索回答问题（在请求截止时间内等待后台任务；未完成时返回 202 与任务地址）"""
   try:
-      data = request.json
-      question = data.get('question', '')
-
-      if not question:
-          return jsonify({'error': '问题不能为空'}), 400
-
-      # 调用 Deepseek 进行联网搜索
-      answer = call_deepseek_search(question)
-
-      return jsonify({
-          'answer': answer,
-          'source': 'deepseek_search'
-      })
+      deadline = request_deadline(int(LLM_DEADLINE_S * 1000))
+      job, error = submit_deepseek_job()
+      if error:
+          return error
+      job = deepseek_jobs.wait(job['id'], deadline - time.monotonic())
+      return deepseek_job_response(job)
 
   except Exception as e:
       print(f"Deepseek API 错误: {str(e)}")
       return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/deepseek/jobs', methods=['POST'])
+def create_deepseek_job():
+  """API: 提交联网搜索任务，立即返回任务ID（202）；已有完成的结果时直接返回（200）"""
+  job, error = submit_deepseek_job()
+  if error:
+      return error
+  return deepseek_job_response(job)
+
+
+@app.route('/api/deepseek/jobs/<job_id>', methods=['GET'])
+def get_deepseek_job(job_id):
+  """API: 查询任务状态（轮询）"""
+  job = deepseek_jobs.get(job_id)
+  if job is None:
+      return jsonify({'error': '任务不存在或已过期'}), 404
+  response = jsonify(deepseek_job_payload(job))
+  response.headers['Cache-Control'] = 'no-store'
+  return response
+
+
+@app.route('/api/deepseek/jobs/<job_id>/events', methods=['GET'])
+def deepseek_job_events(job_id):
+  """API: 通过 SSE 订阅任务，完成时推送 done 事件；等待期间每 SSE_HEARTBEAT_S 秒推送一次 status 保持连接"""
+  job = deepseek_jobs.get(job_id)
+  if job is None:
+      return jsonify({'error': '任务不存在或已过期'}), 404
+
+  def event(name, payload):
+      return f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+  def stream(job):
+      while job is not None and job['status'] not in jobs.FINISHED:
+          yield event('status', {'job_id': job_id, 'status': job['status']})
+          job = deepseek_jobs.wait(job_id, SSE_HEARTBEAT_S)
+      if job is None:
+          yield event('done', {'job_id': job_id, 'status': 'failed', 'error': '任务不存在或已过期'})
+      else:
+          yield event('done', deepseek_job_payload(job))
+
+  return Response(stream_with_context(stream(job)), mimetype='text/event-stream', headers={
+      'Cache-Control': 'no-store',
+      'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲事件
+  })
+
+
 if __name__ == '__main__':
   print("="*60)
   print("启动全球用工智能问答服务（全新设计）")
   print("="*60)
 
-  try:
-      init_services()
-      # 从环境变量获取端口（Render 会使用 PORT 环境变量）
-      port = int(os.environ.get('PORT', 5002))
-      print(f"\n✓ 服务已启动: http://0.0.0.0:{port}")
-      print("  按 Ctrl+C 停止服务\n")
-      app.run(host='0.0.0.0', port=port, debug=False)
-  except Exception as e:
-      print(f"\n✗ 启动失败: {str(e)}")
-      print("  请确保已运行: python build_knowledge_base.py")
+  # 先开始监听端口（首页可用），知识库在后台加载，加载完成前 /api/ask 返回 503（见 /api/ready）
+  init_services_in_background()
+  # 从环境变量获取端口（Render 会使用 PORT 环境变量）
+  port = int(os.environ.get('PORT', 5002))
+  print(f"\n✓ 服务已启动: http://0.0.0.0:{port}（知识库加载中）")
+  print("  按 Ctrl+C 停止服务\n")
+  app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,790 @@
+"""
+检索器 - 问题分类、国家识别、关键词评分、向量补充 / RRF 融合与 top-k 选择，不依赖 Flask
+
+Web 服务、benchmark.py 与离线脚本共用同一个 Retriever：
+    retriever = Retriever(collection, RetrieverConfig(mode='hybrid'))
+    result = retriever.retrieve('德国的试用期有多长？', top_k=3)
+段落以 Chunk（__slots__）表示，每个段落 ID 只创建一次并缓存在检索器中；评分结果是 (得分, Chunk) 对，
+不复制段落文本与元数据，只有最终选出的 top-k 转换为上下文字典。候选用 heapq.nlargest 选出，不做全量排序。
+指定国家与未指定国家走同一条流程（Retriever._rank），差别只在候选来源、评分方式与阈值。
+传入 cache（shared_cache 的 retrieval 命名空间）时，检索结果按签名缓存：知识库版本、检索参数与近重复簇的摘要、
+模式、top_k、识别出的国家、HR术语与去掉停用词后的关键词。措辞不同但签名相同的问题共用结果，
+命中时只需规范化与计算签名；用到向量检索的结果还取决于问题原文，只对同一问题有效。缓存中只有段落 ID、得分与状态，
+命中时段落从检索器的缓存（或按 ID 读取）还原。
+"""
+
+import hashlib
+import heapq
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from operator import itemgetter
+
+import normalization
+import startup
+
+RETRIEVAL_MODES = ('lexical', 'hybrid')
+
+
+_jieba = None
+_jieba_lock = threading.Lock()
+
+
+def cut_words(text):
+    """jieba 分词（服务在后台初始化时导入 jieba；独立使用时第一次分词才导入，并发检索只导入一次）"""
+    global _jieba
+    if _jieba is None:
+        with _jieba_lock:
+            if _jieba is None:
+                _jieba = startup.profile.lazy_import('jieba')
+    return _jieba.cut(text)
+
+
+# 支持的国家列表（知识库中有数据的国家）- 实际43个
+SUPPORTED_COUNTRIES = ['英国', '美国', '德国', '法国', '日本', '韩国', '新加坡', '中国香港', '中国台湾',
+                       '巴西', '阿根廷', '墨西哥', '加拿大', '澳大利亚', '新西兰', '印度', '泰国',
+                       '越南', '印度尼西亚', '菲律宾', '马来西亚', '土耳其', '沙特阿拉伯', '阿联酋',
+                       '意大利', '西班牙', '荷兰', '比利时', '瑞士', '瑞典', '丹麦', '挪威',
+                       '波兰', '俄罗斯', '南非', '埃及', '以色列', '卡塔尔',
+                       '哈萨克斯坦', '乌兹别克斯坦', '吉尔吉斯斯坦', '塔吉克斯坦', '土库曼斯坦',
+                       '吉尔吉斯共和国', '加纳', '匈牙利', '卢森堡', '保加利亚',
+                       '拉脱维亚', '斯洛伐克', '秘鲁', '罗马尼亚', '阿尔及利亚',
+                       '多米尼加共和国', '尼日利亚', '哥伦比亚', '哥斯达黎加',
+                       '希腊', '马耳他', '巴基斯坦']
+
+# 国家名称别名映射（简称 -> 标准名）
+COUNTRY_ALIASES = {
+    '印尼': '印度尼西亚',
+    '大马': '马来西亚',
+    'UK': '英国',
+    'USA': '美国',
+    'US': '美国',
+    'America': '美国',
+    '德国': '德国',
+    'Deutschland': '德国',
+    '法国': '法国',
+    '日本': '日本',
+    '韩国': '韩国',
+    '俄国': '俄罗斯',
+    '澳洲': '澳大利亚',
+}
+
+# 常见的国家名列表（用于检测用户是否询问了不在支持列表中的国家）
+ALL_COUNTRY_KEYWORDS = SUPPORTED_COUNTRIES + [
+    '中国', '中国大陆', '朝鲜', '蒙古', '缅甸', '老挝', '柬埔寨', '伊朗', '伊拉克', '叙利亚', '约旦', '黎巴嫩',
+    '哈萨克斯坦', '乌兹别克斯坦', '吉尔吉斯斯坦', '塔吉克斯坦', '土库曼斯坦',
+    '也门', '阿曼', '科威特', '巴林', '卡塔尔', '利比亚', '突尼斯', '阿尔及利亚', '摩洛哥', '苏丹', '埃塞俄比亚',
+    '肯尼亚', '坦桑尼亚', '乌干达', '赞比亚', '津巴布韦', '博茨瓦纳', '纳米比亚', '安哥拉', '莫桑比克', '马达加斯加',
+    '毛里求斯', '塞舌尔', '尼日利亚', '加纳', '科特迪瓦', '塞内加尔', '喀麦隆', '刚果', '卢旺达', '布隆迪',
+    '冰岛', '爱尔兰', '葡萄牙', '希腊', '奥地利', '芬兰', '卢森堡', '捷克', '斯洛伐克', '匈牙利', '罗马尼亚',
+    '保加利亚', '塞尔维亚', '克罗地亚', '斯洛文尼亚', '乌克兰', '白俄罗斯', '立陶宛', '拉脱维亚', '爱沙尼亚',
+    '巴基斯坦', '孟加拉', '斯里兰卡', '尼泊尔', '不丹', '马尔代夫', '阿富汗', '乌兹别克斯坦', '土库曼斯坦',
+    '吉尔吉斯斯坦', '塔吉克斯坦', '格鲁吉亚', '阿塞拜疆', '亚美尼亚', '韩国', '朝鲜', '文莱', '老挝', '东帝汶',
+    '巴布亚新几内亚', '斐济', '汤加', '萨摩亚', '瓦努阿图', '所罗门群岛', '基里巴斯', '瑙鲁', '帕劳', '图瓦卢',
+    '古巴', '牙买加', '海地', '多米尼加', '巴哈马', '巴巴多斯', '特立尼达和多巴哥', '格林纳达', '圣卢西亚',
+    '圣文森特和格林纳丁斯', '安提瓜和巴布达', '圣基茨和尼维斯', '伯利兹', '危地马拉', '洪都拉斯', '萨尔瓦多',
+    '尼加拉瓜', '哥斯达黎加', '巴拿马', '哥伦比亚', '委内瑞拉', '厄瓜多尔', '秘鲁', '玻利维亚', '巴拉圭', '乌拉圭',
+    '智利', '圭亚那', '苏里南', '法属圭亚那', '马尔维纳斯群岛', '格陵兰', '百慕大', '波多黎各', '关岛',
+    '美属维尔京群岛', '英属维尔京群岛', '安圭拉', '蒙特塞拉特', '特克斯和凯科斯群岛', '开曼群岛',
+    '阿鲁巴', '库拉索', '荷属圣马丁', '法属圣马丁', '瓜德罗普', '马提尼克', '留尼汪', '马约特', '法属波利尼西亚',
+    '新喀里多尼亚', '瓦利斯和富图纳', '托克劳', '纽埃', '库克群岛', '皮特凯恩群岛', '圣诞岛', '科科斯群岛',
+    '诺福克岛', '赫德岛和麦克唐纳群岛', '法属南部领地', '布韦岛', '南乔治亚和南桑威奇群岛', '英属印度洋领地',
+    '安道尔', '摩纳哥', '列支敦士登', '圣马力诺', '梵蒂冈', '马耳他', '塞浦路斯', '摩尔多瓦', '黑山',
+    '北马其顿', '波斯尼亚和黑塞哥维那', '阿尔巴尼亚', '科索沃', '直布罗陀', '根西岛', '泽西岛', '马恩岛',
+    '法罗群岛', '奥兰群岛', '斯瓦尔巴群岛', '扬马延岛', '新西伯利亚群岛', '法兰士约瑟夫地群岛',
+    '喀麦隆', '中非', '乍得', '刚果共和国', '刚果民主共和国', '赤道几内亚', '加蓬', '圣多美和普林西比',
+    '科摩罗', '吉布提', '厄立特里亚', '索马里', '南苏丹', '贝宁', '布基纳法索', '佛得角', '冈比亚',
+    '几内亚', '几内亚比绍', '利比里亚', '马里', '毛里塔尼亚', '尼日尔', '塞拉利昂', '多哥', '莱索托',
+    '斯威士兰', '马拉维', '科摩罗', '马约特', '留尼汪', '圣赫勒拿', '阿森松', '特里斯坦-达库尼亚',
+    '西撒哈拉', '索马里兰', '马耳他骑士团', '北塞浦路斯', '南奥塞梯', '阿布哈兹', '纳戈尔诺-卡拉巴赫',
+    '德涅斯特河沿岸', '卢甘斯克', '顿涅茨克', '克里米亚', '塞瓦斯托波尔', '科索沃', '巴勒斯坦',
+    '中华民国', '香港', '台湾', '澳门'
+]
+
+# 明显的"测试"或虚构内容关键词
+FICTIONAL_KEYWORDS = ['火星', '月球', '测试', 'abcdefg', '不存在', '虚拟', '假的', '虚构', '幻想']
+
+# 分词时过滤的疑问词/虚词
+QUESTION_STOPWORDS = ['什么', '哪些', '如何', '怎么', '多少', '为什么', '是否', '有没有', '的', '了', '吗', '呢']
+ALLOWED_SINGLE_CHARS = ['年', '假', '税', '金', '费', '期']
+
+# HR关键术语规则：(任一触发词, 必须同时出现的词, 追加的术语)
+# 触发词同时匹配原问题和小写问题，英文术语（如 probation）不区分大小写
+HR_TERM_RULES = [
+    (('年假',), (), ['年假']),
+    (('试用期', 'probation'), (), ['试用期']),
+    (('工作时长', '工作时间'), (), ['工作时长', '工作时间']),
+    (('加班',), (), ['加班']),
+    (('工资', '薪资', '最低'), (), ['工资', '薪资', '最低']),
+    (('合同',), (), ['合同']),
+    (('休假', '假期'), (), ['休假', '假期']),
+    (('社保', '保险'), (), ['社保', '保险']),
+    (('解雇', '辞退', '离职'), (), ['解雇', '辞退', '离职']),
+    (('招聘', '雇佣'), (), ['招聘', '雇佣']),
+    (('个税', '所得税'), (), ['个税', '所得税']),
+    (('福利',), (), ['福利']),
+    (('工时',), (), ['工时']),
+    (('病假',), (), ['病假']),
+    (('产假',), (), ['产假']),
+    (('陪产假',), (), ['陪产假']),
+    (('育儿假',), (), ['育儿假']),
+    (('法定节假日', '公共假期'), (), ['法定节假日', '公共假期']),
+    (('调休',), (), ['调休']),
+    (('遣散费', '赔偿金'), (), ['遣散费', '赔偿金']),
+    (('竞业禁止', '保密协议'), (), ['竞业禁止', '保密协议']),
+    (('工会',), (), ['工会']),
+    (('歧视',), (), ['歧视']),
+    (('安全',), ('健康',), ['安全', '健康']),
+    (('工伤',), (), ['工伤']),
+    (('移民', '签证', '工作许可', '工作签证'), (), ['移民', '签证', '工作许可', '工作签证']),
+    (('养老金', '退休金'), (), ['养老金', '退休金']),
+    (('医疗',), (), ['医疗']),
+    (('奖金', '年终奖', '十三薪'), (), ['奖金', '年终奖', '十三薪']),
+    (('津贴', '补贴'), (), ['津贴', '补贴']),
+    (('报销',), (), ['报销']),
+    (('培训',), (), ['培训']),
+    (('绩效',), (), ['绩效']),
+    (('考勤',), (), ['考勤']),
+    (('远程工作', '居家办公'), (), ['远程工作', '居家办公']),
+    (('灵活工作',), (), ['灵活工作']),
+    (('最低工资', '底薪'), (), ['最低工资', '底薪']),
+    (('薪酬',), (), ['薪酬']),
+    (('待遇',), (), ['待遇']),
+    (('劳动', '劳工'), (), ['劳动', '劳工']),
+    (('雇佣',), (), ['雇佣']),
+    (('就业',), (), ['就业']),
+    (('HR', '人力资源'), (), ['HR', '人力资源']),
+    (('合规',), (), ['合规']),
+    (('法律',), ('劳动',), ['劳动法']),
+    (('劳动', '雇佣'), ('法规',), ['劳动法规']),
+]
+
+# 相关性阈值
+MIN_RELEVANCE_THRESHOLD = 15  # 指定国家时：最高分低于该值视为不相关
+MIN_SCORE_THRESHOLD = 12      # 未指定国家时：过滤低质量向量结果
+RRF_K = 60  # reciprocal-rank fusion 平滑常数
+
+# 检索各阶段按成本从低到高排列，拒绝类检查尽量靠前，被拒绝的问题不触发任何 I/O：
+#   normalize  字符串整理                         ~1µs
+#   classify   虚构关键词 + HR术语（纯子串匹配）  ~10µs
+#   resolve    国家 / 别名 / 未收录国家扫描        ~20µs
+#   fetch      collection.get 读取该国全部文档     ms 级（磁盘 / SQLite）
+#   score      jieba 分词 + 关键词评分             ms 级（首次加载词典更慢）
+#   supplement collection.query 向量补充检索       数十 ms（需要 embedding）
+
+
+def _hr_trigger(term):
+    """HR术语触发词的匹配函数（作用于规范化后的小写问题）
+
+    中文按子串匹配；英文要求词首边界（probationary 仍命中 probation），
+    规则表中全大写的缩写（HR）前后都要求词边界，避免 three / thrive 之类的单词误触发
+    """
+    folded = term.casefold()
+    if not folded.isascii():
+        return lambda text: folded in text
+    return re.compile(r'(?<![a-z])' + re.escape(folded) + (r'(?![a-z])' if term.isupper() else '')).search
+
+
+_HR_TRIGGER_RULES = [(tuple(map(_hr_trigger, any_of)), tuple(map(_hr_trigger, all_of)), emitted)
+                     for any_of, all_of, emitted in HR_TERM_RULES]
+
+
+class DeadlineExceeded(Exception):
+    """必需的检索阶段在请求截止时间前没有完成"""
+
+    def __init__(self, stage, cut_short):
+        super().__init__(f'阶段 {stage} 超过请求截止时间')
+        self.stage = stage
+        self.cut_short = cut_short
+
+
+class StageTimer:
+    """记录一次检索中各阶段的耗时（毫秒），并携带请求截止时间与被截断的阶段"""
+
+    def __init__(self, prefix='', deadline=None):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.prefix = prefix
+        self.deadline = deadline  # time.monotonic() 时间点，None 表示不限时
+        self.cut_short = []
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[self.prefix + name] = round((time.perf_counter() - t0) * 1000, 3)
+
+    def scoped(self, prefix):
+        """返回共享同一份 timings 的子计时器，阶段名加上前缀（用于多国并行检索）"""
+        child = StageTimer(self.prefix + prefix, self.deadline)
+        child.timings = self.timings
+        child.cut_short = self.cut_short
+        return child
+
+    def total_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+    def remaining_ms(self):
+        """距截止时间的剩余毫秒数，不限时返回 None"""
+        if self.deadline is None:
+            return None
+        return (self.deadline - time.monotonic()) * 1000
+
+    def has_budget(self, min_ms):
+        return self.deadline is None or self.remaining_ms() >= min_ms
+
+    def cut(self, name):
+        """记录因时间不足被跳过或中断的阶段"""
+        self.cut_short.append(self.prefix + name)
+
+    def exceeded(self, name):
+        self.cut(name)
+        return DeadlineExceeded(self.prefix + name, self.cut_short)
+
+
+def normalize_question(question):
+    """阶段1：问题规范化（见 normalization.py；结果有缓存，请求入口已规范化时这里只是一次查表）"""
+    return normalization.normalize(question)
+
+
+def find_fictional_keyword(question):
+    """阶段2：检测明显的测试/虚构内容，返回命中的关键词"""
+    for kw in FICTIONAL_KEYWORDS:
+        if kw in question:
+            return kw
+    return None
+
+
+def extract_hr_terms(question):
+    """阶段2：提取问题中的HR关键术语（完整词组），纯字符串匹配，不区分大小写"""
+    folded = question.casefold()
+    terms = []
+    for any_of, all_of, emitted in _HR_TRIGGER_RULES:
+        if not any(match(folded) for match in any_of):
+            continue
+        if all_of and not all(match(folded) for match in all_of):
+            continue
+        terms.extend(emitted)
+    return terms
+
+
+def _find_all(text, name):
+    """返回 name 在 text 中每次出现的 (起点, 终点)"""
+    spans = []
+    start = text.find(name)
+    while start != -1:
+        spans.append((start, start + len(name)))
+        start = text.find(name, start + 1)
+    return spans
+
+
+def resolve_countries(question):
+    """阶段3：识别问题中提到的全部国家，返回 (按出现顺序排列的支持国家列表, 未收录的国家)
+
+    较长的名称优先，被其覆盖的较短名称不再计入（如"印度尼西亚"不会同时识别出"印度"）
+    """
+    matches = []
+    # 标准国家名与别名一起匹配
+    for country in SUPPORTED_COUNTRIES:
+        matches.extend((start, end, country, country) for start, end in _find_all(question, country))
+    for alias, standard in COUNTRY_ALIASES.items():
+        matches.extend((start, end, alias, standard) for start, end in _find_all(question, alias))
+
+    if matches:
+        matches.sort(key=lambda m: (m[0] - m[1], m[0]))
+        taken = []
+        for start, end, name, standard in matches:
+            if any(start < e and s < end for s, e, _ in taken):
+                continue
+            if name != standard:
+                print(f"通过别名 '{name}' 识别到国家: {standard}")
+            taken.append((start, end, standard))
+
+        countries = []
+        for _, _, standard in sorted(taken):
+            if standard not in countries:
+                countries.append(standard)
+        return countries, None
+
+    # 检查是否询问了不在支持列表中的国家
+    for country in ALL_COUNTRY_KEYWORDS:
+        if country in question:
+            return [], country
+
+    return [], None
+
+
+def extract_keywords(question, exclude=(), allow_single_chars=True):
+    """问题分词并过滤疑问词（阶段 score 使用）"""
+    allowed = ALLOWED_SINGLE_CHARS if allow_single_chars else ()
+    return [k for k in cut_words(question)
+            if k not in QUESTION_STOPWORDS and k not in exclude and k not in ('？', '?')
+            and (len(k) > 1 or k in allowed)]
+
+
+def hr_term_bonus(term):
+    """特殊关键词加分：只对问题中提到的概念加分"""
+    if term == '年假':
+        return 25
+    if '试用期' in term or 'probation' in term.lower():
+        return 20
+    if term == '加班':
+        return 20
+    if '工作' in term:
+        return 15
+    if '工资' in term or '薪资' in term or '最低' in term:
+        return 15
+    if '合同' in term:
+        return 12
+    return 0
+
+
+class Chunk:
+    """知识库中的一个段落（只读，多个检索结果共享同一个对象）"""
+
+    __slots__ = ('id', 'text', 'folded', 'country', 'title', 'url', 'is_ocr')
+
+    def __init__(self, chunk_id, text, metadata):
+        self.id = chunk_id
+        self.text = text
+        # 关键词匹配用的小写文本（问题已规范化为小写）；纯中文段落与 text 是同一个对象
+        folded = text.casefold()
+        self.folded = text if folded == text else folded
+        self.country = metadata.get('country', 'Unknown')
+        self.title = metadata.get('title', '')
+        self.url = metadata.get('url', '')
+        self.is_ocr = metadata.get('type') == 'ocr'
+
+    def context(self):
+        """生成答案所需的上下文"""
+        return {'id': self.id, 'text': self.text, 'country': self.country, 'source': self.title, 'url': self.url}
+
+
+_by_score = itemgetter(0)
+
+
+class RetrieverConfig:
+    """检索参数：阈值、评分权重、候选规模与并发"""
+
+    __slots__ = ('mode', 'top_k', 'comparison_top_k', 'relevance_threshold', 'score_threshold',
+                 'keyword_weight', 'open_keyword_weight', 'ocr_bonus', 'rrf_k', 'candidate_pool',
+                 'country_fetch_limit', 'supplement_min_budget_ms', 'workers')
+
+    def __init__(self, mode='lexical', top_k=3, comparison_top_k=2,
+                 relevance_threshold=MIN_RELEVANCE_THRESHOLD, score_threshold=MIN_SCORE_THRESHOLD,
+                 keyword_weight=10, open_keyword_weight=3, ocr_bonus=5, rrf_k=RRF_K, candidate_pool=15,
+                 country_fetch_limit=100, supplement_min_budget_ms=500, workers=8):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"未知的检索模式: {mode}")
+        self.mode = mode
+        self.top_k = top_k
+        self.comparison_top_k = comparison_top_k  # 多国对比时每个国家取的段落数
+        self.relevance_threshold = relevance_threshold  # 关键词评分：最高分低于该值视为不相关
+        self.score_threshold = score_threshold  # lexical 模式未指定国家：向量结果的排名得分阈值
+        self.keyword_weight = keyword_weight  # 每命中一个问题关键词的得分
+        self.open_keyword_weight = open_keyword_weight  # 向量结果重排时每命中一个关键词的得分
+        self.ocr_bonus = ocr_bonus  # OCR 段落包含问题中的HR术语时的加分
+        self.rrf_k = rrf_k
+        self.candidate_pool = candidate_pool  # 每一路候选的数量（不少于 top_k × 5）
+        self.country_fetch_limit = country_fetch_limit  # 读取一个国家的段落数上限
+        self.supplement_min_budget_ms = supplement_min_budget_ms  # 剩余时间不足时跳过向量补充 / 向量分支
+        self.workers = workers
+
+
+class Retriever:
+    """在一个 Chroma 集合上检索；线程安全，进程内共享一个实例即可
+
+    duplicate_clusters 为 段落 ID -> 近重复簇代表段落 ID（见 near_duplicates.py），每个簇最多返回一个段落；
+    cache 为检索结果缓存（shared_cache.CacheNamespace），version 为知识库版本（缓存键的一部分）
+    """
+
+    def __init__(self, collection, config=None, duplicate_clusters=None, cache=None, version=''):
+        self.collection = collection
+        self.config = config or RetrieverConfig()
+        self.duplicate_clusters = duplicate_clusters or {}
+        self.cache = cache
+        self.version = version
+        self._config_digest = self._digest_config()
+        self._chunks = {}
+        self._corpus = None
+        self._corpus_lock = threading.Lock()
+        workers = self.config.workers
+        self._branch_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='retrieval')
+        # 多国对比的按国家并行检索单独使用一个线程池，避免与 hybrid 分支互相等待造成死锁
+        self._fanout_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fanout')
+        # 限时 I/O：Chroma 读取 / 向量检索（含 embedding）在该线程池中执行，调用方最多等到截止时间
+        # 超时后后台调用不会被中断，只是结果被丢弃
+        self._io_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='io')
+
+    def close(self):
+        for executor in (self._branch_executor, self._fanout_executor, self._io_executor):
+            executor.shutdown(wait=False)
+
+    def retrieve(self, question, top_k=None, mode=None, deadline=None):
+        """检索并返回 {'contexts', 'status', 'country', 'timings', 'retrieval_mode'[, 'scores', 'cut_short', 'cached', ...]}
+
+        deadline 为 time.monotonic() 时间点：可选阶段在时间不足时跳过并记入 cut_short，
+        必需阶段超时则抛出 DeadlineExceeded
+        """
+        mode = mode or self.config.mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"未知的检索模式: {mode}")
+        timer = StageTimer(deadline=deadline)
+        result = self._run_stages(question, top_k or self.config.top_k, timer, mode)
+        timer.timings['total'] = timer.total_ms()
+        result['timings'] = timer.timings
+        result['retrieval_mode'] = mode
+        if timer.cut_short:
+            result['cut_short'] = timer.cut_short
+        return result
+
+    # ---- 阶段 ----
+
+    def _run_stages(self, question, top_k, timer, mode):
+        """按成本从低到高依次执行检索阶段，任一拒绝检查命中即提前返回"""
+        with timer.stage('normalize'):
+            question = normalize_question(question)
+
+        with timer.stage('classify'):
+            fictional_kw = find_fictional_keyword(question)
+            hr_terms = extract_hr_terms(question) if not fictional_kw else []
+
+        if fictional_kw:
+            print(f"检测到测试关键词 '{fictional_kw}'")
+            return {'contexts': [], 'status': 'fictional', 'country': ''}
+
+        with timer.stage('resolve'):
+            countries, unsupported_country = resolve_countries(question)
+
+        if unsupported_country:
+            print(f"问题中提到了不在支持列表中的国家 '{unsupported_country}'")
+            return {'contexts': [], 'status': 'no_country', 'country': unsupported_country}
+
+        # 如果问题中没有任何HR相关关键词，则认为不相关（无需读取该国文档）
+        if countries and not hr_terms:
+            print(f"问题 '{question}' 不包含任何HR相关关键词，返回irrelevant")
+            return {'contexts': [], 'status': 'irrelevant', 'country': '、'.join(countries)}
+
+        with timer.stage('signature'):
+            # 指定国家时国名不作为关键词；未指定国家时不保留单字关键词
+            keywords = extract_keywords(question, exclude=tuple(countries), allow_single_chars=bool(countries))
+            signature = self._signature(mode, top_k, countries, hr_terms, keywords)
+
+        if self.cache is not None:
+            with timer.stage('cache'):
+                result = self._cached_result(self.cache.get(*signature), question, timer)
+            if result is not None:
+                return result
+
+        if not countries:
+            status, picked = self._rank(question, keywords, hr_terms, top_k, timer, mode)
+            result = self._result(status, picked, picked[0][1].country if picked else '')
+        elif len(countries) > 1:
+            result = self._compare(question, countries, keywords, hr_terms, timer, mode)
+        else:
+            result = self._retrieve_country(question, countries[0], keywords, hr_terms, top_k, timer, mode)
+
+        # 被截断的结果不完整，不缓存
+        if self.cache is not None and not timer.cut_short:
+            self.cache.set(self._cache_entry(result, question, self._question_dependent(countries, mode, timer)),
+                           *signature)
+        return result
+
+    def _retrieve_country(self, question, country, keywords, hr_terms, top_k, timer, mode):
+        print(f"检测到目标国家: {country}")
+        status, picked = self._rank(question, keywords, hr_terms, top_k, timer, mode, country)
+        return self._result(status, picked, country)
+
+    def _compare(self, question, countries, keywords, hr_terms, timer, mode):
+        """多国对比问题：按国家并行检索（每国 comparison_top_k 条），合并为一份上下文"""
+        print(f"检测到多国对比问题: {'、'.join(countries)}")
+        futures = [
+            self._fanout_executor.submit(self._retrieve_country, question, country, keywords, hr_terms,
+                                         self.config.comparison_top_k, timer.scoped(f'{country}/'), mode)
+            for country in countries
+        ]
+        per_country = [future.result() for future in futures]
+
+        contexts, scores = [], []
+        for result in per_country:
+            contexts.extend(result['contexts'])
+            scores.extend(result['scores'])
+
+        found = [r['country'] for r in per_country if r['status'] == 'found']
+        return {
+            'contexts': contexts,
+            'scores': scores,
+            # 任一国家检索到内容即视为 found，否则沿用第一个国家的状态
+            'status': 'found' if found else per_country[0]['status'],
+            'country': '、'.join(found or countries),
+            'countries': countries,
+            'country_status': {r['country']: r['status'] for r in per_country}
+        }
+
+    @staticmethod
+    def _result(status, picked, country):
+        """由选出的 (得分, Chunk) 生成检索结果"""
+        return {'contexts': [chunk.context() for _, chunk in picked], 'scores': [score for score, _ in picked],
+                'status': status, 'country': country}
+
+    # ---- 检索结果缓存 ----
+
+    def _digest_config(self):
+        """检索参数（并发数除外）与近重复簇的摘要：调整阈值、候选规模或重建近重复簇后，旧的缓存结果不再命中"""
+        config = self.config
+        params = [getattr(config, name) for name in RetrieverConfig.__slots__ if name != 'workers']
+        clusters = sorted(self.duplicate_clusters.items())
+        return hashlib.sha256(repr((params, clusters)).encode('utf-8')).hexdigest()[:16]
+
+    def _signature(self, mode, top_k, countries, hr_terms, keywords):
+        """检索的全部输入：措辞不同但国家、HR术语与关键词（含重复次数，评分按次数累加）相同的问题结果相同"""
+        return (self.version, self._config_digest, mode, top_k, list(countries), sorted(hr_terms),
+                sorted(keywords))
+
+    @staticmethod
+    def _question_dependent(countries, mode, timer):
+        """结果是否还取决于问题原文：用到了向量检索（未指定国家、hybrid 模式或执行了向量补充）"""
+        return not countries or mode == 'hybrid' or any(name.endswith('supplement') for name in timer.timings)
+
+    @staticmethod
+    def _cache_entry(result, question, question_dependent):
+        """缓存的检索结果：上下文只保留段落 ID 与得分；取决于问题原文时记录问题，只对同一问题有效"""
+        entry = {name: value for name, value in result.items() if name not in ('contexts', 'scores')}
+        entry['hits'] = [[ctx['id'], score] for ctx, score in zip(result['contexts'], result['scores'])]
+        if question_dependent:
+            entry['question'] = question
+        return entry
+
+    def _cached_result(self, entry, question, timer):
+        """由缓存条目还原检索结果；段落已不在知识库中时视为未命中"""
+        if entry is None or entry.pop('question', question) != question:
+            return None
+        hits = entry.pop('hits')
+        chunks = self._bounded(timer, 'cache', self.chunks_by_id, [chunk_id for chunk_id, _ in hits])
+        if None in chunks:
+            return None
+        entry['contexts'] = [chunk.context() for chunk in chunks]
+        entry['scores'] = [score for _, score in hits]
+        entry['cached'] = True
+        return entry
+
+    def _rank(self, question, keywords, hr_terms, top_k, timer, mode, country=None):
+        """指定国家与未指定国家共用的检索流程，返回 (状态, 选出的 [(得分, Chunk)])
+
+        关键词候选：指定国家时为该国段落；未指定国家时 hybrid 为全量段落，lexical 为向量检索结果
+        （按关键词重排，排名越靠前得分越高）。相关性由关键词评分判定：向量检索总会返回结果，
+        不能说明问题与知识库内容相关。之后 hybrid 与向量结果 RRF 融合；lexical 在结果不足时用向量补充
+        """
+        config = self.config
+        where = {'country': country} if country else None
+        hybrid = mode == 'hybrid'
+        vector_first = not country and not hybrid
+        pool = max(config.candidate_pool, top_k * 5) if country else min(config.candidate_pool, top_k * 5)
+
+        def lexical():
+            with timer.stage('fetch'):
+                if vector_first:
+                    chunks = self._bounded(timer, 'fetch', self._query_chunks, question, pool)
+                elif country:
+                    chunks = self._bounded(timer, 'fetch', self._country_chunks, country)
+                else:
+                    chunks = self._corpus_chunks()
+            with timer.stage('score'):
+                if vector_first:
+                    scored = self._score_by_rank(chunks, keywords)
+                else:
+                    scored = self._score(chunks, keywords, hr_terms)
+                return chunks, heapq.nlargest(pool, scored, key=_by_score)
+
+        vector_future = None
+        if hybrid:
+            vector_n = top_k * 2 if country else pool
+            vector_future = self._submit_vector_branch(timer, question, vector_n, where)
+            chunks, ranked = self._wait(timer, 'fetch', self._branch_executor.submit(lexical))
+        else:
+            chunks, ranked = lexical()
+
+        if country and not chunks:
+            print(f"知识库中没有 {country} 的数据")
+            return 'no_content', []
+        threshold = config.score_threshold if vector_first else config.relevance_threshold
+        if not ranked or ranked[0][0] < threshold:
+            if country:
+                print(f"{country} 的相关文档与问题相关性太低")
+            return ('irrelevant' if country else 'no_results'), []
+        if not country:
+            # 未指定国家时只保留达到阈值的候选
+            ranked = [item for item in ranked if item[0] >= threshold]
+
+        if hybrid:
+            vector_ranked = self._vector_branch_result(timer, vector_future)
+            with timer.stage('fuse'):
+                ranked = self._fuse([ranked, vector_ranked], pool)
+        elif country and len(self._select(ranked, top_k)) < top_k:
+            ranked = ranked + self._supplement(question, top_k, timer, where, ranked)
+
+        return 'found', self._select(ranked, top_k)
+
+    def _supplement(self, question, top_k, timer, where, ranked):
+        """关键词匹配的结果太少（近重复簇只算一个）时补充向量检索结果（跳过已评分的段落）；
+        补充是可选的，时间不足时跳过"""
+        if not timer.has_budget(self.config.supplement_min_budget_ms):
+            timer.cut('supplement')
+            return []
+        with timer.stage('supplement'):
+            seen_ids = {chunk.id for _, chunk in ranked}
+            try:
+                candidates = self._bounded(timer, 'supplement', self._query_chunks, question, top_k, where)
+            except DeadlineExceeded:
+                return []
+            return [(0, chunk) for chunk in candidates if chunk.id not in seen_ids]
+
+    # ---- 评分与选择 ----
+
+    def _score(self, chunks, keywords, hr_terms):
+        """关键词评分，只产出得分大于 0 的 (得分, Chunk)"""
+        keyword_weight = self.config.keyword_weight
+        ocr_bonus = self.config.ocr_bonus
+        bonuses = [(term.casefold(), hr_term_bonus(term)) for term in hr_terms]
+        for chunk in chunks:
+            text = chunk.folded
+            score = sum(1 for kw in keywords if kw in text) * keyword_weight
+            has_hr_term = False
+            for term, bonus in bonuses:
+                if term in text:
+                    score += bonus
+                    has_hr_term = True
+            # OCR 段落包含问题中的完整HR术语时少量加分（正文匹配更高时不给 OCR 额外优势）
+            if has_hr_term and chunk.is_ocr:
+                score += ocr_bonus
+            if score > 0:
+                yield score, chunk
+
+    def _score_by_rank(self, chunks, keywords):
+        """向量检索结果按关键词重排：命中关键词得分 + 原排名得分"""
+        weight = self.config.open_keyword_weight
+        total = len(chunks)
+        for rank, chunk in enumerate(chunks):
+            yield sum(1 for kw in keywords if kw in chunk.folded) * weight + total - rank, chunk
+
+    def _fuse(self, ranked_lists, limit):
+        """RRF融合多路排序结果：score = Σ 1 / (k + rank)，同一 chunk 只保留一份"""
+        k = self.config.rrf_k
+        fused = {}
+        for ranked in ranked_lists:
+            for rank, (_, chunk) in enumerate(ranked, start=1):
+                entry = fused.get(chunk.id)
+                if entry is None:
+                    entry = fused[chunk.id] = [0.0, chunk]
+                entry[0] += 1.0 / (k + rank)
+        return heapq.nlargest(limit, fused.values(), key=_by_score)
+
+    def _select(self, ranked, top_k):
+        """按排名取前 top_k 个 (得分, Chunk)，同一近重复簇只保留排名最高的段落"""
+        clusters = self.duplicate_clusters
+        if not clusters:
+            return ranked[:top_k]
+        picked, seen = [], set()
+        for item in ranked:
+            cluster = clusters.get(item[1].id, item[1].id)
+            if cluster in seen:
+                continue
+            seen.add(cluster)
+            picked.append(item)
+            if len(picked) == top_k:
+                break
+        return picked
+
+    # ---- 读取 ----
+
+    def _chunks_from(self, ids, documents, metadatas):
+        """把 Chroma 返回的结果转换为 Chunk，同一段落只创建一次"""
+        cache = self._chunks
+        chunks = []
+        for chunk_id, text, metadata in zip(ids, documents, metadatas):
+            chunk = cache.get(chunk_id)
+            if chunk is None:
+                chunk = cache.setdefault(chunk_id, Chunk(chunk_id, text, metadata or {}))
+            chunks.append(chunk)
+        return chunks
+
+    def chunks_by_id(self, ids):
+        """按 ID 取段落（先查检索器的缓存，其余从知识库读取），不存在的 ID 对应 None"""
+        missing = [chunk_id for chunk_id in ids if chunk_id not in self._chunks]
+        if missing:
+            docs = self.collection.get(ids=missing)
+            self._chunks_from(docs['ids'], docs['documents'], docs['metadatas'])
+        return [self._chunks.get(chunk_id) for chunk_id in ids]
+
+    def _country_chunks(self, country):
+        docs = self.collection.get(where={'country': country}, limit=self.config.country_fetch_limit)
+        return self._chunks_from(docs['ids'], docs['documents'], docs['metadatas'])
+
+    def _corpus_chunks(self):
+        """全量段落（hybrid 模式下未指定国家时的关键词候选集），每个检索器只读取一次"""
+        if self._corpus is None:
+            with self._corpus_lock:
+                if self._corpus is None:
+                    docs = self.collection.get()
+                    self._corpus = self._chunks_from(docs['ids'], docs['documents'], docs['metadatas'])
+        return self._corpus
+
+    def _query_chunks(self, question, n_results, where=None):
+        """向量检索"""
+        kwargs = {'query_texts': [question], 'n_results': n_results}
+        if where:
+            kwargs['where'] = where
+        results = self.collection.query(**kwargs)
+        return self._chunks_from(results['ids'][0], results['documents'][0], results['metadatas'][0])
+
+    # ---- 截止时间 ----
+
+    def _bounded(self, timer, stage, fn, *args):
+        """在请求剩余时间内执行一次 I/O 调用，超时抛出 DeadlineExceeded；不限时则直接调用"""
+        if timer.deadline is None:
+            return fn(*args)
+        remaining_ms = timer.remaining_ms()
+        if remaining_ms <= 0:
+            raise timer.exceeded(stage)
+        future = self._io_executor.submit(fn, *args)
+        try:
+            return future.result(timeout=remaining_ms / 1000)
+        except FutureTimeout:
+            raise timer.exceeded(stage)
+
+    @staticmethod
+    def _wait(timer, stage, future):
+        """等待并行分支的结果，最多等到截止时间"""
+        try:
+            return future.result(timeout=None if timer.deadline is None else max(0.0, timer.remaining_ms() / 1000))
+        except FutureTimeout:
+            raise timer.exceeded(stage)
+
+    def _submit_vector_branch(self, timer, question, n_results, where):
+        """hybrid 模式的向量分支是可选的：剩余时间不足时不启动；失败时只记录日志，仍返回关键词结果"""
+        if not timer.has_budget(self.config.supplement_min_budget_ms):
+            timer.cut('vector')
+            return None
+
+        def vector():
+            with timer.stage('vector'):
+                try:
+                    return [(0, chunk) for chunk in self._query_chunks(question, n_results, where)]
+                except Exception as e:
+                    print(f"向量检索失败: {str(e)}")
+                    return []
+
+        return self._branch_executor.submit(vector)
+
+    def _vector_branch_result(self, timer, future):
+        """等待向量分支，超过截止时间则只用关键词结果"""
+        if future is None:
+            return []
+        try:
+            return self._wait(timer, 'vector', future)
+        except DeadlineExceeded:
+            return []
@@ -0,0 +1,723 @@
+#!/usr/bin/env python3
+"""
+共享缓存 - 查询向量、检索结果与答案的缓存，多个 worker / 实例之间共享
+
+进程内缓存只对本进程有效：多个 gunicorn worker 或 Render 实例各自预热，同一个问题会重复调用大模型。
+缓存按命名空间划分，每个命名空间有独立的有效期（TTL）与条目上限（超出时淘汰最久未使用的条目）：
+    embedding    查询向量（按向量模型与问题文本）
+    retrieval    检索结果（段落 ID 与状态，不含正文）
+    answer       大模型生成的答案（按问题、服务商、检索模式与检索到的段落）
+    answer_deps  段落 ID -> 用到该段落的答案（反向索引，见 answer_invalidation.py）
+    answer_hits  答案被缓存命中的次数（计数器，原子递增）
+    kb           知识库版本与段落内容指纹的快照
+后端可替换（CACHE_BACKEND）：
+    memory       进程内 LRU（默认）
+    sqlite       本机文件（WAL 模式），同一主机上的 worker 共享（CACHE_SQLITE_PATH）
+    redis        Redis 协议的服务器，所有实例共享（CACHE_REDIS_URL，redis://[:密码@]主机:端口/库）
+    off          不缓存
+值以 JSON 序列化（不使用 pickle：不同版本的代码之间可以安全读取，无法解析的条目视为未命中），
+键为各组成部分的摘要并带格式版本号，格式变化时旧条目自然失效。
+后端出错时视为未命中并暂停访问后端几秒，缓存故障不影响请求本身。
+
+用法：
+    python shared_cache.py --stand-in 6380                          启动本地 Redis 协议替身服务器（开发 / 测试用）
+    python shared_cache.py --check redis://localhost:6380/0          对后端执行读写、TTL 与淘汰检查
+    python shared_cache.py --check sqlite:///tmp/cache.sqlite3
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
+FORMAT_VERSION = 1
+
+# 命名空间 -> (有效期秒数, 条目上限)；可用 CACHE_<命名空间>_TTL_S / CACHE_<命名空间>_MAX_ENTRIES 覆盖
+DEFAULT_NAMESPACES = {
+    'embedding': (7 * 86400, 20000),
+    'retrieval': (86400, 5000),
+    'answer': (86400, 2000),
+    'answer_deps': (86400, 20000),
+    'answer_hits': (86400, 20000),
+    'kb': (365 * 86400, 16),
+}
+BACKENDS = ('memory', 'sqlite', 'redis', 'off')
+DEFAULT_SQLITE_PATH = 'shared_cache.sqlite3'
+DEFAULT_REDIS_URL = 'redis://localhost:6379/0'
+
+# 后端出错后暂停访问的秒数
+ERROR_BACKOFF_S = 5.0
+# 每写入多少次检查一次条目上限（SQLite / Redis；进程内缓存每次写入都检查）
+_TRIM_EVERY = 64
+
+
+class CacheError(Exception):
+    """缓存后端返回错误"""
+
+
+def make_key(*parts):
+    """由任意 JSON 可序列化的组成部分生成定长的键"""
+    raw = json.dumps([FORMAT_VERSION, *parts], ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def decode(data):
+    return json.loads(data.decode('utf-8') if isinstance(data, bytes) else data)
+
+
+# ---- 后端：get / set / incr / delete / clear / size，值为 bytes（计数器为 JSON 整数） ----
+
+class MemoryBackend:
+    """进程内 LRU：每个命名空间一个 OrderedDict"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entries = self._entries.get(namespace)
+            item = entries.get(key) if entries else None
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            return item[1]
+
+    def set(self, namespace, key, data, ttl_s, max_entries):
+        with self._lock:
+            entries = self._entries.setdefault(namespace, OrderedDict())
+            entries[key] = (time.time() + ttl_s, data)
+            entries.move_to_end(key)
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+
+    def incr(self, namespace, key, amount, ttl_s, max_entries):
+        with self._lock:
+            entries = self._entries.setdefault(namespace, OrderedDict())
+            item = entries.get(key)
+            value = int(decode(item[1])) if item is not None and item[0] >= time.time() else 0
+            value += amount
+            entries[key] = (time.time() + ttl_s, encode(value))
+            entries.move_to_end(key)
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+            return value
+
+    def delete(self, namespace, keys):
+        with self._lock:
+            entries = self._entries.get(namespace, {})
+            for key in keys:
+                entries.pop(key, None)
+
+    def clear(self, namespace):
+        with self._lock:
+            self._entries.pop(namespace, None)
+
+    def size(self, namespace):
+        with self._lock:
+            return len(self._entries.get(namespace, ()))
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID
+"""
+
+
+class SQLiteBackend:
+    """本机 SQLite 文件（WAL 模式，单连接 + 锁；首次使用时才打开），同一主机上的多个进程共享"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = {}
+
+    @property
+    def conn(self):
+        """调用方需持有 self._lock"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 其他进程写入时最多等待 5 秒
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            with conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                conn.execute(_SQLITE_SCHEMA)
+                conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (namespace, accessed)')
+            self._conn = conn
+        return self._conn
+
+    def get(self, namespace, key):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute('SELECT value, expires FROM entries WHERE namespace = ? AND key = ?',
+                                    (namespace, key)).fetchone()
+            if row is None or row[1] < now:
+                return None
+            with self.conn:
+                self.conn.execute('UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?',
+                                  (now, namespace, key))
+        return bytes(row[0])
+
+    def set(self, namespace, key, data, ttl_s, max_entries):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO entries (namespace, key, value, expires, accessed) '
+                              'VALUES (?, ?, ?, ?, ?)', (namespace, key, data, now + ttl_s, now))
+            writes = self._writes[namespace] = self._writes.get(namespace, 0) + 1
+            if writes % _TRIM_EVERY == 1:
+                self._trim(namespace, max_entries, now)
+
+    def incr(self, namespace, key, amount, ttl_s, max_entries):
+        """在一个事务中原子递增（已过期的计数从 0 开始），返回递增后的值"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO entries (namespace, key, value, expires, accessed) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (namespace, key) DO UPDATE SET '
+                'value = CAST(CAST(CASE WHEN expires < excluded.accessed THEN 0 '
+                'ELSE CAST(CAST(value AS TEXT) AS INTEGER) END + ? AS TEXT) AS BLOB), '
+                'expires = excluded.expires, accessed = excluded.accessed',
+                (namespace, key, encode(amount), now + ttl_s, now, amount))
+            value = self.conn.execute('SELECT value FROM entries WHERE namespace = ? AND key = ?',
+                                      (namespace, key)).fetchone()[0]
+            writes = self._writes[namespace] = self._writes.get(namespace, 0) + 1
+            if writes % _TRIM_EVERY == 1:
+                self._trim(namespace, max_entries, now)
+        return int(decode(bytes(value)))
+
+    def _trim(self, namespace, max_entries, now):
+        """删除过期条目，并按最近访问时间淘汰超出上限的条目（调用方持有锁并处于事务中）"""
+        self.conn.execute('DELETE FROM entries WHERE namespace = ? AND expires < ?', (namespace, now))
+        excess = self.conn.execute('SELECT COUNT(*) FROM entries WHERE namespace = ?',
+                                   (namespace,)).fetchone()[0] - max_entries
+        if excess > 0:
+            self.conn.execute(
+                'DELETE FROM entries WHERE namespace = ? AND key IN ('
+                'SELECT key FROM entries WHERE namespace = ? ORDER BY accessed LIMIT ?)',
+                (namespace, namespace, excess))
+
+    def delete(self, namespace, keys):
+        with self._lock, self.conn:
+            self.conn.executemany('DELETE FROM entries WHERE namespace = ? AND key = ?',
+                                  [(namespace, key) for key in keys])
+
+    def clear(self, namespace):
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM entries WHERE namespace = ?', (namespace,))
+
+    def size(self, namespace):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM entries WHERE namespace = ? AND expires >= ?',
+                                     (namespace, time.time())).fetchone()[0]
+
+
+class RespConnection:
+    """Redis 协议（RESP2）的最小客户端连接：一次发送多条命令（流水线），依次读取回复"""
+
+    def __init__(self, host, port, timeout):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile('rb')
+
+    def execute(self, *commands):
+        payload = []
+        for command in commands:
+            payload.append(b'*%d\r\n' % len(command))
+            for arg in command:
+                if not isinstance(arg, bytes):
+                    arg = str(arg).encode('utf-8')
+                payload.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._sock.sendall(b''.join(payload))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, CacheError):
+                raise reply
+        return replies
+
+    def _read(self):
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Redis 连接已关闭')
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode('utf-8')
+        if kind == b'-':
+            return CacheError(body.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError('Redis 连接已关闭')
+            return data[:-2]
+        if kind == b'*':
+            count = int(body)
+            return None if count < 0 else [self._read() for _ in range(count)]
+        raise CacheError(f'无法解析的 Redis 回复: {line[:40]!r}')
+
+    def close(self):
+        try:
+            self._file.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend:
+    """Redis 协议的服务器（所有实例共享）
+
+    每个条目一个带过期时间的键；命名空间的有序集合记录各键的最近访问时间，用于按条目上限淘汰。
+    连接按需创建并复用；连接出错时丢弃该连接
+    """
+
+    name = 'redis'
+
+    def __init__(self, url, timeout=1.0, prefix='hrqa:'):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int((parsed.path or '/0').lstrip('/') or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.timeout = timeout
+        self.prefix = prefix
+        self._idle = []
+        self._lock = threading.Lock()
+        self._writes = {}
+
+    def _connect(self):
+        conn = RespConnection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            try:
+                conn.execute(*setup)
+            except Exception:
+                conn.close()
+                raise
+        return conn
+
+    def _execute(self, *commands):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            replies = conn.execute(*commands)
+        except (OSError, ConnectionError):
+            conn.close()
+            raise
+        with self._lock:
+            self._idle.append(conn)
+        return replies
+
+    def _key(self, namespace, key):
+        return f'{self.prefix}{namespace}:{key}'
+
+    def _index(self, namespace):
+        return f'{self.prefix}{namespace}:~lru'
+
+    def get(self, namespace, key):
+        """命中时刷新索引中的访问时间；未命中（键已过期或被淘汰）时从索引中去掉，不让它继续占用条目上限"""
+        full_key = self._key(namespace, key)
+        index = self._index(namespace)
+        data = self._execute(('GET', full_key))[0]
+        if data is None:
+            self._execute(('ZREM', index, full_key))
+        else:
+            self._execute(('ZADD', index, 'XX', time.time(), full_key))
+        return data
+
+    def set(self, namespace, key, data, ttl_s, max_entries):
+        full_key = self._key(namespace, key)
+        index = self._index(namespace)
+        now = time.time()
+        self._execute(('SET', full_key, data, 'PX', int(ttl_s * 1000)), ('ZADD', index, now, full_key))
+        with self._lock:
+            writes = self._writes[namespace] = self._writes.get(namespace, 0) + 1
+        if writes % _TRIM_EVERY == 1:
+            self._trim(index, ttl_s, max_entries, now)
+
+    def incr(self, namespace, key, amount, ttl_s, max_entries):
+        full_key = self._key(namespace, key)
+        index = self._index(namespace)
+        now = time.time()
+        value, _, _ = self._execute(('INCRBY', full_key, amount), ('PEXPIRE', full_key, int(ttl_s * 1000)),
+                                    ('ZADD', index, now, full_key))
+        with self._lock:
+            writes = self._writes[namespace] = self._writes.get(namespace, 0) + 1
+        if writes % _TRIM_EVERY == 1:
+            self._trim(index, ttl_s, max_entries, now)
+        return value
+
+    def _trim(self, index, ttl_s, max_entries, now):
+        """从索引中去掉已过期的键，并淘汰最久未访问的超出部分"""
+        _, count = self._execute(('ZREMRANGEBYSCORE', index, '-inf', now - ttl_s), ('ZCARD', index))
+        if count > max_entries:
+            victims = self._execute(('ZRANGE', index, 0, count - max_entries - 1))[0]
+            if victims:
+                self._execute(('DEL', *victims), ('ZREM', index, *victims))
+
+    def delete(self, namespace, keys):
+        full_keys = [self._key(namespace, key) for key in keys]
+        if full_keys:
+            self._execute(('DEL', *full_keys), ('ZREM', self._index(namespace), *full_keys))
+
+    def clear(self, namespace):
+        index = self._index(namespace)
+        members = self._execute(('ZRANGE', index, 0, -1))[0]
+        if members:
+            self._execute(('DEL', *members))
+        self._execute(('DEL', index))
+
+    def size(self, namespace):
+        return self._execute(('ZCARD', self._index(namespace)))[0]
+
+
+# ---- 命名空间与统计 ----
+
+class CacheNamespace:
+    """一个命名空间的缓存：get / set 的键为任意组成部分（见 make_key），值为可 JSON 序列化的对象"""
+
+    def __init__(self, cache, name, ttl_s, max_entries):
+        self._cache = cache
+        self.name = name
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'errors': 0}
+
+    def get(self, *parts):
+        """返回缓存的值，未命中（或后端出错、条目无法解析）时返回 None"""
+        return self.get_key(make_key(*parts))
+
+    def set(self, value, *parts):
+        self.set_key(make_key(*parts), value)
+
+    def get_key(self, key):
+        """按 make_key 生成的键读取"""
+        data = self._cache.call(self, 'get', self.name, key)
+        value = None
+        if data is not None:
+            try:
+                value = decode(data)
+            except ValueError:
+                self._stats['errors'] += 1
+        self._stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def set_key(self, key, value):
+        self._stats['sets'] += 1
+        self._cache.call(self, 'set', self.name, key, encode(value), self.ttl_s, self.max_entries)
+
+    def incr_key(self, key, amount=1):
+        """原子递增计数器（不存在时从 0 开始），返回递增后的值；后端出错时返回 None"""
+        self._stats['sets'] += 1
+        return self._cache.call(self, 'incr', self.name, key, amount, self.ttl_s, self.max_entries)
+
+    def delete_keys(self, keys):
+        """按 make_key 生成的键删除"""
+        self._cache.call(self, 'delete', self.name, list(keys))
+
+    def clear(self):
+        self._cache.call(self, 'clear', self.name)
+
+    def snapshot(self):
+        stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['ttl_s'] = self.ttl_s
+        stats['max_entries'] = self.max_entries
+        return stats
+
+
+class SharedCache:
+    """命名空间的集合与共用的后端；backend 为 None 时不缓存（get 总是未命中，set 不做任何事）"""
+
+    def __init__(self, backend, namespaces=None):
+        self.backend = backend
+        self._namespaces = {
+            name: CacheNamespace(self, name, ttl_s, max_entries)
+            for name, (ttl_s, max_entries) in (namespaces or DEFAULT_NAMESPACES).items()
+        }
+        self._down_until = 0.0
+        self._last_error = None
+
+    def namespace(self, name):
+        return self._namespaces[name]
+
+    def call(self, namespace, method, *args):
+        """调用后端；出错时计数、记录并在 ERROR_BACKOFF_S 秒内跳过后端"""
+        if self.backend is None or time.monotonic() < self._down_until:
+            return None
+        try:
+            return getattr(self.backend, method)(*args)
+        except (OSError, ConnectionError, CacheError, sqlite3.Error) as e:
+            namespace._stats['errors'] += 1
+            self._down_until = time.monotonic() + ERROR_BACKOFF_S
+            self._last_error = f'{type(e).__name__}: {e}'
+            print(f"  缓存后端 {self.backend.name} 出错（{self._last_error}），{ERROR_BACKOFF_S:.0f} 秒内不使用缓存")
+            return None
+
+    def snapshot(self):
+        stats = {'backend': self.backend.name if self.backend else 'off',
+                 'namespaces': {name: ns.snapshot() for name, ns in self._namespaces.items()}}
+        if self._last_error:
+            stats['last_error'] = self._last_error
+        return stats
+
+
+def backend_from_url(url):
+    """memory:// | sqlite:///路径 | redis://主机:端口/库 | off"""
+    scheme = urlparse(url).scheme or url
+    if scheme == 'memory':
+        return MemoryBackend()
+    if scheme == 'sqlite':
+        return SQLiteBackend(url[len('sqlite://'):] or DEFAULT_SQLITE_PATH)
+    if scheme in ('redis', 'resp'):
+        return RedisBackend(url)
+    if scheme == 'off':
+        return None
+    raise ValueError(f'未知的缓存后端: {url}')
+
+
+def from_env():
+    """按环境变量创建共享缓存（见模块说明）"""
+    kind = os.getenv('CACHE_BACKEND', 'memory')
+    if kind not in BACKENDS:
+        raise ValueError(f"未知的缓存后端 CACHE_BACKEND={kind}（可选: {', '.join(BACKENDS)}）")
+    if kind == 'sqlite':
+        backend = SQLiteBackend(os.getenv('CACHE_SQLITE_PATH', DEFAULT_SQLITE_PATH))
+    elif kind == 'redis':
+        backend = RedisBackend(os.getenv('CACHE_REDIS_URL', DEFAULT_REDIS_URL),
+                               timeout=float(os.getenv('CACHE_REDIS_TIMEOUT_S', '1')))
+    elif kind == 'memory':
+        backend = MemoryBackend()
+    else:
+        backend = None
+    namespaces = {
+        name: (float(os.getenv(f'CACHE_{name.upper()}_TTL_S', ttl_s)),
+               int(os.getenv(f'CACHE_{name.upper()}_MAX_ENTRIES', max_entries)))
+        for name, (ttl_s, max_entries) in DEFAULT_NAMESPACES.items()
+    }
+    return SharedCache(backend, namespaces)
+
+
+# ---- Redis 协议替身服务器（开发 / 测试用）----
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    """支持 RedisBackend 用到的命令：数据保存在内存中，键的过期在读取时检查"""
+
+    # 流水线中的每条回复单独写出，关闭 Nagle 避免后一条回复等待客户端的延迟确认
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.wfile.write(self.server.dispatch(command))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            raise ValueError('只支持 RESP 数组形式的命令')
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    """本地 Redis 协议替身：GET / SET [PX] / INCRBY / PEXPIRE / DEL / ZADD [XX] / ZREM / ZCARD / ZRANGE /
+    ZREMRANGEBYSCORE / PING"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, _StandInHandler)
+        self._values = {}  # 键 -> (值, 过期时间或 None)
+        self._sorted = {}  # 键 -> {成员: 分数}
+        self._lock = threading.Lock()
+
+    def dispatch(self, args):
+        name = args[0].decode('utf-8').upper()
+        handler = getattr(self, f'_cmd_{name.lower()}', None)
+        if handler is None:
+            return b'-ERR unknown command\r\n'
+        with self._lock:
+            return _resp(handler(*args[1:]))
+
+    def _live(self, key):
+        item = self._values.get(key)
+        if item and item[1] is not None and item[1] < time.time():
+            del self._values[key]
+            return None
+        return item
+
+    def _cmd_ping(self):
+        return 'PONG'
+
+    def _cmd_auth(self, *_):
+        return 'OK'
+
+    def _cmd_select(self, _):
+        return 'OK'
+
+    def _cmd_get(self, key):
+        item = self._live(key)
+        return item[0] if item else None
+
+    def _cmd_set(self, key, value, *options):
+        expires = None
+        if len(options) >= 2 and options[0].upper() == b'PX':
+            expires = time.time() + int(options[1]) / 1000
+        self._values[key] = (value, expires)
+        return 'OK'
+
+    def _cmd_incrby(self, key, amount):
+        item = self._live(key)
+        try:
+            value = int(item[0] if item else 0) + int(amount)
+        except ValueError:
+            return CacheError('ERR value is not an integer or out of range')
+        self._values[key] = (str(value).encode('utf-8'), item[1] if item else None)
+        return value
+
+    def _cmd_pexpire(self, key, millis):
+        item = self._live(key)
+        if item is None:
+            return 0
+        self._values[key] = (item[0], time.time() + int(millis) / 1000)
+        return 1
+
+    def _cmd_del(self, *keys):
+        return sum(1 for key in keys if self._values.pop(key, None) is not None
+                   or self._sorted.pop(key, None) is not None)
+
+    def _cmd_zadd(self, key, *args):
+        only_existing = bool(args) and args[0].upper() == b'XX'
+        args = args[1:] if only_existing else args
+        members = self._sorted.setdefault(key, {})
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            if only_existing and member not in members:
+                continue
+            added += member not in members
+            members[member] = float(score)
+        return added
+
+    def _cmd_zrem(self, key, *members):
+        scores = self._sorted.get(key, {})
+        return sum(1 for member in members if scores.pop(member, None) is not None)
+
+    def _cmd_zcard(self, key):
+        return len(self._sorted.get(key, {}))
+
+    def _cmd_zrange(self, key, start, stop):
+        ordered = sorted(self._sorted.get(key, {}).items(), key=lambda item: item[1])
+        start, stop = int(start), int(stop)
+        stop = len(ordered) + stop if stop < 0 else stop
+        return [member for member, _ in ordered[start:stop + 1]]
+
+    def _cmd_zremrangebyscore(self, key, low, high):
+        low = float('-inf') if low == b'-inf' else float(low)
+        high = float('inf') if high == b'+inf' else float(high)
+        scores = self._sorted.get(key, {})
+        removed = [member for member, score in scores.items() if low <= score <= high]
+        for member in removed:
+            del scores[member]
+        return len(removed)
+
+
+def _resp(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, CacheError):
+        return b'-%s\r\n' % str(value).encode('utf-8')
+    if isinstance(value, str):
+        return b'+%s\r\n' % value.encode('utf-8')
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    return b'*%d\r\n' % len(value) + b''.join(_resp(item) for item in value)
+
+
+def check(url):
+    """对后端执行读写、TTL 与条目上限检查"""
+    cache = SharedCache(backend_from_url(url), {'check': (0.5, 10)})
+    ns = cache.namespace('check')
+    ns.clear()
+    value = {'answer': '英国的法定年假为 28 天', 'ids': ['uk_0', 'uk_3'], 'score': 0.5}
+    ns.set(value, 'q', 1)
+    assert ns.get('q', 1) == value, '写入后读取的值不一致'
+    assert ns.get('q', 2) is None, '不存在的键应未命中'
+    for i in range(_TRIM_EVERY + 20):
+        ns.set(i, 'n', i)
+    size = cache.backend.size('check')
+    assert size <= 10 + _TRIM_EVERY, f'条目数 {size} 超出上限'
+    counter = make_key('counter')
+    assert [ns.incr_key(counter) for _ in range(3)] == [1, 2, 3], '计数器应从 0 开始依次递增'
+    assert ns.get_key(counter) == 3, '计数器的值应可读取'
+    time.sleep(0.6)
+    assert ns.get('q', 1) is None, '过期的条目应未命中'
+    assert ns.incr_key(counter) == 1, '过期的计数器应从 0 重新开始'
+    ns.clear()
+    print(f"✓ {cache.backend.name} 后端检查通过（淘汰后 {size} 条）: {ns.snapshot()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='共享缓存工具')
+    parser.add_argument('--stand-in', type=int, metavar='PORT', help='启动本地 Redis 协议替身服务器')
+    parser.add_argument('--check', metavar='URL', help='检查后端（memory:// | sqlite:///路径 | redis://主机:端口/库）')
+    args = parser.parse_args()
+
+    if args.check:
+        check(args.check)
+    if args.stand_in:
+        server = StandInServer(('127.0.0.1', args.stand_in))
+        print(f"✓ Redis 协议替身服务器已启动: redis://127.0.0.1:{args.stand_in}/0")
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
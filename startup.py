@@ -0,0 +1,105 @@
+"""
+启动耗时分析 - 记录每个模块的导入耗时与各初始化阶段耗时，启动完成后输出报告
+
+Render 免费实例休眠后冷启动，首页延迟主要来自导入重量级依赖（chromadb、服务商 SDK、jieba）
+与加载向量库。导入计时通过临时替换 builtins.__import__ 实现，只统计最外层的导入
+（包含其间接依赖），已导入过的模块不重复计入：
+    startup.profile.start_import_timing()
+    import ...
+    startup.profile.stop_import_timing()
+推迟到后台或首次使用时才导入的模块用 profile.lazy_import(name) 导入，同样计入报告。
+"""
+
+import builtins
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROCESS_STARTED = time.perf_counter()
+
+
+class StartupProfile:
+    """模块导入耗时 + 初始化阶段耗时"""
+
+    def __init__(self):
+        self.imports = {}  # 顶层模块名 -> 毫秒
+        self.phases = []  # (阶段名, 毫秒)
+        self.ready_ms = None
+        self._original_import = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _record_import(self, module, elapsed_s):
+        with self._lock:
+            self.imports[module] = round(self.imports.get(module, 0.0) + elapsed_s * 1000, 1)
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        depth = getattr(self._local, 'depth', 0)
+        if level or depth or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        self._local.depth = depth + 1
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._local.depth = depth
+            self._record_import(name.partition('.')[0], time.perf_counter() - started)
+
+    def start_import_timing(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def stop_import_timing(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def lazy_import(self, name):
+        """导入推迟加载的模块并计时（已导入时直接返回）"""
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        self._record_import(name.partition('.')[0], time.perf_counter() - started)
+        return module
+
+    @contextmanager
+    def phase(self, name):
+        """with profile.phase('加载向量库'): ...  记录一个初始化阶段的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, round((time.perf_counter() - started) * 1000, 1)))
+
+    def mark_ready(self):
+        self.ready_ms = round((time.perf_counter() - PROCESS_STARTED) * 1000, 1)
+
+    def snapshot(self):
+        with self._lock:
+            imports = sorted(self.imports.items(), key=lambda item: -item[1])
+            return {
+                'imports_ms': dict(imports),
+                'imports_total_ms': round(sum(self.imports.values()), 1),
+                'phases_ms': dict(self.phases),
+                'ready_ms': self.ready_ms,
+                'uptime_s': round(time.perf_counter() - PROCESS_STARTED, 1),
+            }
+
+    def print_report(self, top=10):
+        stats = self.snapshot()
+        print(f"启动耗时报告（导入共 {stats['imports_total_ms']:.0f}ms）:")
+        for module, ms in list(stats['imports_ms'].items())[:top]:
+            print(f"  导入 {module:<24}{ms:>9.1f}ms")
+        for name, ms in stats['phases_ms'].items():
+            print(f"  {name:<27}{ms:>9.1f}ms")
+        if stats['ready_ms'] is not None:
+            print(f"  进程启动至就绪{'':<16}{stats['ready_ms']:>9.1f}ms")
+
+
+profile = StartupProfile()
@@ -0,0 +1,469 @@
+function fillQuestion(text) {
+    console.log('=== fillQuestion 被调用 ===');
+    const questionInput = document.getElementById('question');
+    if (questionInput) {
+        questionInput.value = text;
+        questionInput.focus();
+        // 自动触发查询
+        askQuestion();
+    } else {
+        console.error('找不到 question 输入框');
+    }
+}
+
+// formatAnswer v2 - 支持链接转换
+function formatAnswer(answer) {
+    let lines = answer.split(String.fromCharCode(10));
+    let result = [];
+    let inList = false;
+    let listItems = [];
+
+    for (let i = 0; i < lines.length; i++) {
+        let line = lines[i];
+        let trimmed = line.trim();
+
+        // 跳过空行处理，但保留一个
+        if (!trimmed) {
+            if (inList) {
+                result.push('</div>');
+                inList = false;
+                listItems = [];
+            }
+            continue;
+        }
+
+        // 分隔线 ---
+        if (trimmed === '---') {
+            if (inList) {
+                result.push('</div>');
+                inList = false;
+            }
+            result.push('<hr style="border:none;border-top:1px solid #E8FFF9;margin:20px 0;">');
+            continue;
+        }
+
+        // 标题 ##
+        if (trimmed.startsWith('## ')) {
+            if (inList) {
+                result.push('</div>');
+                inList = false;
+            }
+            result.push('<h3 style="color:#00726d;font-size:1.3em;margin:20px 0 12px 0;padding-bottom:8px;border-bottom:2px solid #E8FFF9;">' + trimmed.substring(3) + '</h3>');
+            continue;
+        }
+        if (trimmed.startsWith('### ')) {
+            if (inList) {
+                result.push('</div>');
+                inList = false;
+            }
+            result.push('<h4 style="color:#002D28;font-size:1.1em;margin:16px 0 8px 0;">' + trimmed.substring(4) + '</h4>');
+            continue;
+        }
+
+        // 引用块 >
+        if (trimmed.startsWith('> ')) {
+            if (inList) {
+                result.push('</div>');
+                inList = false;
+            }
+            result.push('<blockquote style="margin:12px 0;padding:12px 16px;background:#F5FAF9;border-left:4px solid #CEA472;color:#666;font-size:0.95em;">' + trimmed.substring(2) + '</blockquote>');
+            continue;
+        }
+
+        // 先检查是否是列表项（在转换行内格式前，避免链接被分割）
+        // 数字列表 1. 2. 3.
+        let numMatch = trimmed.match(/^(\d+)\.\s+(.+)$/);
+        // 无序列表 - * •
+        let bulletMatch = trimmed.match(/^[-\*•]\s+(.+)$/);
+
+        // 处理行内格式
+        // Markdown 链接 [text](url) - 匹配到右括号结束
+        line = line.replace(/\[([^\]]+)\]\((https?:\/\/[^)]+)\)/g, '<a href="$2" target="_blank" style="color:#00726d;text-decoration:none;font-weight:500;">$1</a>');
+
+        // 加粗 **文本**
+        line = line.replace(/\*\*([^*]+)\*\*/g, '<strong style="color:#00726d;">$1</strong>');
+
+        // 移除代码块符号和中文方括号
+        line = line.replace(/`/g, '').replace(/【/g, '').replace(/】/g, '');
+
+        // 处理数字列表
+        if (numMatch) {
+            if (!inList) {
+                result.push('<div style="margin:12px 0;">');
+                inList = true;
+            }
+            // 提取列表项内容（去掉序号）
+            let content = line.replace(/^\s*\d+\.\s*/, '');
+            result.push('<div style="margin:6px 0;padding-left:20px;"><span style="color:#00726d;font-weight:600;">' + numMatch[1] + '.</span> ' + content + '</div>');
+            continue;
+        }
+
+        // 处理无序列表
+        if (bulletMatch) {
+            if (!inList) {
+                result.push('<div style="margin:12px 0;">');
+                inList = true;
+            }
+            // 提取列表项内容（去掉 bullet）
+            let content = line.replace(/^\s*[-\*•]\s*/, '');
+            result.push('<div style="margin:6px 0;padding-left:20px;"><span style="color:#CEA472;margin-right:8px;">•</span>' + content + '</div>');
+            continue;
+        }
+
+        // 普通段落
+        if (inList) {
+            result.push('</div>');
+            inList = false;
+        }
+        result.push('<p style="margin:10px 0;line-height:1.8;">' + line + '</p>');
+    }
+
+    if (inList) {
+        result.push('</div>');
+    }
+
+    return result.join('');
+}
+
+// 本地答案缓存：同一页面内重复提问直接复用（最多保留 ANSWER_CACHE_SIZE 条，最近使用的排在最后）
+const ANSWER_CACHE_SIZE = 30;
+const answerCache = new Map();
+
+function normalizeQuestion(question) {
+    return question.trim().replace(/\s+/g, ' ');
+}
+
+function getCachedAnswer(question) {
+    if (!answerCache.has(question)) {
+        return null;
+    }
+    const data = answerCache.get(question);
+    answerCache.delete(question);
+    answerCache.set(question, data);
+    return data;
+}
+
+function cacheAnswer(question, data) {
+    answerCache.set(question, data);
+    if (answerCache.size > ANSWER_CACHE_SIZE) {
+        answerCache.delete(answerCache.keys().next().value);
+    }
+}
+
+// GET /api/ask 可被浏览器 HTTP 缓存和 CDN 缓存；过期后浏览器会带 If-None-Match 重新验证
+// 页面只展示答案正文（原文段落已包含在答案中），sources 只需 compact 形式，全文可按需从 /api/chunk/<id> 获取
+const STARTUP_MAX_RETRIES = 30;
+
+async function fetchAnswer(question) {
+    const cached = getCachedAnswer(question);
+    if (cached) {
+        console.log('命中本地答案缓存');
+        return cached;
+    }
+
+    console.log('发送 fetch 请求到 /api/ask');
+    let response = await fetch('/api/ask?sources=compact&q=' + encodeURIComponent(question));
+    console.log('响应状态:', response.status);
+
+    // 冷启动时知识库仍在加载（503 + Retry-After），等待后重试
+    for (let attempt = 0; response.status === 503 && attempt < STARTUP_MAX_RETRIES; attempt++) {
+        const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+        if (!retryAfter) {
+            break;
+        }
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+        response = await fetch('/api/ask?sources=compact&q=' + encodeURIComponent(question));
+        console.log('重试响应状态:', response.status);
+    }
+
+    // 504 为服务端截止时间内未完成，响应体中带有提示信息
+    if (!response.ok && response.status !== 504) {
+        throw new Error('HTTP错误: ' + response.status);
+    }
+
+    const data = await response.json();
+    // 过载时的降级答案不缓存，下次提问重新请求
+    if (!data.error && !data.degraded) {
+        cacheAnswer(question, data);
+    }
+    return data;
+}
+
+async function askQuestion() {
+    console.log('=== askQuestion 被调用 ===');
+    const questionInput = document.getElementById('question');
+    const resultDiv = document.getElementById('result');
+    const loadingDiv = document.getElementById('loading');
+    const answerDiv = document.getElementById('answer');
+
+    if (!questionInput || !resultDiv || !loadingDiv || !answerDiv) {
+        console.error('找不到必要的DOM元素');
+        alert('页面加载错误，请刷新页面重试');
+        return;
+    }
+
+    const question = normalizeQuestion(questionInput.value);
+    console.log('问题:', question);
+
+    if (!question) {
+        alert('请输入问题');
+        questionInput.focus();
+        return;
+    }
+
+    console.log('开始查询...');
+
+    // 显示加载
+    resultDiv.style.display = 'none';
+    loadingDiv.style.display = 'block';
+
+    try {
+        const data = await fetchAnswer(question);
+        console.log('响应数据:', data);
+
+        if (data.error) {
+            answerDiv.innerHTML = '<div style="color: #dc3545; padding: 10px; background: #f8d7da; border-radius: 8px;">错误: ' + data.error + '</div>';
+        } else if (data.not_found) {
+            // 知识库无答案，显示 Deepseek 求助按钮
+            console.log('知识库未找到答案，状态:', data.status, '国家:', data.country);
+            answerDiv.innerHTML = renderNotFoundPrompt(question, data.status, data.country);
+        } else if (data.answer) {
+            console.log('原始答案长度:', data.answer.length);
+            // 格式化答案：美化显示
+            const formatted = formatAnswer(data.answer);
+            console.log('格式化后长度:', formatted.length);
+            // 添加 Deepseek 拓展搜索按钮
+            const deepseekButton = renderDeepseekButton(question, '拓展搜索');
+            const degradedNotice = data.degraded
+                ? '<div style="color: #856404; padding: 10px; background: #fff3cd; border-radius: 8px; margin-bottom: 12px;">当前访问量较大，以下为从知识库直接摘录的答案，稍后重试可获得 AI 生成的完整回答。</div>'
+                : '';
+            answerDiv.innerHTML = degradedNotice + formatted + deepseekButton;
+        } else {
+            answerDiv.innerHTML = '<div style="color: #856404; padding: 10px; background: #fff3cd; border-radius: 8px;">未获取到答案</div>';
+        }
+
+        loadingDiv.style.display = 'none';
+        resultDiv.style.display = 'block';
+        console.log('查询完成');
+
+    } catch (error) {
+        console.error('查询错误:', error);
+        answerDiv.innerHTML = '<div style="color: #dc3545; padding: 10px; background: #f8d7da; border-radius: 8px;">发生错误: ' + error.message + '</div>';
+        loadingDiv.style.display = 'none';
+        resultDiv.style.display = 'block';
+    }
+}
+
+// 渲染知识库无答案时的提示界面
+function renderNotFoundPrompt(question, status, country) {
+    let title = '未找到相关答案';
+    let description = '';
+    let icon = '🔍';
+
+    if (status === 'no_country') {
+        icon = '🌍';
+        title = `${country} 暂未收录`;
+        description = `目前知识库暂未收录 <strong style="color: #00726d;">${country}</strong> 的用工指南数据。`;
+    } else if (status === 'no_content') {
+        icon = '📚';
+        title = `${country} 数据缺失`;
+        description = `知识库中暂无 <strong style="color: #00726d;">${country}</strong> 的详细用工指南数据。`;
+    } else if (status === 'irrelevant') {
+        icon = '❓';
+        title = `${country} 暂无相关内容`;
+        description = `知识库中收录了 <strong style="color: #00726d;">${country}</strong> 的用工指南，但未找到与您问题相关的内容。`;
+    } else {
+        description = '在 <strong style="color: #00726d;">43 个国家</strong> 的用工指南知识库中，没有找到与您问题相关的内容。';
+    }
+
+    return `
+    <div style="text-align: center; padding: 40px 20px;">
+        <div style="font-size: 48px; margin-bottom: 20px;">${icon}</div>
+        <h3 style="color: #002D28; font-size: 1.3em; margin-bottom: 16px;">${title}</h3>
+        <p style="color: #666; font-size: 15px; line-height: 1.6; margin-bottom: 24px; max-width: 500px; margin-left: auto; margin-right: auto;">
+            ${description}
+        </p>
+        <div style="background: linear-gradient(135deg, #E8FFF9 0%, #F5FAF9 100%); border-radius: 16px; padding: 24px; margin: 20px 0; border: 1px solid rgba(0, 114, 109, 0.15);">
+            <div style="font-size: 32px; margin-bottom: 12px;">🤖</div>
+            <p style="color: #333; font-size: 14px; margin-bottom: 16px;">
+                您可以通过 Deepseek AI 进行<strong style="color: #00726d;">联网搜索</strong>获取答案
+            </p>
+            <button onclick='callDeepseekSearch("${question.replace(/"/g, '\"')}")' 
+                    style="background: linear-gradient(135deg, #00726d, #002D28); 
+                           color: white; border: none; padding: 14px 32px; 
+                           border-radius: 12px; font-size: 15px; font-weight: 600; 
+                           cursor: pointer; transition: all 0.3s ease;
+                           box-shadow: 0 4px 15px rgba(0, 114, 109, 0.3);">
+                ✨ 求助 Deepseek 联网搜索
+            </button>
+        </div>
+        <p style="color: #999; font-size: 12px; margin-top: 16px;">
+            💡 提示：您也可以尝试换个问法，或询问其他国家/地区的用工政策
+        </p>
+    </div>
+    `;
+}
+
+// 渲染 Deepseek 拓展搜索按钮（用于正确答案底部）
+function renderDeepseekButton(question, buttonText = '拓展搜索更多内容') {
+    return `
+    <div style="margin-top: 30px; padding: 20px; background: linear-gradient(135deg, #E8FFF9 0%, #F5FAF9 100%); border-radius: 16px; border: 1px solid rgba(0, 114, 109, 0.15); text-align: center;">
+        <div style="display: flex; align-items: center; justify-content: center; gap: 10px; margin-bottom: 12px;">
+            <span style="font-size: 24px;">🤖</span>
+            <span style="color: #002D28; font-weight: 600; font-size: 14px;">想要了解更多？</span>
+        </div>
+        <p style="color: #666; font-size: 13px; margin-bottom: 15px;">
+            通过 Deepseek AI 联网搜索获取更多相关信息
+        </p>
+        <button onclick='callDeepseekSearch("${question.replace(/"/g, '\"')}")' 
+                style="background: linear-gradient(135deg, #00726d, #002D28); 
+                       color: white; border: none; padding: 12px 28px; 
+                       border-radius: 10px; font-size: 14px; font-weight: 600; 
+                       cursor: pointer; transition: all 0.3s ease;
+                       box-shadow: 0 4px 15px rgba(0, 114, 109, 0.3);">
+            🔍 ${buttonText}
+        </button>
+    </div>
+    `;
+}
+
+// 调用 Deepseek 联网搜索
+// 联网搜索以后台任务执行：提交后通过 SSE 等待结果，不支持或连接中断时改为轮询
+// 同一问题的任务（包括服务端的预取）由服务端共享，重复提交不会重复搜索
+const JOB_POLL_INTERVAL_MS = 2000;
+
+async function runDeepseekJob(question) {
+    const response = await fetch('/api/deepseek/jobs', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ question })
+    });
+
+    // 503 为过载，响应体中带有提示信息
+    if (!response.ok && response.status !== 503) {
+        throw new Error('HTTP错误: ' + response.status);
+    }
+
+    const job = await response.json();
+    if (job.status === 'pending' || job.status === 'running') {
+        return await waitForJob(job);
+    }
+    return job;
+}
+
+function waitForJob(job) {
+    if (!window.EventSource) {
+        return pollJob(job.poll);
+    }
+    return new Promise((resolve) => {
+        const source = new EventSource(job.events);
+        source.addEventListener('done', (event) => {
+            source.close();
+            resolve(JSON.parse(event.data));
+        });
+        source.onerror = () => {
+            source.close();
+            resolve(pollJob(job.poll));
+        };
+    });
+}
+
+async function pollJob(url) {
+    while (true) {
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error('HTTP错误: ' + response.status);
+        }
+        const job = await response.json();
+        if (job.status === 'done' || job.status === 'failed') {
+            return job;
+        }
+    }
+}
+
+async function callDeepseekSearch(question) {
+    console.log('=== 调用 Deepseek 搜索 ===');
+    const resultDiv = document.getElementById('result');
+    const loadingDiv = document.getElementById('loading');
+    const answerDiv = document.getElementById('answer');
+
+    // 显示加载状态
+    resultDiv.style.display = 'none';
+    loadingDiv.style.display = 'block';
+
+    // 更新加载文本
+    const loadingText = loadingDiv.querySelector('.loading-text');
+    if (loadingText) {
+        loadingText.textContent = 'Deepseek AI 正在联网搜索全球用工数据...';
+    }
+
+    try {
+        const data = await runDeepseekJob(question);
+        console.log('Deepseek 响应:', data);
+
+        if (data.error) {
+            answerDiv.innerHTML = '<div style="color: #dc3545; padding: 10px; background: #f8d7da; border-radius: 8px;">错误: ' + data.error + '</div>';
+        } else if (data.answer) {
+            // 格式化 Deepseek 答案，添加来源标记
+            const formattedAnswer = formatDeepseekAnswer(data.answer);
+            answerDiv.innerHTML = formattedAnswer;
+        } else {
+            answerDiv.innerHTML = '<div style="color: #856404; padding: 10px; background: #fff3cd; border-radius: 8px;">Deepseek 未能生成答案</div>';
+        }
+
+    } catch (error) {
+        console.error('Deepseek 调用错误:', error);
+        answerDiv.innerHTML = '<div style="color: #dc3545; padding: 10px; background: #f8d7da; border-radius: 8px;">调用 Deepseek 时出错: ' + error.message + '</div>';
+    } finally {
+        loadingDiv.style.display = 'none';
+        resultDiv.style.display = 'block';
+        // 恢复加载文本
+        const loadingText = loadingDiv.querySelector('.loading-text');
+        if (loadingText) {
+            loadingText.textContent = 'AI 正在分析全球用工数据...';
+        }
+    }
+}
+
+// 格式化 Deepseek 答案
+function formatDeepseekAnswer(answer) {
+    // 添加 Deepseek 来源标记
+    let formatted = `
+    <div style="background: linear-gradient(135deg, #E8FFF9 0%, #F5FAF9 100%); padding: 16px 20px; border-radius: 12px; margin-bottom: 20px; border-left: 4px solid #00726d;">
+        <div style="display: flex; align-items: center; gap: 10px; margin-bottom: 8px;">
+            <span style="font-size: 20px;">🤖</span>
+            <span style="color: #002D28; font-weight: 600; font-size: 14px;">Deepseek AI 联网搜索</span>
+            <span style="background: #00726d; color: white; padding: 2px 8px; border-radius: 4px; font-size: 11px;">联网</span>
+        </div>
+        <p style="color: #666; font-size: 12px; margin: 0;">以下内容通过 Deepseek AI 联网搜索生成，仅供参考</p>
+    </div>
+    `;
+
+    // 使用相同的 formatAnswer 函数处理内容
+    formatted += formatAnswer(answer);
+
+    // 添加免责声明
+    formatted += `
+    <div style="margin-top: 24px; padding: 16px; background: #FFF8F0; border-radius: 12px; border-left: 4px solid #CEA472;">
+        <p style="color: #886644; font-size: 12px; margin: 0; line-height: 1.6;">
+            <strong style="color: #CEA472;">⚠️ 免责声明：</strong>
+            以上内容由 AI 联网搜索生成，可能存在信息滞后或不准确的情况。
+            重要决策前请核实官方最新政策或咨询专业法律顾问。
+        </p>
+    </div>
+    `;
+
+    return formatted;
+}
+
+// 确保DOM加载完成后再绑定事件
+document.addEventListener('DOMContentLoaded', function() {
+    document.getElementById('question').addEventListener('keypress', function(e) {
+        if (e.key === 'Enter') {
+            askQuestion();
+        }
+    });
+});
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+首页静态资源 - 构建期生成带内容哈希的 HTML / CSS / JS，并预压缩为 gzip 与 brotli
+
+static/src 中是源文件，构建结果写入 static/dist：
+    index.html                  引用带哈希的 CSS / JS，每次请求协商缓存（ETag + 304）
+    styles.<hash>.css, app.<hash>.js   文件名随内容变化，可长期缓存（immutable）
+    *.gz, *.br                  预压缩版本，服务时按 Accept-Encoding 直接返回
+    manifest.json               文件名、内容类型与 ETag
+
+用法：
+    python static_assets.py     # 构建 static/dist（部署时在 buildCommand 中执行）
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import http_utils
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只生成 gzip 版本
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BASE_DIR, 'static', 'src')
+DIST_DIR = os.path.join(BASE_DIR, 'static', 'dist')
+
+# 需要加内容哈希的资源（index.html 中以 /assets/<名称> 引用）
+HASHED_ASSETS = ('styles.css', 'app.js')
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+# index.html 每次都向服务器确认（命中时 304），带哈希的资源一年内无需确认
+HTML_CACHE_CONTROL = 'no-cache'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _write_variants(dist_dir, name, data):
+    """写入原文件及其 gzip / brotli 预压缩版本，返回可用的编码列表"""
+    with open(os.path.join(dist_dir, name), 'wb') as f:
+        f.write(data)
+    encodings = []
+    if brotli is not None:
+        with open(os.path.join(dist_dir, name + '.br'), 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+        encodings.append('br')
+    with open(os.path.join(dist_dir, name + '.gz'), 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    encodings.append('gzip')
+    return encodings
+
+
+def build(src_dir=SRC_DIR, dist_dir=DIST_DIR):
+    """构建 dist 目录，返回 manifest"""
+    os.makedirs(dist_dir, exist_ok=True)
+    for name in os.listdir(dist_dir):
+        os.remove(os.path.join(dist_dir, name))
+
+    manifest = {}
+    with open(os.path.join(src_dir, 'index.html'), 'rb') as f:
+        html = f.read()
+
+    for asset in HASHED_ASSETS:
+        with open(os.path.join(src_dir, asset), 'rb') as f:
+            data = f.read()
+        digest = _content_hash(data)
+        stem, ext = os.path.splitext(asset)
+        hashed_name = f'{stem}.{digest}{ext}'
+        manifest[hashed_name] = {
+            'content_type': CONTENT_TYPES[ext],
+            'etag': digest,
+            'cache_control': IMMUTABLE_CACHE_CONTROL,
+            'encodings': _write_variants(dist_dir, hashed_name, data),
+        }
+        html = html.replace(f'/assets/{asset}'.encode(), f'/assets/{hashed_name}'.encode())
+
+    manifest['index.html'] = {
+        'content_type': CONTENT_TYPES['.html'],
+        'etag': _content_hash(html),
+        'cache_control': HTML_CACHE_CONTROL,
+        'encodings': _write_variants(dist_dir, 'index.html', html),
+    }
+
+    with open(os.path.join(dist_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+class StaticAssets:
+    """把 dist 中的资源（含预压缩版本）一次性读入内存，请求时只做协商，不做任何渲染"""
+
+    def __init__(self, dist_dir=DIST_DIR, src_dir=SRC_DIR):
+        self.dist_dir = dist_dir
+        self.src_dir = src_dir
+        self._assets = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        manifest_path = os.path.join(self.dist_dir, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        else:
+            # 未执行构建时（如本地开发）在首次访问时构建一次
+            print("  提示: 未找到 static/dist，正在构建首页静态资源")
+            manifest = build(self.src_dir, self.dist_dir)
+
+        assets = {}
+        for name, meta in manifest.items():
+            bodies = {}
+            for encoding, suffix in [('identity', '')] + [(e, '.br' if e == 'br' else '.gz') for e in meta['encodings']]:
+                with open(os.path.join(self.dist_dir, name + suffix), 'rb') as f:
+                    bodies[encoding] = f.read()
+            assets[name] = dict(meta, bodies=bodies)
+        return assets
+
+    def assets(self):
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    self._assets = self._load()
+        return self._assets
+
+    def serve(self, name, if_none_match=None, accept_encoding=None):
+        """返回 (状态码, 响应头, 响应体)；资源不存在时返回 None"""
+        asset = self.assets().get(name)
+        if asset is None:
+            return None
+
+        encoding = http_utils.negotiate_encoding(accept_encoding, tuple(asset['encodings']))
+        headers = {
+            'Content-Type': asset['content_type'],
+            'Cache-Control': asset['cache_control'],
+            'ETag': http_utils.format_etag(asset['etag'], encoding),
+            'Vary': 'Accept-Encoding',
+        }
+        if http_utils.etag_matches(if_none_match, asset['etag']):
+            return 304, headers, b''
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, headers, asset['bodies'][encoding]
+
+
+def main():
+    manifest = build()
+    print(f"✓ 静态资源已构建到 {DIST_DIR}")
+    for name, meta in manifest.items():
+        sizes = [f"{os.path.getsize(os.path.join(DIST_DIR, name))}B"]
+        for encoding in meta['encodings']:
+            suffix = '.br' if encoding == 'br' else '.gz'
+            sizes.append(f"{encoding} {os.path.getsize(os.path.join(DIST_DIR, name + suffix))}B")
+        print(f"  {name}: {', '.join(sizes)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import os
+import sys
+import threading
+import uuid
+
+import pytest
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shared_cache  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def redis_url():
+    """在后台线程中运行的 Redis 协议替身服务器"""
+    server = shared_cache.StandInServer(('127.0.0.1', 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'redis://127.0.0.1:{server.server_address[1]}/0'
+    server.shutdown()
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def cache_backend(request, tmp_path):
+    """三种共享缓存后端；redis 后端每个测试使用独立的键前缀"""
+    if request.param == 'memory':
+        return shared_cache.MemoryBackend()
+    if request.param == 'sqlite':
+        return shared_cache.SQLiteBackend(str(tmp_path / 'cache.sqlite3'))
+    return shared_cache.RedisBackend(request.getfixturevalue('redis_url'), prefix=f'test-{uuid.uuid4().hex[:8]}:')
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+import answer_invalidation
+import shared_cache
+
+CONTEXTS = [{'id': '德国_1', 'text': '德国的年假至少为20个工作日。'}, {'id': '德国_2', 'text': '试用期最长6个月。'}]
+
+
+@pytest.fixture
+def caches(cache_backend):
+    return shared_cache.SharedCache(cache_backend)
+
+
+def record(deps, question='德国年假几天', contexts=CONTEXTS):
+    key = deps.key(question, 'deepseek', 'lexical', [ctx['id'] for ctx in contexts])
+    deps.record(key, question, 'lexical', contexts, 'v1', '20个工作日', {'prompt_tokens': 10})
+    return key
+
+
+def test_lookup_counts_hits_without_rewriting_the_entry(caches):
+    deps = answer_invalidation.AnswerDependencies(caches)
+    key = record(deps)
+    writes = deps.answers.snapshot()['sets']
+
+    for _ in range(3):
+        assert deps.lookup(key, CONTEXTS)['answer'] == '20个工作日'
+
+    assert deps.answers.snapshot()['sets'] == writes
+    assert deps.hits.get_key(key) == 3
+
+
+def test_concurrent_hits_are_not_lost(caches):
+    deps = answer_invalidation.AnswerDependencies(caches)
+    key = record(deps)
+    threads = [threading.Thread(target=lambda: [deps.lookup(key, CONTEXTS) for _ in range(25)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert deps.hits.get_key(key) == 100
+
+
+def test_invalidation_reports_hits_of_affected_answers(caches):
+    deps = answer_invalidation.AnswerDependencies(caches)
+    key = record(deps)
+    other = record(deps, '德国试用期多久', CONTEXTS[1:])
+    deps.lookup(key, CONTEXTS)
+    deps.lookup(key, CONTEXTS)
+
+    assert deps.invalidate(['德国_1']) == [(2, '德国年假几天', 'lexical')]
+    assert deps.answers.get_key(key) is None
+    assert deps.answers.get_key(other) is not None
+
+
+def test_sync_diffs_fingerprints_even_when_version_is_pinned(caches):
+    deps = answer_invalidation.AnswerDependencies(caches)
+    fingerprints = {ctx['id']: answer_invalidation.fingerprint(ctx['text']) for ctx in CONTEXTS}
+    assert deps.sync('pinned', fingerprints) == (0, [])
+    key = record(deps)
+    deps.lookup(key, CONTEXTS)
+
+    # 知识库重建，版本标签不变（KB_VERSION 固定），德国_1 的内容变了
+    rebuilt = dict(fingerprints, **{'德国_1': answer_invalidation.fingerprint('德国的年假至少为24个工作日。')})
+    changed, invalidated = deps.sync('pinned', rebuilt)
+
+    assert (changed, invalidated) == (1, [(1, '德国年假几天', 'lexical')])
+    assert deps.answers.get_key(key) is None
+    assert deps.sync('pinned', rebuilt) == (0, [])
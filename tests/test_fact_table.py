@@ -0,0 +1,89 @@
+import pytest
+
+import fact_table
+import qa_service_redesign as qa
+
+
+def extract(topic, *sentences, doc_type='text'):
+    """每句作为一个段落抽取，返回 (数值, 单位) 或 None"""
+    candidates = []
+    for i, sentence in enumerate(sentences):
+        candidates += fact_table._candidate_facts(topic, f'德国_{i}', sentence, {'country': '德国', 'type': doc_type})
+    fact = fact_table.pick_fact(candidates)
+    return fact and (fact['value'], fact['unit'])
+
+
+@pytest.mark.parametrize('topic, sentence, expected', [
+    # 同一分句中有多个数值时取离主题词最近的那个
+    ('年假', '每周工作5天的员工每年享有至少28天带薪年假。', ('28', '天')),
+    ('年假', '员工每年享有14个工作日的年假。', ('14', '工作日')),
+    ('年假', '法定年假至少为20天（工作日）。', ('20', '工作日')),
+    # 金额保留计算周期
+    ('最低工资', '德国的最低工资为每小时12.41欧元。', ('12.41', '欧元/小时')),
+    ('最低工资', '最低工资标准为12.41欧元/小时。', ('12.41', '欧元/小时')),
+    ('最低工资', '最低工资为每月1,500美元。', ('1500', '美元/月')),
+    ('工作时长', '每周标准工作时间为40小时。', ('40', '小时')),
+    ('试用期', '试用期最长不超过6个月。', ('6', '个月')),
+    ('加班', '加班工资为正常工资的1.5倍。', ('1.5', '倍')),
+])
+def test_extracts_value_nearest_topic_term(topic, sentence, expected):
+    assert extract(topic, sentence) == expected
+
+
+def test_number_in_another_clause_is_ignored():
+    assert extract('年假', '员工入职满6个月后，可享有带薪年假。') is None
+
+
+def test_number_far_from_topic_term_is_not_published():
+    assert extract('试用期', '试用期内双方均可解除合同，但雇主解除时需要提前通知员工2周。') is None
+
+
+def test_conflicting_direct_statements_are_not_published():
+    # 法定标准的提示词不再压过另一处直接陈述的不同数值
+    assert extract('年假', '员工每年享有14个工作日的年假。', '法定最低标准为2周的年假。') is None
+
+
+def test_agreeing_statements_prefer_statutory_excerpt():
+    candidates = (fact_table._candidate_facts('年假', 'a', '员工享有20天年假。', {'country': '德国'})
+                  + fact_table._candidate_facts('年假', 'b', '法定年假至少20天年假。', {'country': '德国'}))
+    fact = fact_table.pick_fact(candidates)
+    assert (fact['value'], fact['chunk_id']) == ('20', 'b')
+
+
+def test_body_text_outranks_ocr_table():
+    candidates = (fact_table._candidate_facts('试用期', 'ocr', '试用期 3个月', {'country': '德国', 'type': 'ocr'})
+                  + fact_table._candidate_facts('试用期', 'text', '试用期最长6个月。', {'country': '德国'}))
+    assert fact_table.pick_fact(candidates)['value'] == '6'
+
+
+def test_extract_facts_skips_ambiguous_country_topics():
+    facts = fact_table.extract_facts(
+        ['德国_0', '德国_1', '法国_0'],
+        ['员工每年享有20天年假。', '员工每年享有25天年假。', '员工每年享有25天年假。'],
+        [{'country': '德国'}, {'country': '德国'}, {'country': '法国'}],
+    )
+    assert [(f['country'], f['value']) for f in facts] == [('法国', '25')]
+
+
+@pytest.fixture
+def fact_index(monkeypatch):
+    index = fact_table.FactIndex(fact_table.extract_facts(
+        ['德国_0', '德国_1'], ['试用期最长不超过6个月。', '德国的最低工资为每小时12.41欧元。'],
+        [{'country': '德国', 'title': '德国用工指南', 'url': ''}] * 2))
+    monkeypatch.setattr(qa, 'fact_index', index)
+    return index
+
+
+def test_fast_path_answers_single_fact_question(fact_index):
+    answer = qa.answer_from_fact_table('德国最低工资是多少？')
+    assert '12.41 欧元/小时' in answer['answer']
+
+
+@pytest.mark.parametrize('question', [
+    '德国试用期最长多久，期间解雇需要通知吗',
+    '德国试用期最长多久以及如何延长',
+    '德国试用期多久，最低工资是多少',
+    '德国试用期的解雇通知期是多久',
+])
+def test_fast_path_skips_multi_part_questions(fact_index, question):
+    assert qa.answer_from_fact_table(question) is None
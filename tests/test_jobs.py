@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+
+import pytest
+
+import jobs
+import qa_service_redesign as qa
+
+
+class SlowProvider:
+    """假的慢速联网搜索：release() 之前一直阻塞，记录每次调用"""
+
+    def __init__(self, answer='联网搜索的答案'):
+        self.answer = answer
+        self.calls = []
+        self._gate = threading.Event()
+
+    def __call__(self, question, speculative):
+        self.calls.append((question, speculative))
+        if not self._gate.wait(10):
+            raise TimeoutError('slow provider was never released')
+        return self.answer
+
+    def release(self):
+        self._gate.set()
+
+
+def make_queue(path, fn, max_pending=4, ttl_s=600):
+    return jobs.JobQueue(fn, jobs.JobStore(str(path)), max_workers=2, max_pending=max_pending,
+                         max_speculative=1, ttl_s=ttl_s, name='test-jobs')
+
+
+@pytest.fixture
+def provider():
+    provider = SlowProvider()
+    yield provider
+    provider.release()
+
+
+def test_identical_submissions_share_one_job(tmp_path, provider):
+    queue = make_queue(tmp_path / 'jobs.sqlite3', provider)
+
+    first = queue.submit('德国的年假有几天')
+    second = queue.submit('德国的年假有几天')
+    provider.release()
+    job = queue.wait(first['id'], 5)
+
+    assert second['id'] == first['id']
+    assert job['status'] == 'done' and job['answer'] == provider.answer
+    assert len(provider.calls) == 1
+    # 完成且未过期的结果同样被共享，不再调用
+    assert queue.submit('德国的年假有几天')['answer'] == provider.answer
+    assert len(provider.calls) == 1
+    stats = queue.snapshot()
+    assert (stats['submitted'], stats['shared']) == (1, 2)
+
+
+def test_expired_jobs_are_purged(tmp_path, provider):
+    provider.release()
+    queue = make_queue(tmp_path / 'jobs.sqlite3', provider, ttl_s=0.2)
+    job = queue.wait(queue.submit('德国的年假有几天', speculative=True)['id'], 5)
+    assert job['status'] == 'done'
+
+    time.sleep(0.3)
+    queue.submit('法国的年假有几天')
+    queue.wait(jobs.job_id_for('法国的年假有几天'), 5)
+
+    assert queue.get(job['id']) is None
+    # 从未被取用的预取结果计为浪费
+    assert queue.snapshot()['prefetch_wasted'] == 1
+    # 过期后再次提交会重新执行
+    queue.wait(queue.submit('德国的年假有几天')['id'], 5)
+    assert len(provider.calls) == 3
+
+
+def test_running_job_is_shared_across_processes(tmp_path, provider):
+    path = tmp_path / 'jobs.sqlite3'
+    worker = make_queue(path, provider)
+    other_provider = SlowProvider('另一个进程的答案')
+    other_provider.release()
+    # 另一个进程（worker）打开同一个数据库：租约有效的任务不会被标记为 interrupted，而是被共享
+    other = make_queue(path, other_provider)
+
+    job = worker.submit('德国的年假有几天')
+    shared = other.submit('德国的年假有几天')
+    assert shared['id'] == job['id'] and shared['status'] in ('pending', 'running')
+    assert other.snapshot()['shared'] == 1
+
+    # 任务在另一个进程中完成，wait() 轮询数据库得到结果
+    threading.Timer(0.2, provider.release).start()
+    done = other.wait(job['id'], 5)
+    assert (done['status'], done['answer']) == ('done', provider.answer)
+    assert len(provider.calls) == 1 and other_provider.calls == []
+
+
+def test_jobs_with_expired_lease_are_interrupted(tmp_path, provider):
+    path = tmp_path / 'jobs.sqlite3'
+    # 进程崩溃：任务留在 pending，没有人再续约
+    crashed = jobs.JobStore(str(path), lease_s=0.1)
+    job, created = crashed.create(jobs.job_id_for('德国的年假有几天'), '德国的年假有几天', False)
+    assert created and job['status'] == 'pending'
+    time.sleep(0.2)
+
+    restarted_provider = SlowProvider('重启后的答案')
+    restarted_provider.release()
+    restarted = make_queue(path, restarted_provider)
+    interrupted = restarted.get(job['id'])
+    assert (interrupted['status'], interrupted['error_kind']) == ('failed', 'interrupted')
+
+    # 再次提交时重新执行
+    resumed = restarted.wait(restarted.submit('德国的年假有几天')['id'], 5)
+    assert resumed['id'] == job['id']
+    assert (resumed['status'], resumed['answer']) == ('done', '重启后的答案')
+
+
+def test_running_jobs_keep_their_lease(tmp_path, provider):
+    queue = jobs.JobQueue(provider, jobs.JobStore(str(tmp_path / 'jobs.sqlite3'), lease_s=0.15),
+                          max_workers=2, max_pending=4, max_speculative=1, ttl_s=600, name='test-jobs')
+    job = queue.submit('德国的年假有几天')
+
+    # 执行时间超过租约时长，续约使任务保持进行中
+    time.sleep(0.5)
+    assert queue.get(job['id'])['status'] == 'running'
+    provider.release()
+    assert queue.wait(job['id'], 5)['status'] == 'done'
+
+
+def test_full_queue_raises_job_queue_full(tmp_path, provider):
+    queue = make_queue(tmp_path / 'jobs.sqlite3', provider, max_pending=1)
+    queue.submit('德国的年假有几天')
+
+    with pytest.raises(jobs.JobQueueFull):
+        queue.submit('法国的年假有几天')
+    assert queue.snapshot()['rejected'] == 1
+
+
+@pytest.fixture
+def api(tmp_path, provider, monkeypatch):
+    """/api/deepseek 接口使用慢速假服务的任务队列"""
+    monkeypatch.setenv('DEEPSEEK_API_KEY', 'fake')
+    monkeypatch.setattr(qa, 'SSE_HEARTBEAT_S', 0.05)
+    queue = make_queue(tmp_path / 'jobs.sqlite3', provider, max_pending=1)
+    monkeypatch.setattr(qa, 'deepseek_jobs', queue)
+    return qa.app.test_client()
+
+
+def test_full_queue_returns_503_with_retry_after(api):
+    assert api.post('/api/deepseek/jobs', json={'question': '德国的年假有几天'}).status_code == 202
+
+    response = api.post('/api/deepseek/jobs', json={'question': '法国的年假有几天'})
+
+    assert response.status_code == 503
+    assert response.get_json()['overloaded'] is True
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_event_stream_ends_with_final_state(api, provider):
+    created = api.post('/api/deepseek/jobs', json={'question': '德国的年假有几天'}).get_json()
+    threading.Timer(0.2, provider.release).start()
+
+    response = api.get(created['events'])
+    events = [block for block in response.get_data(as_text=True).split('\n\n') if block]
+
+    assert response.mimetype == 'text/event-stream'
+    assert events[0].startswith('event: status\n')
+    name, data = events[-1].split('\n')
+    assert name == 'event: done'
+    assert json.loads(data[len('data: '):]) == {
+        'job_id': created['job_id'], 'status': 'done', 'answer': provider.answer, 'source': 'deepseek_search'}
+
+
+def test_job_searches_raw_question_and_shares_normalized_variants(api, provider):
+    provider.release()
+    created = api.post('/api/deepseek/jobs', json={'question': 'What is the minimum wage in Germany?'}).get_json()
+    shared = api.post('/api/deepseek/jobs', json={'question': 'what is the minimum wage in germany'}).get_json()
+
+    assert shared['job_id'] == created['job_id']
+    assert provider.calls == [('What is the minimum wage in Germany?', False)]
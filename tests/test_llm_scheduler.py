@@ -0,0 +1,133 @@
+import time
+
+import pytest
+
+import context_packing
+import fake_llm_provider
+import llm_scheduler
+
+PROMPT = '用工' * 50
+MAX_TOKENS = 100
+EST_TOKENS = context_packing.estimate_tokens(PROMPT) + MAX_TOKENS
+
+
+@pytest.fixture
+def provider():
+    """假服务（RPM 600 / TPM 60000），返回 /chat/completions 的 URL"""
+    server = fake_llm_provider.serve(rpm=600, tpm=60000, latency_s=0.01)
+    yield f'http://127.0.0.1:{server.server_address[1]}/chat/completions'
+    server.shutdown()
+
+
+class Recorder:
+    """经假服务调用，记录每次发送的时间与返回的状态码"""
+
+    def __init__(self, url, max_tokens=MAX_TOKENS):
+        self.url = url
+        self.max_tokens = max_tokens
+        self.sent = []  # (time.monotonic(), 状态码, 响应头)
+
+    def __call__(self):
+        sent_at = time.monotonic()
+        try:
+            data, headers, tokens = fake_llm_provider._post(self.url, PROMPT, self.max_tokens)
+        except fake_llm_provider.UpstreamError as e:
+            self.sent.append((sent_at, e.status_code, e.response.headers))
+            raise
+        self.sent.append((sent_at, 200, headers))
+        return data, headers, tokens
+
+
+def drain_upstream(url):
+    """直接（不经调度器）发送一个用完假服务全部 TPM 的请求"""
+    fake_llm_provider._post(url, '', 60000 - 1)
+
+
+def test_upstream_429_waits_for_retry_after_then_retries(provider):
+    drain_upstream(provider)
+    scheduler = llm_scheduler.LLMScheduler(limits={'fake': (600, 10 ** 7)})
+    recorder = Recorder(provider)
+
+    data = scheduler.call('fake', recorder, EST_TOKENS, time.monotonic() + 10)
+
+    assert data['choices']
+    assert [status for _, status, _ in recorder.sent] == [429, 200]
+    retry_after = llm_scheduler.parse_retry_after(recorder.sent[0][2])
+    assert retry_after > 0
+    assert recorder.sent[1][0] - recorder.sent[0][0] >= retry_after
+    stats = scheduler.snapshot()['fake']
+    assert (stats['upstream_429'], stats['retries']) == (1, 1)
+
+
+@pytest.mark.parametrize('bucket, capacity, amount', [('requests', 600, 1), ('tokens', 60000, EST_TOKENS)])
+def test_exhausted_budget_queues_requests_instead_of_sending(provider, bucket, capacity, amount):
+    scheduler = llm_scheduler.LLMScheduler(limits={'fake': (600, 60000)})
+    limiter = scheduler.limiter('fake')
+    limiter.buckets[bucket].take(capacity)
+    refill_s = amount / limiter.buckets[bucket].rate
+    recorder = Recorder(provider)
+
+    started = time.monotonic()
+    for _ in range(3):
+        scheduler.call('fake', recorder, EST_TOKENS, started + 10)
+
+    assert [status for _, status, _ in recorder.sent] == [200, 200, 200]
+    # 每个请求都等到桶里补充出足够的余量才发送
+    assert recorder.sent[0][0] - started >= refill_s * 0.9
+    assert recorder.sent[2][0] - started >= 3 * refill_s * 0.9
+    stats = scheduler.snapshot()['fake']
+    assert (stats['queued'], stats['upstream_429']) == (3, 0)
+
+
+def test_rate_limited_when_budget_cannot_arrive_before_deadline(provider):
+    scheduler = llm_scheduler.LLMScheduler(limits={'fake': (600, 60000)})
+    scheduler.limiter('fake').buckets['tokens'].take(60000)
+    recorder = Recorder(provider)
+
+    with pytest.raises(llm_scheduler.RateLimited) as raised:
+        scheduler.call('fake', recorder, EST_TOKENS, time.monotonic() + 0.05)
+
+    assert raised.value.provider == 'fake'
+    assert recorder.sent == []
+    assert scheduler.snapshot()['fake']['rejected'] == 1
+
+
+def test_rate_limited_when_retry_after_passes_deadline(provider):
+    drain_upstream(provider)
+    scheduler = llm_scheduler.LLMScheduler(limits={'fake': (600, 10 ** 7)})
+    # 请求的 token 数较大，假服务给出的 retry-after 约 3 秒
+    recorder = Recorder(provider, max_tokens=3000)
+
+    started = time.monotonic()
+    with pytest.raises(llm_scheduler.RateLimited):
+        scheduler.call('fake', recorder, EST_TOKENS, started + 1)
+
+    assert [status for _, status, _ in recorder.sent] == [429]
+    assert time.monotonic() - started < 1
+
+
+def test_failed_call_refunds_reserved_tokens(provider):
+    scheduler = llm_scheduler.LLMScheduler(limits={'fake': (600, 60000)})
+    tokens = scheduler.limiter('fake').buckets['tokens']
+    tokens.take(30000)
+    before = tokens.level
+    recorder = Recorder(provider.replace('/chat/completions', '/missing'))
+
+    with pytest.raises(fake_llm_provider.UpstreamError):
+        scheduler.call('fake', recorder, 5000, time.monotonic() + 10)
+
+    assert [status for _, status, _ in recorder.sent] == [404]
+    tokens._refill(time.monotonic())
+    assert before <= tokens.level < before + 5000
+
+
+def test_settle_refunds_unused_and_charges_extra_tokens():
+    limiter = llm_scheduler.ProviderLimiter('fake', 600, 60000)
+    tokens = limiter.buckets['tokens']
+    limiter.reserve(5000, time.monotonic() + 1)
+    reserved = tokens.level
+
+    limiter.settle(5000, 3000)
+    assert tokens.level == pytest.approx(reserved + 2000, abs=50)
+    limiter.settle(1000, 4000)
+    assert tokens.level == pytest.approx(reserved - 1000, abs=50)
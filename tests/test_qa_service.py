@@ -0,0 +1,69 @@
+import pytest
+
+import qa_service_redesign as qa
+
+CONTEXTS = [{'id': '德国_1', 'text': '德国的法定最低工资为每小时12.41欧元。', 'country': '德国',
+             'source': '德国用工指南', 'url': ''}]
+
+
+def test_prompt_uses_raw_question(monkeypatch):
+    prompts = []
+    real_build = qa.build_answer_prompt
+    monkeypatch.setattr(qa, 'build_answer_prompt', lambda *args, **kwargs: prompts.append(
+        real_build(*args, **kwargs)) or prompts[-1])
+
+    qa.generate_answer_with_usage('What is the minimum wage in Germany?', CONTEXTS, extractive=True)
+
+    assert '用户问题：What is the minimum wage in Germany?' in prompts[0]['question']
+
+
+def test_provider_error_answer_is_not_cacheable(monkeypatch):
+    def failing_provider(*args, **kwargs):
+        raise RuntimeError('upstream 500')
+
+    monkeypatch.setenv('DEEPSEEK_API_KEY', 'fake')
+    monkeypatch.setattr(qa, 'collection', object())
+    monkeypatch.setattr(qa, 'query_knowledge_base_with_status', lambda *args, **kwargs: {
+        'contexts': CONTEXTS, 'status': 'found', 'country': '德国'})
+    monkeypatch.setattr(qa, '_call_provider', failing_provider)
+    recorded = []
+    monkeypatch.setattr(qa.answer_deps, 'record', lambda *args, **kwargs: recorded.append(args))
+
+    response = qa.app.test_client().get('/api/ask', query_string={'q': '德国最低工资的计算方式'})
+
+    assert response.status_code == 200
+    assert response.get_json()['provider_error'] is True
+    assert response.headers['Cache-Control'] == 'no-store'
+    assert 'ETag' not in response.headers
+    assert recorded == []
+
+
+class FakeCollection:
+    def get(self, ids):
+        return {'ids': ids, 'documents': [CONTEXTS[0]['text']], 'metadatas': [{'country': '德国'}]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    for _, key in qa.PROVIDER_KEYS:
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setattr(qa, 'collection', FakeCollection())
+    monkeypatch.setattr(qa, 'query_knowledge_base_with_status', lambda *args, **kwargs: {
+        'contexts': CONTEXTS, 'status': 'found', 'country': '德国'})
+    return qa.app.test_client()
+
+
+@pytest.mark.parametrize('url', ['/api/ask?q=德国最低工资的计算方式', '/api/chunk/德国_1'])
+@pytest.mark.parametrize('accept_encoding', ['gzip', 'identity'])
+def test_not_modified_repeats_validators_of_full_response(client, url, accept_encoding):
+    full = client.get(url, headers={'Accept-Encoding': accept_encoding})
+    assert full.status_code == 200
+
+    revalidated = client.get(url, headers={'Accept-Encoding': accept_encoding,
+                                           'If-None-Match': full.headers['ETag']})
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == full.headers['ETag']
+    assert full.headers['ETag'].endswith('-gzip"') == (accept_encoding == 'gzip')
+    assert 'Accept-Encoding' in revalidated.headers['Vary']
+    assert 'Accept-Encoding' in full.headers['Vary']
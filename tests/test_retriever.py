@@ -0,0 +1,97 @@
+import pytest
+
+import retriever
+import shared_cache
+
+
+@pytest.mark.parametrize('question, expected', [
+    ('what are the three rules in germany', []),
+    ('德国hr政策', ['HR', '人力资源']),
+    ('HR policies in UK', ['HR', '人力资源']),
+    ('德国probationary period多久', ['试用期']),
+    ('德国的试用期多久', ['试用期']),
+])
+def test_extract_hr_terms_matches_english_triggers_on_word_boundaries(question, expected):
+    assert retriever.extract_hr_terms(retriever.normalize_question(question)) == expected
+
+
+class FakeCollection:
+    """内存中的 Chroma 集合：get 按 ID / 国家过滤，query 按段落顺序返回（不计算向量），记录调用次数"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks  # [(ID, 文本, 元数据)]
+        self.calls = 0
+
+    def _docs(self, ids=None, where=None, limit=None):
+        chunks = [c for c in self.chunks if (ids is None or c[0] in ids)
+                  and (where is None or c[2]['country'] == where['country'])][:limit]
+        return {'ids': [c[0] for c in chunks], 'documents': [c[1] for c in chunks],
+                'metadatas': [c[2] for c in chunks]}
+
+    def get(self, ids=None, where=None, limit=None):
+        self.calls += 1
+        return self._docs(ids, where, limit)
+
+    def query(self, query_texts, n_results, where=None):
+        self.calls += 1
+        return {name: [values] for name, values in self._docs(where=where, limit=n_results).items()}
+
+
+CHUNKS = [
+    (f'德国_{i}', f'德国的试用期最长{i + 1}个月，试用期内可以解除劳动合同。', {'country': '德国', 'title': '德国用工指南'})
+    for i in range(4)
+]
+
+
+def make_retriever(mode='lexical', duplicate_clusters=None, cache=None, **config):
+    cache = cache or shared_cache.SharedCache(shared_cache.MemoryBackend()).namespace('retrieval')
+    collection = FakeCollection(CHUNKS)
+    return retriever.Retriever(collection, retriever.RetrieverConfig(mode=mode, **config),
+                               duplicate_clusters=duplicate_clusters, cache=cache, version='v1')
+
+
+def test_differently_worded_questions_share_a_cached_result():
+    r = make_retriever()
+    first = r.retrieve('德国的试用期有多长？')
+    calls = r.collection.calls
+
+    second = r.retrieve('德国试用期多长')
+
+    assert first['status'] == 'found' and second.get('cached') is True
+    assert [ctx['id'] for ctx in second['contexts']] == [ctx['id'] for ctx in first['contexts']]
+    assert r.collection.calls == calls
+
+
+@pytest.mark.parametrize('mode, question, rephrased', [
+    ('lexical', '试用期有多长', '试用期多长'),           # 未指定国家：向量检索
+    ('hybrid', '德国的试用期有多长？', '德国试用期多长'),  # hybrid：向量分支
+])
+def test_question_dependent_results_only_hit_for_the_same_question(mode, question, rephrased):
+    # 假集合只有 4 个段落，向量结果的排名得分较低
+    r = make_retriever(mode, score_threshold=5)
+    assert r.retrieve(question)['status'] == 'found'
+
+    assert r.retrieve(question).get('cached') is True
+    assert 'cached' not in r.retrieve(rephrased)
+
+
+def test_vector_supplement_makes_the_result_question_dependent():
+    # 关键词只命中一个段落，不足 top_k 时用向量结果补充
+    r = make_retriever(duplicate_clusters={f'德国_{i}': '德国_0' for i in range(4)})
+    assert 'supplement' in r.retrieve('德国的试用期有多长？')['timings']
+
+    assert 'cached' not in r.retrieve('德国试用期多长')
+
+
+@pytest.mark.parametrize('changed', [
+    {'duplicate_clusters': {'德国_1': '德国_0'}},
+    {'relevance_threshold': 5},
+    {'candidate_pool': 30},
+    {'comparison_top_k': 3},
+])
+def test_config_and_cluster_changes_do_not_reuse_cached_results(changed):
+    cache = shared_cache.SharedCache(shared_cache.MemoryBackend()).namespace('retrieval')
+    make_retriever(cache=cache).retrieve('德国的试用期有多长？')
+
+    assert make_retriever(cache=cache).retrieve('德国的试用期有多长？').get('cached') is True
+    assert 'cached' not in make_retriever(cache=cache, **changed).retrieve('德国的试用期有多长？')
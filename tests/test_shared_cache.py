@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+import shared_cache
+
+TTL_S = 0.3
+MAX_ENTRIES = 10
+
+
+@pytest.fixture
+def ns(cache_backend):
+    return shared_cache.SharedCache(cache_backend, {'test': (TTL_S, MAX_ENTRIES)}).namespace('test')
+
+
+def test_round_trip_and_miss(ns):
+    value = {'answer': '英国的法定年假为 28 天', 'ids': ['uk_0', 'uk_3'], 'score': 0.5}
+    ns.set(value, 'q', 1)
+
+    assert ns.get('q', 1) == value
+    assert ns.get('q', 2) is None
+    assert (ns.snapshot()['hits'], ns.snapshot()['misses']) == (1, 1)
+
+
+def test_entries_expire_after_ttl(ns):
+    ns.set('20个工作日', 'q', 1)
+    time.sleep(TTL_S + 0.1)
+
+    assert ns.get('q', 1) is None
+
+
+def test_eviction_keeps_size_bounded(ns, cache_backend):
+    for i in range(shared_cache._TRIM_EVERY + 20):
+        ns.set(i, 'n', i)
+
+    assert cache_backend.size('test') <= MAX_ENTRIES + shared_cache._TRIM_EVERY
+    # 最近写入的条目不会被淘汰
+    assert ns.get('n', shared_cache._TRIM_EVERY + 19) == shared_cache._TRIM_EVERY + 19
+
+
+def test_concurrent_increments_are_atomic(ns):
+    counter = shared_cache.make_key('counter')
+
+    def bump():
+        for _ in range(25):
+            ns.incr_key(counter)
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert ns.get_key(counter) == 100
+
+
+def test_expired_counter_restarts_from_zero(ns):
+    counter = shared_cache.make_key('counter')
+    assert [ns.incr_key(counter) for _ in range(3)] == [1, 2, 3]
+    time.sleep(TTL_S + 0.1)
+
+    assert ns.incr_key(counter) == 1
+
+
+def test_missed_entries_do_not_count_toward_size(ns, cache_backend):
+    ns.set('20个工作日', 'q', 1)
+    ns.set('6个月', 'q', 2)
+    time.sleep(TTL_S + 0.1)
+    ns.set('28天', 'q', 3)
+
+    # 已过期的条目被读取（未命中）后不再占用条目上限
+    assert ns.get('q', 1) is None and ns.get('q', 2) is None
+    assert cache_backend.size('test') == 1